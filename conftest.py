@@ -11,10 +11,6 @@ def pytest_generate_tests(metafunc):
 
 
 collect_ignore = ["setup.py"]
-try:
-    import numba  # noqa: F401
-except ModuleNotFoundError:
-    collect_ignore.append("speechbrain/nnet/loss/transducer_loss.py")
 try:
     import fairseq  # noqa: F401
 except ModuleNotFoundError:
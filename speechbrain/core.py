@@ -35,8 +35,10 @@ from torch.nn.parallel import DistributedDataParallel as DDP
 from hyperpyyaml import resolve_references
 from speechbrain.utils.distributed import run_on_main
 from speechbrain.dataio.dataloader import LoopedLoader
+from speechbrain.dataio.dataloader import DevicePrefetcher
 from speechbrain.dataio.dataloader import SaveableDataLoader
 from speechbrain.dataio.sampler import DistributedSamplerWrapper
+from speechbrain.dataio.shards import ShardedDynamicItemDataset
 from speechbrain.dataio.sampler import ReproducibleRandomSampler
 
 logger = logging.getLogger(__name__)
@@ -259,6 +261,19 @@ def parse_arguments(arg_list=None):
         help="Amount of time between saving intra-epoch checkpoints "
         "in minutes. If non-positive, intra-epoch checkpoints are not saved.",
     )
+    parser.add_argument(
+        "--prefetch_batches",
+        type=int,
+        help="Number of training batches to move to the device ahead of "
+        "time, while the current batch is processed. 0 disables prefetching.",
+    )
+    parser.add_argument(
+        "--sync_interval",
+        type=int,
+        help="Number of training steps between host synchronizations of the "
+        "running loss. If larger than 1, losses and non-finite checks are "
+        "accumulated on the device in between.",
+    )
     parser.add_argument(
         "--grad_accumulation_factor",
         type=int,
@@ -406,6 +421,19 @@ class Brain:
         ckpt_interval_minutes (float)
             Amount of time between saving intra-epoch checkpoints,
             in minutes, default: ``15.0``. If non-positive, these are not saved.
+        prefetch_batches (int)
+            Number of training batches to move to the device ahead of time,
+            on a side CUDA stream (or in a background thread on CPU), while
+            the current batch is processed. Default: ``0`` (disabled).
+        sync_interval (int)
+            Number of training steps between host synchronizations. With
+            values larger than ``1``, the running loss and the count of
+            non-finite losses are accumulated on the device and only read
+            (e.g. for the progressbar and the patience check) every this many
+            steps and at the end of the stage. The optimizer step of a batch
+            with a non-finite loss is then undone on the device instead of
+            skipped, which needs a copy of the parameters and optimizer
+            state at each step. Default: ``1``.
 
         Typically in a script this comes from ``speechbrain.parse_args``, which
         has different defaults than Brain. If an option is not defined here
@@ -460,6 +488,8 @@ class Brain:
             "nonfinite_patience": 3,
             "noprogressbar": False,
             "ckpt_interval_minutes": 0,
+            "prefetch_batches": 0,
+            "sync_interval": 1,
             "grad_accumulation_factor": 1,
             "optimizer_step_limit": None,
             "tqdm_colored_bar": False,
@@ -594,6 +624,9 @@ class Brain:
         self.avg_train_loss = 0.0
         self.step = 0
         self.optimizer_step = 0
+        self.nonfinite_count = 0
+        self._nonfinite_steps = None
+        self._step_finite = None
 
         # Add this class to the checkpointer for intra-epoch checkpoints
         if self.checkpointer is not None:
@@ -798,7 +831,11 @@ class Brain:
                     shuffle=shuffle_ddp,
                 )
                 loader_kwargs["batch_sampler"] = self.train_sampler
-        elif self.distributed_launch and isinstance(dataset, IterableDataset):
+        elif (
+            self.distributed_launch
+            and isinstance(dataset, IterableDataset)
+            and not isinstance(dataset, ShardedDynamicItemDataset)
+        ):
             logger.warning(
                 "Cannot automatically solve distributed sampling "
                 "for IterableDataset."
@@ -899,6 +936,7 @@ class Brain:
         Returns
         -------
         detached loss
+            On the cpu, or on the device if ``sync_interval > 1``.
         """
         should_step = self.step % self.grad_accumulation_factor == 0
         # Managing automatic mixed precision
@@ -913,7 +951,9 @@ class Brain:
             if should_step:
                 self.scaler.unscale_(self.optimizer)
                 if self.check_gradients(loss):
-                    self.scaler.step(self.optimizer)
+                    self._optimizer_step(
+                        lambda: self.scaler.step(self.optimizer)
+                    )
                 self.scaler.update()
                 self.zero_grad()
                 self.optimizer_step += 1
@@ -924,11 +964,13 @@ class Brain:
                 (loss / self.grad_accumulation_factor).backward()
             if should_step:
                 if self.check_gradients(loss):
-                    self.optimizer.step()
+                    self._optimizer_step(self.optimizer.step)
                 self.zero_grad()
                 self.optimizer_step += 1
 
         self.on_fit_batch_end(batch, outputs, loss, should_step)
+        if self.sync_interval > 1:
+            return loss.detach()
         return loss.detach().cpu()
 
     def on_fit_batch_end(self, batch, outputs, loss, should_step):
@@ -964,6 +1006,9 @@ class Brain:
         bool
             Whether or not the optimizer step should be carried out.
         """
+        if self.sync_interval > 1:
+            return self._check_gradients_on_device(loss)
+
         if not torch.isfinite(loss):
             self.nonfinite_count += 1
 
@@ -974,16 +1019,9 @@ class Brain:
                     logger.warn("Parameter is not finite: " + str(p))
 
             # Check if patience is exhausted
-            if self.nonfinite_count > self.nonfinite_patience:
-                raise ValueError(
-                    "Loss is not finite and patience is exhausted. "
-                    "To debug, wrap `fit()` with "
-                    "autograd's `detect_anomaly()`, e.g.\n\nwith "
-                    "torch.autograd.detect_anomaly():\n\tbrain.fit(...)"
-                )
-            else:
-                logger.warn("Patience not yet exhausted, ignoring this batch.")
-                return False
+            self._check_nonfinite_patience()
+            logger.warn("Patience not yet exhausted, ignoring this batch.")
+            return False
 
         # Clip gradient norm
         if self.max_grad_norm > 0.0:
@@ -993,6 +1031,133 @@ class Brain:
 
         return True
 
+    def _check_gradients_on_device(self, loss):
+        """Version of ``check_gradients`` without host synchronization.
+
+        Instead of skipping the optimizer step, the gradients of a batch with
+        a non-finite loss (or gradient norm) are zeroed, and the step is
+        undone by ``_optimizer_step``. The non-finite batches are counted on
+        the device, and the patience is checked in ``_sync_train_stats``.
+        """
+        finite = torch.isfinite(loss.detach())
+        parameters = [
+            p for p in self.modules.parameters() if p.grad is not None
+        ]
+        if self.max_grad_norm > 0.0:
+            norm = torch.nn.utils.clip_grad_norm_(
+                parameters, self.max_grad_norm
+            )
+            finite = finite & torch.isfinite(norm).to(finite.device)
+        nonfinite = ~finite
+        for p in parameters:
+            p.grad.masked_fill_(nonfinite.to(p.grad.device), 0.0)
+
+        if self._nonfinite_steps is None:
+            self._nonfinite_steps = torch.zeros(
+                (), dtype=torch.long, device=nonfinite.device
+            )
+        self._nonfinite_steps += nonfinite
+        self._step_finite = finite
+        return True
+
+    def _optimizer_step(self, step):
+        """Runs the optimizer step. With ``sync_interval > 1``, the step of
+        a batch found non-finite by ``_check_gradients_on_device`` is undone:
+        the parameters and the optimizer state (e.g. the moments and step
+        count of Adam, which change even with zero gradients) are saved
+        before the step and restored with ``torch.where``.
+
+        Optimizer state which cannot be restored on the device (created by
+        this step, not a tensor, or on another device, such as the step
+        count of Adam without ``capturable=True``) is restored after reading
+        the flag on the host, i.e. with a synchronization.
+
+        Arguments
+        ---------
+        step : callable
+            Runs the optimizer step, e.g. ``self.optimizer.step``.
+        """
+        finite, self._step_finite = self._step_finite, None
+        if self.sync_interval <= 1 or finite is None:
+            step()
+            return
+
+        params = [
+            p
+            for group in self.optimizer.param_groups
+            for p in group["params"]
+            if p.grad is not None
+        ]
+        saved_params = [p.detach().clone() for p in params]
+        saved_states = [
+            {
+                key: value.clone() if torch.is_tensor(value) else value
+                for key, value in self.optimizer.state[p].items()
+            }
+            if p in self.optimizer.state
+            else None
+            for p in params
+        ]
+        step()
+
+        restore_on_host = []
+        with torch.no_grad():
+            for p, saved_p, saved in zip(params, saved_params, saved_states):
+                p.copy_(torch.where(finite.to(p.device), p, saved_p))
+                state = self.optimizer.state.get(p)
+                if not state:
+                    continue
+                for key, value in state.items():
+                    old = None if saved is None else saved.get(key)
+                    if (
+                        torch.is_tensor(value)
+                        and torch.is_tensor(old)
+                        and value.device == finite.device
+                    ):
+                        value.copy_(torch.where(finite, value, old))
+                    elif torch.is_tensor(value) or value != old:
+                        restore_on_host.append((p, saved))
+                        break
+
+        if restore_on_host and not finite.item():
+            for p, saved in restore_on_host:
+                if saved is None:
+                    del self.optimizer.state[p]
+                else:
+                    self.optimizer.state[p] = saved
+
+    def _check_nonfinite_patience(self):
+        """Raises an error if there were too many non-finite losses."""
+        if self.nonfinite_count > self.nonfinite_patience:
+            raise ValueError(
+                "Loss is not finite and patience is exhausted. "
+                "To debug, wrap `fit()` with "
+                "autograd's `detect_anomaly()`, e.g.\n\nwith "
+                "torch.autograd.detect_anomaly():\n\tbrain.fit(...)"
+            )
+
+    def _sync_train_stats(self, avg_loss):
+        """Reads the statistics accumulated on the device when
+        ``sync_interval > 1``.
+
+        Arguments
+        ---------
+        avg_loss : torch.Tensor, None
+            The running average of the training loss, on the device.
+        """
+        if avg_loss is not None:
+            self.avg_train_loss = avg_loss.item()
+        if self._nonfinite_steps is not None:
+            count = int(self._nonfinite_steps)
+            self._nonfinite_steps.zero_()
+            if count > 0:
+                self.nonfinite_count += count
+                logger.warn(
+                    f"{count} batch(es) with non-finite loss since the last "
+                    "sync, their gradients were zeroed."
+                )
+                self._check_nonfinite_patience()
+
     def evaluate_batch(self, batch, stage):
         """Evaluate one batch, override for different procedure than train.
 
@@ -1027,11 +1192,24 @@ class Brain:
 
         # Reset nonfinite count to 0 each epoch
         self.nonfinite_count = 0
+        self._nonfinite_steps = None
+        # Running average of the loss on the device, if sync_interval > 1
+        avg_loss = None
 
         if self.train_sampler is not None and hasattr(
             self.train_sampler, "set_epoch"
         ):
             self.train_sampler.set_epoch(epoch)
+        # Shards are shuffled (and split) in the dataset itself.
+        loader = getattr(train_set, "loader", train_set)
+        dataset = getattr(loader, "dataset", None)
+        if isinstance(dataset, ShardedDynamicItemDataset):
+            dataset.set_epoch(epoch)
+
+        if self.prefetch_batches > 0:
+            train_set = DevicePrefetcher(
+                train_set, self.device, self.prefetch_batches
+            )
 
         # Time since last intra-epoch checkpoint
         last_ckpt_time = time.time()
@@ -1048,10 +1226,20 @@ class Brain:
                     break
                 self.step += 1
                 loss = self.fit_batch(batch)
-                self.avg_train_loss = self.update_average(
-                    loss, self.avg_train_loss
-                )
-                t.set_postfix(train_loss=self.avg_train_loss)
+                if self.sync_interval > 1:
+                    if avg_loss is None:
+                        avg_loss = torch.tensor(
+                            self.avg_train_loss, device=loss.device
+                        )
+                    avg_loss = self.update_average(loss, avg_loss)
+                    if self.step % self.sync_interval == 0:
+                        self._sync_train_stats(avg_loss)
+                        t.set_postfix(train_loss=self.avg_train_loss)
+                else:
+                    self.avg_train_loss = self.update_average(
+                        loss, self.avg_train_loss
+                    )
+                    t.set_postfix(train_loss=self.avg_train_loss)
 
                 # Profile only if desired (steps allow the profiler to know when all is warmed up)
                 if self.profiler is not None:
@@ -1074,10 +1262,13 @@ class Brain:
                     # time.time() - last_ckpt_time differ and some
                     # processes enter this block while others don't,
                     # missing the barrier.
+                    self._sync_train_stats(avg_loss)
                     if sb.utils.distributed.if_main_process():
                         self._save_intra_epoch_ckpt()
                     last_ckpt_time = time.time()
 
+        self._sync_train_stats(avg_loss)
+
         # Run train "on_stage_end" on all processes
         self.zero_grad(set_to_none=True)  # flush gradients
         self.on_stage_end(Stage.TRAIN, self.avg_train_loss, epoch)
@@ -1205,6 +1396,10 @@ class Brain:
             ):
                 break
 
+        # Make sure that asynchronously saved checkpoints are written
+        if self.checkpointer is not None:
+            self.checkpointer.wait()
+
     @property
     def _optimizer_step_limit_exceeded(self):
         return (
@@ -1342,18 +1537,28 @@ class Brain:
     def update_average(self, loss, avg_loss):
         """Update running average of the loss.
 
+        If ``avg_loss`` is a tensor, the update is done on its device without
+        a host synchronization, and a tensor is returned.
+
         Arguments
         ---------
         loss : torch.tensor
             detached loss, a single float value.
-        avg_loss : float
+        avg_loss : float, torch.tensor
             current running average.
 
         Returns
         -------
-        avg_loss : float
+        avg_loss : float, torch.tensor
             The average loss.
         """
+        if isinstance(avg_loss, torch.Tensor):
+            loss = loss.to(avg_loss.device, avg_loss.dtype)
+            return torch.where(
+                torch.isfinite(loss),
+                avg_loss + (loss - avg_loss) / self.step,
+                avg_loss,
+            )
         if torch.isfinite(loss):
             avg_loss -= avg_loss / self.step
             avg_loss += float(loss) / self.step
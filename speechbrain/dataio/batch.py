@@ -4,10 +4,12 @@ Authors
   * Aku Rouhe 2020
 """
 import collections
+import threading
 import torch
 from speechbrain.utils.data_utils import mod_default_collate
 from speechbrain.utils.data_utils import recursive_to
 from speechbrain.utils.data_utils import batch_pad_right
+from torch.utils.data import get_worker_info
 from torch.utils.data._utils.collate import default_convert
 from torch.utils.data._utils.pin_memory import (
     pin_memory as recursive_pin_memory,
@@ -16,6 +18,10 @@ from torch.utils.data._utils.pin_memory import (
 
 PaddedData = collections.namedtuple("PaddedData", ["data", "lengths"])
 
+# Buffer pools by name, so that a pool is the same object after pickling
+# (e.g. a batch collated in a DataLoader worker, pinned in the main process)
+_buffer_pools = {}
+
 
 class PaddedBatch:
     """Collate_fn when examples are dicts and have variable-length sequences.
@@ -48,6 +54,12 @@ class PaddedBatch:
         Whether to apply PyTorch-default_collate-like stacking on values that
         didn't get padded. This stacks if it can, but doesn't error out if it
         cannot. Default:True, usually does the right thing.
+    buffer_pool : PinnedBufferPool
+        (Optional) With the default padding_func, the padded keys are written
+        directly into (pinned) buffers from this pool, when collating in the
+        main process. Batches collated in DataLoader workers are copied into
+        pool buffers by pin_memory() instead. The buffers go back to the pool
+        when the batch is moved to another device (non-blocking by default).
 
     Example
     -------
@@ -107,11 +119,21 @@ class PaddedBatch:
         padding_kwargs={},
         apply_default_convert=True,
         nonpadded_stack=True,
+        buffer_pool=None,
     ):
         self.__length = len(examples)
         self.__keys = list(examples[0].keys())
         self.__padded_keys = []
         self.__device_prep_keys = []
+        self.__buffer_pool = buffer_pool
+        self.__pool_buffers = {}
+        # Pinned buffers are only useful in the main process
+        pad_into_pool = (
+            buffer_pool is not None
+            and padding_func is batch_pad_right
+            and padding_kwargs.get("mode", "constant") == "constant"
+            and get_worker_info() is None
+        )
         for key in self.__keys:
             values = [example[key] for example in examples]
             # Default convert usually does the right thing (numpy2torch etc.)
@@ -122,7 +144,16 @@ class PaddedBatch:
             ):
                 # Padding and PaddedData
                 self.__padded_keys.append(key)
-                padded = PaddedData(*padding_func(values, **padding_kwargs))
+                if pad_into_pool:
+                    padded = PaddedData(
+                        *padding_func(
+                            values,
+                            out=self.__buffer_getter(key),
+                            **padding_kwargs,
+                        )
+                    )
+                else:
+                    padded = PaddedData(*padding_func(values, **padding_kwargs))
                 setattr(self, key, padded)
             else:
                 # Default PyTorch collate usually does the right thing
@@ -162,7 +193,21 @@ class PaddedBatch:
         """In-place, moves relevant elements to pinned memory."""
         for key in self.__device_prep_keys:
             value = getattr(self, key)
-            pinned = recursive_pin_memory(value)
+            if (
+                self.__buffer_pool is not None
+                and key in self.__padded_keys
+                and key not in self.__pool_buffers
+            ):
+                data = self.__buffer_getter(key)(
+                    value.data.shape, value.data.dtype
+                )
+                data.copy_(value.data)
+                lengths = value.lengths
+                if self.__buffer_pool.pin_memory:
+                    lengths = lengths.pin_memory()
+                pinned = PaddedData(data, lengths)
+            else:
+                pinned = recursive_pin_memory(value)
             setattr(self, key, pinned)
         return self
 
@@ -170,13 +215,32 @@ class PaddedBatch:
         """In-place move/cast relevant elements.
 
         Passes all arguments to torch.Tensor.to, see its documentation.
+        With a buffer_pool, the copies are non-blocking by default, and the
+        buffers of the moved elements are given back to the pool.
         """
+        if self.__pool_buffers and "non_blocking" not in kwargs:
+            kwargs["non_blocking"] = True
         for key in self.__device_prep_keys:
             value = getattr(self, key)
             moved = recursive_to(value, *args, **kwargs)
             setattr(self, key, moved)
+            if key in self.__pool_buffers and moved.data is not value.data:
+                self.__buffer_pool.release(
+                    self.__pool_buffers.pop(key), moved.data
+                )
         return self
 
+    def __buffer_getter(self, key):
+        """Returns a function which gets a pool buffer for key."""
+
+        def get_buffer(shape, dtype):
+            """Gets a buffer of the shape, and keeps track of it."""
+            data, buffer = self.__buffer_pool.get(shape, dtype)
+            self.__pool_buffers[key] = buffer
+            return data
+
+        return get_buffer
+
     def at_position(self, pos):
         """Gets the position."""
         key = self.__keys[pos]
@@ -188,6 +252,155 @@ class PaddedBatch:
         return self.__length
 
 
+class PinnedBufferPool:
+    """A pool of reusable (pinned) host memory buffers for batches.
+
+    Allocating page-locked memory for each batch, and copying the batch into
+    it, is costly at high step rates. With a pool, PaddedBatch writes the
+    padded data directly into a buffer from the pool. When the batch is moved
+    to the device, the buffer goes back to the pool, along with a CUDA event
+    which marks the end of the (non-blocking) copy. A buffer is only reused
+    once its copy has finished.
+
+    Pools are looked up by name, so the same pool is used after pickling
+    (e.g. in DataLoader workers and the main process). Creating a pool with
+    the name of an existing one returns the existing pool, and raises a
+    ValueError if the given arguments differ from the existing pool's.
+
+    Arguments
+    ---------
+    name : str
+        Name of the pool. Pools with the same name in a process are the same.
+    min_numel : int
+        The minimum size of the buffers, in elements, 0 by default. Set this
+        to the largest padded batch size (known e.g. from the
+        max_padded_length of a PaddingAwareBatchSampler) so that every batch
+        fits in any buffer.
+    max_buffers : int
+        The maximum number of free buffers to keep, 8 by default.
+    pin_memory : bool
+        Whether to allocate pinned memory, by default if CUDA is available.
+
+    Example
+    -------
+    >>> from functools import partial
+    >>> pool = PinnedBufferPool("example", pin_memory=False)
+    >>> collate_fn = partial(PaddedBatch, buffer_pool=pool)
+    >>> batch = collate_fn([{"wav": torch.ones(2)}, {"wav": torch.ones(3)}])
+    >>> batch.wav.data
+    tensor([[1., 1., 0.],
+            [1., 1., 1.]])
+    >>> _ = batch.to(dtype=torch.float16)  # the buffer goes back to the pool
+    >>> len(pool)
+    1
+    >>> PinnedBufferPool("example") is pool
+    True
+    >>> PinnedBufferPool("example", max_buffers=2)
+    Traceback (most recent call last):
+     ...
+    ValueError: PinnedBufferPool 'example' exists with max_buffers=8, not 2
+    """
+
+    def __new__(cls, name="default", *args, **kwargs):
+        if name not in _buffer_pools:
+            _buffer_pools[name] = super().__new__(cls)
+            _buffer_pools[name].initialized = False
+        return _buffer_pools[name]
+
+    def __init__(
+        self, name="default", min_numel=None, max_buffers=None, pin_memory=None
+    ):
+        arguments = {
+            "min_numel": min_numel,
+            "max_buffers": max_buffers,
+            "pin_memory": pin_memory,
+        }
+        if self.initialized:
+            for key, value in arguments.items():
+                if value is not None and value != getattr(self, key):
+                    raise ValueError(
+                        f"PinnedBufferPool {name!r} exists with "
+                        f"{key}={getattr(self, key)}, not {value}"
+                    )
+            return
+        if min_numel is None:
+            min_numel = 0
+        if max_buffers is None:
+            max_buffers = 8
+        if pin_memory is None:
+            pin_memory = torch.cuda.is_available()
+        self.name = name
+        self.min_numel = min_numel
+        self.max_buffers = max_buffers
+        self.pin_memory = pin_memory
+        self._free = []
+        self._lock = threading.Lock()
+        self.initialized = True
+
+    def __reduce__(self):
+        return (
+            PinnedBufferPool,
+            (self.name, self.min_numel, self.max_buffers, self.pin_memory),
+        )
+
+    def __len__(self):
+        return len(self._free)
+
+    def get(self, shape, dtype):
+        """Returns a tensor of the given shape which is a view of a free
+        buffer, and the buffer."""
+        numel = 1
+        for size in shape:
+            numel *= size
+        with self._lock:
+            best = None
+            for i, (buffer, event) in enumerate(self._free):
+                if (
+                    buffer.dtype == dtype
+                    and buffer.numel() >= numel
+                    and (event is None or event.query())
+                    and (
+                        best is None
+                        or buffer.numel() < self._free[best][0].numel()
+                    )
+                ):
+                    best = i
+            if best is not None:
+                buffer, _ = self._free.pop(best)
+            else:
+                buffer = torch.empty(
+                    max(numel, self.min_numel),
+                    dtype=dtype,
+                    pin_memory=self.pin_memory,
+                )
+        return buffer[:numel].view(shape), buffer
+
+    def release(self, buffer, moved=None):
+        """Gives a buffer back to the pool.
+
+        Arguments
+        ---------
+        buffer : torch.Tensor
+            A buffer from get().
+        moved : torch.Tensor
+            The result of copying the buffer contents to a device. If it is
+            on a CUDA device, the buffer is reused only after the copy.
+        """
+        event = None
+        if moved is not None and moved.is_cuda:
+            event = torch.cuda.Event()
+            event.record(torch.cuda.current_stream(moved.device))
+        with self._lock:
+            self._free.append((buffer, event))
+            if len(self._free) > self.max_buffers:
+                # Drop the smallest buffer
+                smallest = min(
+                    range(len(self._free)),
+                    key=lambda i: self._free[i][0].numel(),
+                )
+                self._free.pop(smallest)
+
+
 class BatchsizeGuesser:
     """Try to figure out the batchsize, but never error out
 
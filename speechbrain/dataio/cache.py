@@ -0,0 +1,564 @@
+"""Persistent on-disk cache for the outputs of dynamic items.
+
+Deterministic dynamic items, e.g. reading and resampling audio or computing
+features, produce the same output for a data point in every epoch. With a
+cache, their outputs are computed once and then loaded back from disk.
+
+Example
+-------
+>>> import torch
+>>> from speechbrain.dataio.dataset import DynamicItemDataset
+>>> calls = []
+>>> def compute_feats(x):
+...     calls.append(x)
+...     return torch.full((2,), float(x))
+>>> dataset = DynamicItemDataset(
+...     {"utt1": {"x": 1}, "utt2": {"x": 2}},
+...     dynamic_items=[
+...         {"func": compute_feats, "takes": "x", "provides": "feats"}
+...     ],
+...     output_keys=["id", "feats"],
+... )
+>>> dataset.cache_dynamic_items(["feats"], getfixture("tmpdir"))
+>>> for epoch in range(2):
+...     for data_point in dataset:
+...         pass
+>>> data_point
+{'id': 'utt2', 'feats': tensor([2., 2.])}
+>>> calls
+[1, 2]
+"""
+import io
+import os
+import zlib
+import pickle
+import hashlib
+import inspect
+import logging
+import contextlib
+import numpy as np
+import torch
+from speechbrain.utils.data_pipeline import DynamicItem, GeneratorDynamicItem
+
+try:
+    import fcntl
+except ImportError:  # e.g. on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_SUFFIX = ".pt"
+SEGMENT_SUFFIX = ".bin"
+INDEX_SUFFIX = ".idx"
+LOCK_NAME = "lock"
+
+
+class DiskCache:
+    """A sharded, size-limited store of (pickled) tensors on disk.
+
+    The keys are split among a fixed number of shard directories. A shard
+    stores its entries in a few large append-only segment files, with an
+    index file of (offset, length, checksum, key) records next to each
+    segment, so that loading an entry is a single read at a known offset,
+    instead of opening a small file per entry. Each process keeps the
+    index in memory, and reads the records added by other processes when
+    it misses a key. Writes are serialized with a lock file per shard, so
+    the cache can be shared by the processes of a DataLoader, or by DDP
+    processes on the same filesystem (which must support flock).
+
+    If a size limit is given, the oldest segments of a shard are deleted
+    when the shard grows over its share of the limit. This approximates
+    least recently used eviction: an entry read from the oldest segments
+    (those deleted next) is appended again to the newest one.
+
+    Where file locks are not available (e.g. on Windows), or with
+    one_file_per_entry=True, each entry is saved in its own file instead,
+    with atomic writes (write to a temporary file, then rename). The least
+    recently used entries are then evicted based on the modification time
+    of the files, which is updated by a hit.
+
+    Arguments
+    ---------
+    cache_dir : str
+        The directory where the cache is stored. Created if it does not exist.
+    max_size_mb : float, None
+        Limit for the total size of the cache in megabytes (approximately).
+        None means no limit.
+    num_shards : int
+        Number of shard directories. The size limit is split evenly among
+        the shards.
+    low_water_mark : float
+        When a shard goes over its limit, the oldest segments (or least
+        recently used entries) are evicted until the shard is at this
+        fraction of its limit. This avoids having to evict after each
+        write, once the cache is full.
+    segment_size_mb : float
+        A new segment is started when the newest one is larger than this.
+        With a size limit, segments are at most the fraction of the shard
+        limit which is evicted at once.
+    one_file_per_entry : bool
+        Whether to store each entry in its own file. By default, only if
+        file locks are not available.
+
+    Example
+    -------
+    >>> cache = DiskCache(getfixture("tmpdir"), max_size_mb=10)
+    >>> "utt1-fbank" in cache
+    False
+    >>> cache["utt1-fbank"] = torch.ones(3)
+    >>> cache["utt1-fbank"]
+    tensor([1., 1., 1.])
+    """
+
+    def __init__(
+        self,
+        cache_dir,
+        max_size_mb=None,
+        num_shards=16,
+        low_water_mark=0.9,
+        segment_size_mb=64,
+        one_file_per_entry=None,
+    ):
+        if one_file_per_entry is None:
+            one_file_per_entry = fcntl is None
+        elif not one_file_per_entry and fcntl is None:
+            raise ValueError("Segment files need fcntl file locks")
+        self.cache_dir = str(cache_dir)
+        self.num_shards = num_shards
+        self.low_water_mark = low_water_mark
+        self.one_file_per_entry = one_file_per_entry
+        self.shard_limit = None
+        self.segment_size = segment_size_mb * 1024 * 1024
+        if max_size_mb is not None:
+            self.shard_limit = max_size_mb * 1024 * 1024 / num_shards
+            self.segment_size = min(
+                self.segment_size, self.shard_limit * (1 - low_water_mark)
+            )
+        # For one file per entry: the size of each shard
+        self._shard_sizes = {}
+        # For segments, for each shard: key -> (segment, offset, length, crc)
+        # and the position up to which each index file has been read. The
+        # segments are kept open for reading (with pread, which does not
+        # use the file position shared with forked processes).
+        self._index = {}
+        self._index_positions = {}
+        self._segment_fds = {}
+        for shard in range(num_shards):
+            os.makedirs(self._shard_dir(shard), exist_ok=True)
+
+    def __getstate__(self):
+        # The open segments (and the index) are specific to a process
+        state = self.__dict__.copy()
+        state["_index"] = {}
+        state["_index_positions"] = {}
+        state["_segment_fds"] = {}
+        return state
+
+    def __contains__(self, key):
+        if self.one_file_per_entry:
+            return os.path.isfile(self._path(key))
+        entry = self._lookup(key)
+        return entry is not None and os.path.isfile(
+            self._segment_path(self._shard(key), entry[0], SEGMENT_SUFFIX)
+        )
+
+    def __getitem__(self, key):
+        if self.one_file_per_entry:
+            return self._load_file(key)
+        shard = self._shard(key)
+        entry = self._lookup(key)
+        if entry is None:
+            raise KeyError(key)
+        segment, offset, length, crc = entry
+        path = self._segment_path(shard, segment, SEGMENT_SUFFIX)
+        try:
+            data = os.pread(self._segment_fd(shard, segment), length, offset)
+        except FileNotFoundError:
+            # Evicted by another process
+            self._forget_segment(shard, segment)
+            raise KeyError(key)
+        if len(data) != length or zlib.crc32(data) != crc:
+            logger.warning(f"Ignoring corrupted cache entry {key} in {path}")
+            del self._index[shard][key]
+            raise KeyError(key)
+        value = torch.load(io.BytesIO(data), map_location="cpu")
+        if self.shard_limit is not None and self._evicted_next(shard, segment):
+            self._append(shard, key, data)
+        return value
+
+    def __setitem__(self, key, value):
+        if self.one_file_per_entry:
+            self._save_file(key, value)
+            return
+        buffer = io.BytesIO()
+        torch.save(value, buffer)
+        self._append(self._shard(key), key, buffer.getvalue())
+
+    def get(self, key, default=None):
+        """Returns the value for key if it is in the cache, else default."""
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def size(self):
+        """Returns the total size of the cache in bytes."""
+        if self.one_file_per_entry:
+            return sum(self._scan(shard)[0] for shard in range(self.num_shards))
+        return sum(
+            size
+            for shard in range(self.num_shards)
+            for _, size in self._segment_sizes(shard)
+        )
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        for shard in range(self.num_shards):
+            if self.one_file_per_entry:
+                for _, _, path in self._scan(shard)[1]:
+                    self._remove(path)
+                self._shard_sizes[shard] = 0
+                continue
+            with self._lock(shard):
+                for segment in self._segments(shard):
+                    self._remove_segment(shard, segment)
+
+    # Segment files
+
+    def _lookup(self, key):
+        """Returns the (segment, offset, length, crc) of a key, or None.
+        Reads the new index records of the shard if the key is unknown."""
+        shard = self._shard(key)
+        if key not in self._index.get(shard, {}):
+            self._refresh(shard)
+        return self._index[shard].get(key)
+
+    def _refresh(self, shard):
+        """Reads the index records added since the last refresh, and
+        forgets the segments which were evicted."""
+        index = self._index.setdefault(shard, {})
+        positions = self._index_positions.setdefault(shard, {})
+        segments = self._segments(shard)
+        for segment in set(positions) - set(segments):
+            self._forget_segment(shard, segment)
+        for segment in segments:
+            position = positions.get(segment, 0)
+            path = self._segment_path(shard, segment, INDEX_SUFFIX)
+            try:
+                with open(path, "rb") as fi:
+                    fi.seek(position)
+                    records = fi.read()
+            except FileNotFoundError:
+                continue
+            # A record without its newline is still being written
+            complete = records.rfind(b"\n") + 1
+            positions[segment] = position + complete
+            for line in records[:complete].decode("utf-8").splitlines():
+                try:
+                    offset, length, crc, key = line.split(" ", 3)
+                    index[key] = (segment, int(offset), int(length), int(crc))
+                except ValueError:
+                    # Interrupted write, the entry is lost
+                    continue
+
+    def _segment_fd(self, shard, segment):
+        """Returns a file descriptor of a segment open for reading."""
+        if (shard, segment) not in self._segment_fds:
+            path = self._segment_path(shard, segment, SEGMENT_SUFFIX)
+            self._segment_fds[shard, segment] = os.open(path, os.O_RDONLY)
+        return self._segment_fds[shard, segment]
+
+    def _forget_segment(self, shard, segment):
+        """Removes the entries of a segment from the in-memory index."""
+        fd = self._segment_fds.pop((shard, segment), None)
+        if fd is not None:
+            os.close(fd)
+        self._index_positions.get(shard, {}).pop(segment, None)
+        self._index[shard] = {
+            key: entry
+            for key, entry in self._index.get(shard, {}).items()
+            if entry[0] != segment
+        }
+
+    def _append(self, shard, key, data):
+        """Appends an entry to the newest segment of a shard, and evicts the
+        oldest segments if the shard is over its limit."""
+        with self._lock(shard):
+            sizes = self._segment_sizes(shard)
+            if not sizes or sizes[-1][1] >= self.segment_size:
+                segment = sizes[-1][0] + 1 if sizes else 0
+                sizes.append((segment, 0))
+            segment = sizes[-1][0]
+            path = self._segment_path(shard, segment, SEGMENT_SUFFIX)
+            offset = os.path.getsize(path) if os.path.isfile(path) else 0
+            with open(path, "ab") as fo:
+                fo.write(data)
+            crc = zlib.crc32(data)
+            record = f"{offset} {len(data)} {crc} {key}\n".encode("utf-8")
+            index_path = self._segment_path(shard, segment, INDEX_SUFFIX)
+            with open(index_path, "ab") as fo:
+                fo.write(record)
+            self._index.setdefault(shard, {})[key] = (
+                segment,
+                offset,
+                len(data),
+                crc,
+            )
+            sizes[-1] = (segment, sizes[-1][1] + len(data) + len(record))
+
+            if self.shard_limit is None:
+                return
+            total = sum(size for _, size in sizes)
+            if total <= self.shard_limit:
+                return
+            target = self.shard_limit * self.low_water_mark
+            # The newest segment is never evicted
+            for old_segment, size in sizes[:-1]:
+                if total <= target:
+                    break
+                self._remove_segment(shard, old_segment)
+                total -= size
+
+    def _evicted_next(self, shard, segment):
+        """Whether a segment is among the oldest ones of its shard, which
+        are evicted next (the oldest fraction 1 - low_water_mark of the
+        limit)."""
+        older = 0
+        for other, size in self._segment_sizes(shard):
+            if other == segment:
+                return older < self.shard_limit * (1 - self.low_water_mark)
+            older += size
+        return False
+
+    def _segments(self, shard):
+        """The segment numbers of a shard, oldest first."""
+        segments = []
+        with os.scandir(self._shard_dir(shard)) as it:
+            for entry in it:
+                if entry.name.endswith(SEGMENT_SUFFIX):
+                    segments.append(int(entry.name[: -len(SEGMENT_SUFFIX)]))
+        return sorted(segments)
+
+    def _segment_sizes(self, shard):
+        """The (segment, size) of each segment of a shard, oldest first.
+        The size includes the index file."""
+        sizes = []
+        for segment in self._segments(shard):
+            size = 0
+            for suffix in [SEGMENT_SUFFIX, INDEX_SUFFIX]:
+                try:
+                    size += os.path.getsize(
+                        self._segment_path(shard, segment, suffix)
+                    )
+                except FileNotFoundError:
+                    pass
+            sizes.append((segment, size))
+        return sizes
+
+    def _remove_segment(self, shard, segment):
+        for suffix in [SEGMENT_SUFFIX, INDEX_SUFFIX]:
+            self._remove(self._segment_path(shard, segment, suffix))
+        self._forget_segment(shard, segment)
+
+    def _segment_path(self, shard, segment, suffix):
+        return os.path.join(self._shard_dir(shard), f"{segment:08d}{suffix}")
+
+    @contextlib.contextmanager
+    def _lock(self, shard):
+        """Holds the write lock of a shard."""
+        with open(os.path.join(self._shard_dir(shard), LOCK_NAME), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    # One file per entry
+
+    def _load_file(self, key):
+        path = self._path(key)
+        try:
+            value = torch.load(path, map_location="cpu")
+        except FileNotFoundError:
+            raise KeyError(key)
+        except (EOFError, RuntimeError, pickle.UnpicklingError) as e:
+            # Most likely truncated by a crash, just recompute it.
+            logger.warning(f"Removing unreadable cache entry {path}: {e}")
+            self._remove(path)
+            raise KeyError(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another process in between, but we have the value.
+            pass
+        return value
+
+    def _save_file(self, key, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        torch.save(value, tmp_path)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        if self.shard_limit is not None:
+            shard = self._shard(key)
+            if shard not in self._shard_sizes:
+                self._shard_sizes[shard] = self._scan(shard)[0]
+            else:
+                self._shard_sizes[shard] += size
+            if self._shard_sizes[shard] > self.shard_limit:
+                self._evict(shard)
+
+    def _evict(self, shard):
+        """Removes the least recently used entries of a shard."""
+        total, entries = self._scan(shard)
+        target = self.shard_limit * self.low_water_mark
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            self._remove(path)
+            total -= size
+        self._shard_sizes[shard] = total
+
+    def _scan(self, shard):
+        """Returns the total size and the (mtime, size, path) of entries."""
+        entries = []
+        with os.scandir(self._shard_dir(shard)) as it:
+            for entry in it:
+                if not entry.name.endswith(CACHE_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sum(size for _, size, _ in entries), entries
+
+    def _shard(self, key):
+        return zlib.crc32(key.encode()) % self.num_shards
+
+    def _shard_dir(self, shard):
+        return os.path.join(self.cache_dir, f"shard{shard:03d}")
+
+    def _path(self, key):
+        return os.path.join(
+            self._shard_dir(self._shard(key)), key + CACHE_SUFFIX
+        )
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class CachedDynamicItem(DynamicItem):
+    """Wraps a DynamicItem so that its outputs are cached on disk.
+
+    The cache key is a hash of the data point id, the function (source code
+    if available, else qualified name), the version string and the inputs.
+    Note that when an input is a file path, the cache is not invalidated if
+    the file changes; change the version then.
+
+    Arguments
+    ---------
+    item : DynamicItem
+        The dynamic item to wrap. Its function should be deterministic.
+        Generator dynamic items are not supported.
+    cache : DiskCache
+        Where to store the outputs.
+    version : str
+        Included in the key, change it to invalidate the cached outputs.
+    id_key : str
+        The key of the data point id.
+
+    Example
+    -------
+    >>> item = DynamicItem(["x"], lambda x: torch.tensor([x]), ["y"])
+    >>> cached = CachedDynamicItem(item, DiskCache(getfixture("tmpdir")))
+    >>> cached.takes
+    ['id', 'x']
+    >>> cached("utt1", 3)
+    tensor([3])
+    """
+
+    def __init__(self, item, cache, version="", id_key="id"):
+        if isinstance(item, GeneratorDynamicItem):
+            raise ValueError("Cannot cache a GeneratorDynamicItem")
+        super().__init__(
+            takes=[id_key, *item.takes], func=item.func, provides=item.provides
+        )
+        self.item = item
+        self.cache = cache
+        self.func_hash = hash_function(item.func, version)
+
+    def __call__(self, data_id, *args):
+        hasher = hashlib.sha1(self.func_hash.encode())
+        hash_value(hasher, data_id)
+        hash_value(hasher, args)
+        key = hasher.hexdigest()
+        try:
+            return self.cache[key]
+        except KeyError:
+            pass
+        value = self.item(*args)
+        self.cache[key] = value
+        return value
+
+
+def hash_function(func, version=""):
+    """Returns a hex digest that identifies a function.
+
+    Uses the source code of the function if it is available, so that editing
+    the function invalidates the cache.
+
+    Example
+    -------
+    >>> def f(x):
+    ...     return x + 1
+    >>> hash_function(f) == hash_function(f, version="v2")
+    False
+    """
+    hasher = hashlib.sha1(version.encode())
+    hasher.update(getattr(func, "__module__", "").encode())
+    hasher.update(getattr(func, "__qualname__", repr(func)).encode())
+    try:
+        hasher.update(inspect.getsource(func).encode())
+    except (OSError, TypeError):
+        # Builtins, partials, functions defined in an interpreter...
+        hasher.update(repr(func).encode())
+    return hasher.hexdigest()
+
+
+def hash_value(hasher, value):
+    """Updates a hashlib hasher with the contents of a value.
+
+    Tensors and arrays are hashed by dtype, shape and data, containers
+    recursively, and anything else by its repr.
+
+    Example
+    -------
+    >>> h1, h2 = hashlib.sha1(), hashlib.sha1()
+    >>> hash_value(h1, {"a": torch.ones(2)})
+    >>> hash_value(h2, {"a": torch.ones(2)})
+    >>> h1.hexdigest() == h2.hexdigest()
+    True
+    """
+    if isinstance(value, torch.Tensor):
+        value = value.detach().cpu().numpy()
+    if isinstance(value, np.ndarray):
+        hasher.update(f"array{value.dtype}{value.shape}".encode())
+        hasher.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        hasher.update(f"{type(value).__name__}{len(value)}".encode())
+        for element in value:
+            hash_value(hasher, element)
+    elif isinstance(value, dict):
+        hasher.update(f"dict{len(value)}".encode())
+        for k in sorted(value, key=repr):
+            hash_value(hasher, k)
+            hash_value(hasher, value[k])
+    elif isinstance(value, bytes):
+        hasher.update(value)
+    else:
+        hasher.update(f"{type(value).__name__}:{value!r}".encode())
@@ -10,6 +10,7 @@ Authors
  * Sylvain de Langen 2022
 """
 
+import io
 import os
 import torch
 import logging
@@ -178,16 +179,20 @@ def read_audio(waveforms_obj):
     })
     ```
 
+    Instead of a path, the file can also be given as the bytes of the encoded
+    audio file, e.g. as read from a shard (see `speechbrain.dataio.shards`).
+
     Which codecs are supported depends on your torchaudio backend.
     Refer to `torchaudio.load` documentation for further details.
 
     Arguments
     ----------
-    waveforms_obj : str, dict
-        Path to audio or dict with the desired configuration.
+    waveforms_obj : str, bytes, dict
+        Path to audio (or the audio file contents) or dict with the desired
+        configuration.
 
         Keys for the dict variant:
-        - `"file"` (str): Path to the audio file.
+        - `"file"` (str, bytes): Path to the audio file (or its contents).
         - `"start"` (int, optional): The first sample to load.
         If unspecified, load from the very first frame.
         - `"stop"` (int, optional): The last sample to load (exclusive).
@@ -214,8 +219,12 @@ def read_audio(waveforms_obj):
     """
     if isinstance(waveforms_obj, str):
         audio, _ = torchaudio.load(waveforms_obj)
+    elif isinstance(waveforms_obj, bytes):
+        audio, _ = torchaudio.load(io.BytesIO(waveforms_obj))
     else:
         path = waveforms_obj["file"]
+        if isinstance(path, bytes):
+            path = io.BytesIO(path)
         start = waveforms_obj.get("start", 0)
         # To match past SB behavior, `start == stop` or omitted `stop` means to
         # load all frames from `start` to the file end.
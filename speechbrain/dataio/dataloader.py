@@ -37,12 +37,18 @@ Authors:
 from torch.utils.data import DataLoader
 from torch.utils.data import IterableDataset
 from torch.utils.data.dataloader import _BaseDataLoaderIter
+import torch
+import queue
 import logging
 import warnings
 import functools
+import threading
+import collections.abc
 from speechbrain.dataio.batch import PaddedBatch, BatchsizeGuesser
 from speechbrain.dataio.dataset import DynamicItemDataset
+from speechbrain.dataio.shards import ShardedDynamicItemDataset
 from speechbrain.dataio.sampler import ReproducibleRandomSampler
+from speechbrain.utils.data_utils import recursive_to
 from speechbrain.utils.checkpoints import (
     register_checkpoint_hooks,
     mark_as_saver,
@@ -70,8 +76,8 @@ logger = logging.getLogger(__name__)
 def make_dataloader(dataset, looped_nominal_epoch=None, **loader_kwargs):
     """Makes a basic DataLoader with SpeechBrain defaults.
 
-    For DynamicItemDatasets (which return dicts), use
-    PaddedBatch as the default collate_fn.
+    For DynamicItemDatasets and ShardedDynamicItemDatasets (which return
+    dicts), use PaddedBatch as the default collate_fn.
 
     Shuffling gets implemented by ReproducibleRandomSampler.
 
@@ -105,7 +111,7 @@ def make_dataloader(dataset, looped_nominal_epoch=None, **loader_kwargs):
     """
     # PaddedBatch as default collation for DynamicItemDataset
     if "collate_fn" not in loader_kwargs and isinstance(
-        dataset, DynamicItemDataset
+        dataset, (DynamicItemDataset, ShardedDynamicItemDataset)
     ):
         loader_kwargs["collate_fn"] = PaddedBatch
     # Reproducible random sampling
@@ -345,3 +351,140 @@ class LoopedLoader:
                 # loop has already finished but there is a checkpoint in the
                 # middle of validation.
                 self.step = self.epoch_length
+
+
+class DevicePrefetcher:
+    """Moves the batches of a loader to a device ahead of time.
+
+    While batch N is being processed, the next ``num_prefetch`` batches are
+    already fetched from the loader and copied to the device. On CUDA the
+    copies are issued on a side stream, and the compute stream waits for
+    them before each batch is handed out. Elsewhere (e.g. CPU-only runs),
+    a background thread fetches the batches into a bounded queue.
+
+    Batches are moved with ``recursive_to``, so tensors, PaddedBatch
+    objects and (nested) tuples, lists and dicts of them are supported.
+    Other values, e.g. the string ids, are passed through as they are.
+    To actually overlap the host to device copies with compute, the loader
+    should return pinned memory (``pin_memory=True``, or a PaddedBatch
+    ``buffer_pool``).
+
+    Note that the loader runs ahead of the training loop, so an intra-epoch
+    checkpoint records up to ``num_prefetch`` batches that have not been
+    processed yet, and these are skipped on recovery.
+
+    Arguments
+    ---------
+    loader : iterable
+        A DataLoader, LoopedLoader or other iterable of batches.
+    device : str, torch.device
+        The device to move the batches to.
+    num_prefetch : int
+        How many batches to fetch ahead.
+
+    Example
+    -------
+    >>> loader = [(torch.ones(2), {"x": torch.zeros(1)})] * 3
+    >>> prefetcher = DevicePrefetcher(loader, "cpu")
+    >>> len(prefetcher)
+    3
+    >>> for batch in prefetcher:
+    ...     pass
+    >>> batch
+    (tensor([1., 1.]), {'x': tensor([0.])})
+    """
+
+    def __init__(self, loader, device, num_prefetch=1):
+        if num_prefetch < 1:
+            raise ValueError("num_prefetch must be at least 1")
+        self.loader = loader
+        self.device = torch.device(device)
+        self.num_prefetch = num_prefetch
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        if self.device.type == "cuda" and torch.cuda.is_available():
+            return self._iter_cuda()
+        return self._iter_thread()
+
+    def _iter_cuda(self):
+        """Copies the next batches on a side stream."""
+        stream = torch.cuda.Stream(self.device)
+        iterator = iter(self.loader)
+        pending = collections.deque()
+
+        def preload():
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            with torch.cuda.stream(stream):
+                batch = recursive_to(batch, self.device, non_blocking=True)
+                event = torch.cuda.Event()
+                event.record(stream)
+            pending.append((batch, event))
+
+        for _ in range(self.num_prefetch):
+            preload()
+        while pending:
+            batch, event = pending.popleft()
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_event(event)
+            # The memory was allocated on the side stream, so the caching
+            # allocator must not reuse it before the compute stream is done.
+            _record_stream(batch, current_stream)
+            preload()
+            yield batch
+
+    def _iter_thread(self):
+        """Fetches the next batches in a background thread."""
+        batches = queue.Queue(maxsize=self.num_prefetch)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def worker():
+            try:
+                for batch in self.loader:
+                    if not put((recursive_to(batch, self.device), None)):
+                        return
+                put((None, StopIteration()))
+            except Exception as e:
+                put((None, e))
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch, error = batches.get()
+                if isinstance(error, StopIteration):
+                    return
+                elif error is not None:
+                    raise error
+                yield batch
+        finally:
+            # Also reached if the consumer stops early.
+            stop.set()
+            thread.join()
+
+
+def _record_stream(data, stream):
+    """Marks all CUDA tensors in data as used by the given stream."""
+    if isinstance(data, torch.Tensor):
+        if data.is_cuda:
+            data.record_stream(stream)
+    elif isinstance(data, collections.abc.Mapping):
+        for value in data.values():
+            _record_stream(value, stream)
+    elif isinstance(data, (list, tuple, PaddedBatch)):
+        for value in data:
+            _record_stream(value, stream)
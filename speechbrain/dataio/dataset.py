@@ -11,6 +11,7 @@ from types import MethodType
 from torch.utils.data import Dataset
 from speechbrain.utils.data_pipeline import DataPipeline
 from speechbrain.dataio.dataio import load_data_json, load_data_csv
+from speechbrain.dataio.cache import DiskCache, CachedDynamicItem
 import logging
 
 logger = logging.getLogger(__name__)
@@ -155,6 +156,8 @@ class DynamicItemDataset(Dataset):
             static_keys.append("id")
         self.pipeline = DataPipeline(static_keys, dynamic_items)
         self.set_output_keys(output_keys)
+        # (path, replacements) of the manifest file, if loaded from one
+        self.manifest = None
 
     def __len__(self):
         return len(self.data_ids)
@@ -192,6 +195,36 @@ class DynamicItemDataset(Dataset):
         """
         self.pipeline.add_dynamic_item(func, takes, provides)
 
+    def cache_dynamic_items(self, keys, cache, version=""):
+        """Caches the outputs of some dynamic items on disk.
+
+        The dynamic items which provide the keys are computed once for each
+        data point, after that the outputs are loaded from the cache. Only
+        use this for deterministic items (e.g. audio loading or feature
+        computation, not data augmentation). See `speechbrain.dataio.cache`.
+
+        Arguments
+        ---------
+        keys : list
+            Keys of the dynamic items to cache. If an item provides many
+            keys, all its outputs are cached.
+        cache : str, DiskCache
+            The cache to use, or a directory for a new DiskCache without a
+            size limit.
+        version : str
+            Included in the cache keys, change it to invalidate the cache.
+        """
+        if not isinstance(cache, DiskCache):
+            cache = DiskCache(cache)
+        if isinstance(keys, str):
+            keys = [keys]
+        for key in keys:
+            item = self.pipeline.get_dynamic_item(key)
+            if isinstance(item, CachedDynamicItem):
+                continue
+            cached = CachedDynamicItem(item, cache, version=version)
+            self.pipeline.replace_dynamic_item(item, cached)
+
     def set_output_keys(self, keys):
         """Use this to change the output keys.
 
@@ -355,7 +388,9 @@ class DynamicItemDataset(Dataset):
     ):
         """Load a data prep JSON file and create a Dataset based on it."""
         data = load_data_json(json_path, replacements)
-        return cls(data, dynamic_items, output_keys)
+        dataset = cls(data, dynamic_items, output_keys)
+        dataset.manifest = (json_path, replacements)
+        return dataset
 
     @classmethod
     def from_csv(
@@ -363,7 +398,9 @@ class DynamicItemDataset(Dataset):
     ):
         """Load a data prep CSV file and create a Dataset based on it."""
         data = load_data_csv(csv_path, replacements)
-        return cls(data, dynamic_items, output_keys)
+        dataset = cls(data, dynamic_items, output_keys)
+        dataset.manifest = (csv_path, replacements)
+        return dataset
 
     @classmethod
     def from_arrow_dataset(
@@ -391,6 +428,7 @@ class FilteredSortedDynamicItemDataset(DynamicItemDataset):
         self.data = from_dataset.data
         self.data_ids = data_ids
         self.pipeline = copy.deepcopy(from_dataset.pipeline)
+        self.manifest = from_dataset.manifest
 
     @classmethod
     def from_json(
@@ -411,6 +449,12 @@ def add_dynamic_item(datasets, func, takes=None, provides=None):
         dataset.add_dynamic_item(func, takes, provides)
 
 
+def cache_dynamic_items(datasets, keys, cache, version=""):
+    """Helper for caching the same items of multiple datasets."""
+    for dataset in datasets:
+        dataset.cache_dynamic_items(keys, cache, version)
+
+
 def set_output_keys(datasets, output_keys):
     """Helper for setting the same item to multiple datasets."""
     for dataset in datasets:
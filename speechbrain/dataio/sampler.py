@@ -9,8 +9,12 @@ Authors:
   * Artem Ploujnikov 2021
   * Andreas Nautsch 2021
 """
+import os
+import math
 import torch
+import hashlib
 import logging
+import collections
 from operator import itemgetter
 from torch.utils.data import (
     RandomSampler,
@@ -21,6 +25,7 @@ from torch.utils.data import (
 import numpy as np
 from typing import List
 from speechbrain.dataio.dataset import DynamicItemDataset
+from speechbrain.dataio.cache import hash_function, hash_value
 from collections import Counter
 from scipy.stats import lognorm
 
@@ -408,6 +413,12 @@ class DynamicBatchSampler(Sampler):
          have not been grouped.
     verbose: bool
         If ``True``, log also the stats for each batch at the first epoch.
+    lengths_cache : bool, str
+        If given, the lengths computed with length_func are saved to (and
+        loaded from, on the next run) this .npy file. If True, the file is
+        saved next to the manifest of the dataset (for datasets made with
+        DynamicItemDataset.from_json or from_csv). The cache is recomputed if
+        the manifest or the source code of length_func changes.
     """
 
     def __init__(
@@ -425,10 +436,9 @@ class DynamicBatchSampler(Sampler):
         epoch: int = 0,
         drop_last: bool = False,
         verbose: bool = False,
+        lengths_cache=None,
     ):
         self._dataset = dataset
-        self._ex_lengths = {}
-        ex_ids = self._dataset.data_ids
         self.verbose = verbose
 
         # We do not put a default on num_buckets to encourage users to play with this parameter
@@ -440,18 +450,14 @@ class DynamicBatchSampler(Sampler):
 
         if lengths_list is not None:
             # take length of examples from this argument and bypass length_key
-            for indx in range(len(lengths_list)):
-                self._ex_lengths[str(indx)] = lengths_list[indx]
+            self._ex_lengths = np.asarray(lengths_list)
         else:
             # use length func
             if not isinstance(dataset, DynamicItemDataset):
                 raise NotImplementedError(
                     "Dataset should be a Speechbrain DynamicItemDataset when using length function"
                 )
-            for indx in range(len(self._dataset)):
-                self._ex_lengths[str(indx)] = length_func(
-                    self._dataset.data[ex_ids[indx]]
-                )
+            self._ex_lengths = _get_lengths(dataset, length_func, lengths_cache)
 
         if len(bucket_boundaries) > 0:
             if not all([x >= 0 for x in bucket_boundaries]):
@@ -495,7 +501,7 @@ class DynamicBatchSampler(Sampler):
 
     def get_durations(self, batch):
         """Gets durations of the elements in the batch."""
-        return [self._ex_lengths[str(idx)] for idx in batch]
+        return self._ex_lengths[batch].tolist()
 
     def _get_boundaries_through_warping(
         self, max_batch_length: int, num_quantiles: int,
@@ -534,27 +540,15 @@ class DynamicBatchSampler(Sampler):
             # deterministically shuffle based on epoch and seed
             g = torch.Generator()
             g.manual_seed(self._seed + self._epoch)
-            sampler = torch.randperm(
-                len(self._batches), generator=g
-            ).tolist()  # type: ignore
-            tmp = []
-            for idx in sampler:
-                tmp.append(self._batches[idx])
-            self._batches = tmp
-
+            order = torch.randperm(len(self._batches), generator=g).numpy()
         elif self._batch_ordering == "ascending":
-            self._batches = sorted(
-                self._batches,
-                key=lambda x: max([self._ex_lengths[str(idx)] for idx in x]),
-            )
+            order = np.argsort(self._batch_max_lengths, kind="stable")
         elif self._batch_ordering == "descending":
-            self._batches = sorted(
-                self._batches,
-                key=lambda x: max([self._ex_lengths[str(idx)] for idx in x]),
-                reverse=True,
-            )
+            order = np.argsort(-self._batch_max_lengths, kind="stable")
         else:
             raise NotImplementedError
+        self._batches = [self._batches[idx] for idx in order]
+        self._batch_max_lengths = self._batch_max_lengths[order]
 
     def _generate_batches(self):
         logger.info("DynamicBatchSampler: Generating dynamic batches")
@@ -562,71 +556,98 @@ class DynamicBatchSampler(Sampler):
             # deterministically shuffle based on epoch and seed
             g = torch.Generator()
             g.manual_seed(self._seed + self._epoch)
-            sampler = torch.randperm(len(self._dataset), generator=g).tolist()  # type: ignore
+            sampler = torch.randperm(len(self._dataset), generator=g).numpy()  # type: ignore
         else:
             # take examples as they are: e.g. they have been sorted
-            sampler = range(len(self._dataset))  # type: ignore
-
-        self._batches = []
-        bucket_batches = [[] for i in self._bucket_lens]
+            sampler = np.arange(len(self._dataset))  # type: ignore
+
+        # The examples are added to the bucket that fills up most padding,
+        # in the sampler order. A bucket is emitted as a batch as soon as it
+        # is full. Group the examples by bucket (stable, so that the sampler
+        # order is kept in each bucket) and cut the groups into batches.
+        lengths = self._ex_lengths[sampler]
+        bucket_ids = np.searchsorted(self._bucket_boundaries, lengths)
+        by_bucket = np.argsort(bucket_ids, kind="stable")
+        bucket_counts = np.bincount(
+            bucket_ids, minlength=len(self._bucket_lens)
+        )
+        bucket_starts = np.cumsum(bucket_counts) - bucket_counts
+        bucket_sizes = np.minimum(self._bucket_lens, self._max_batch_ex)
+        bucket_sizes = bucket_sizes.astype(np.int64)
+        num_full = bucket_counts // bucket_sizes
+
+        # Full batches, in the order in which they were completed: the
+        # position in the sampler of their last example
+        full_bucket = np.repeat(np.arange(len(bucket_counts)), num_full)
+        full_index = np.arange(num_full.sum()) - np.repeat(
+            np.cumsum(num_full) - num_full, num_full
+        )
+        full_starts = (
+            bucket_starts[full_bucket] + full_index * bucket_sizes[full_bucket]
+        )
+        full_ends = full_starts + bucket_sizes[full_bucket]
+        completed = by_bucket[full_ends - 1]
+        emit_order = np.argsort(completed, kind="stable")
+        batch_starts = full_starts[emit_order]
+        batch_ends = full_ends[emit_order]
+
+        # Remaining (not full) batches, in bucket order
+        rest_starts = bucket_starts + num_full * bucket_sizes
+        rest_ends = bucket_starts + bucket_counts
+        remaining = rest_ends > rest_starts
+        rest_starts = rest_starts[remaining]
+        rest_ends = rest_ends[remaining]
+        if not self._drop_last:
+            batch_starts = np.concatenate([batch_starts, rest_starts])
+            batch_ends = np.concatenate([batch_ends, rest_ends])
 
-        stats_tracker = [
-            {"min": np.inf, "max": -np.inf, "tot": 0, "n_ex": 0}
-            for i in self._bucket_lens
+        ordered = sampler[by_bucket]
+        self._batches = [
+            ordered[start:end].tolist()
+            for start, end in zip(batch_starts, batch_ends)
         ]
-
-        for idx in sampler:
-            # length of pre-sampled audio
-            item_len = self._ex_lengths[str(idx)]
-            # bucket to fill up most padding
-            bucket_id = np.searchsorted(self._bucket_boundaries, item_len)
-            # fill audio's duration into that bucket
-            bucket_batches[bucket_id].append(idx)
-
-            stats_tracker[bucket_id]["min"] = min(
-                stats_tracker[bucket_id]["min"], item_len
+        # All the batches (also dropped ones) partition the ordered examples
+        segment_starts = np.sort(np.concatenate([full_starts, rest_starts]))
+        if len(segment_starts) > 0:
+            segment_max = np.maximum.reduceat(
+                lengths[by_bucket], segment_starts
             )
-            stats_tracker[bucket_id]["max"] = max(
-                stats_tracker[bucket_id]["max"], item_len
-            )
-            stats_tracker[bucket_id]["tot"] += item_len
-            stats_tracker[bucket_id]["n_ex"] += 1
-            # track #samples - why not duration/#frames; rounded up?
-            # keep track of durations, if necessary
-
-            if (
-                len(bucket_batches[bucket_id]) >= self._bucket_lens[bucket_id]
-                or len(bucket_batches[bucket_id]) >= self._max_batch_ex
-            ):
-                self._batches.append(bucket_batches[bucket_id])
-                bucket_batches[bucket_id] = []
-                # keep track of durations
-
-        # Dump remaining batches
-        if not self._drop_last:
-            for batch in bucket_batches:
-                if batch:
-                    self._batches.append(batch)
+            self._batch_max_lengths = segment_max[
+                np.searchsorted(segment_starts, batch_starts)
+            ]
+        else:
+            self._batch_max_lengths = lengths[:0]
 
         self._permute_batches()  # possibly reorder batches
 
         if self._epoch == 0:  # only log at first epoch
             # frames per batch & their padding remaining
             boundaries = [0] + self._bucket_boundaries.tolist()
+            bucket_tot = np.bincount(
+                bucket_ids, weights=lengths, minlength=len(bucket_counts)
+            )
+            nonempty = bucket_counts > 0
+            bucket_min = np.zeros(len(bucket_counts))
+            bucket_max = np.zeros(len(bucket_counts))
+            if nonempty.any():
+                sorted_lengths = lengths[by_bucket]
+                starts = bucket_starts[nonempty]
+                bucket_min[nonempty] = np.minimum.reduceat(
+                    sorted_lengths, starts
+                )
+                bucket_max[nonempty] = np.maximum.reduceat(
+                    sorted_lengths, starts
+                )
 
             for bucket_indx in range(len(self._bucket_boundaries)):
-                try:
-                    num_batches = stats_tracker[bucket_indx]["tot"] // (
+                if bucket_counts[bucket_indx] > 0:
+                    num_batches = bucket_tot[bucket_indx] // (
                         self._max_batch_length
                     )
                     pad_factor = (
-                        stats_tracker[bucket_indx]["max"]
-                        - stats_tracker[bucket_indx]["min"]
-                    ) / (
-                        stats_tracker[bucket_indx]["tot"]
-                        / stats_tracker[bucket_indx]["n_ex"]
-                    )
-                except ZeroDivisionError:
+                        bucket_max[bucket_indx] - bucket_min[bucket_indx]
+                    ) / (bucket_tot[bucket_indx] / bucket_counts[bucket_indx])
+                else:
                     num_batches = 0
                     pad_factor = 0
 
@@ -639,45 +660,26 @@ class DynamicBatchSampler(Sampler):
                         boundaries[bucket_indx],
                         boundaries[bucket_indx + 1],
                         self._bucket_lens[bucket_indx],
-                        stats_tracker[bucket_indx]["n_ex"],
+                        bucket_counts[bucket_indx],
                         num_batches,
                         pad_factor * 100,
                     )
                 )
 
             if self.verbose:
-                batch_stats = {
-                    "tot_frames": [],
-                    "tot_pad_frames": [],
-                    "pad_%": [],
-                }
-                for batch in self._batches:
-                    tot_frames = sum(
-                        [self._ex_lengths[str(idx)] for idx in batch]
-                    )
-                    batch_stats["tot_frames"].append(tot_frames)
-                    max_frames = max(
-                        [self._ex_lengths[str(idx)] for idx in batch]
-                    )
-                    tot_pad = sum(
-                        [
-                            max_frames - self._ex_lengths[str(idx)]
-                            for idx in batch
-                        ]
-                    )
-                    batch_stats["tot_pad_frames"].append(tot_pad)
-                    batch_stats["pad_%"].append(tot_pad / tot_frames * 100)
-
                 padding_details = "Batch {} with {:.1f} frames with {} files - {:.1f} padding, {:.2f} (%) of total."
                 padding_details = "DynamicBatchSampler: " + padding_details
-                for i in range(len(self._batches)):
+                for i, batch in enumerate(self._batches):
+                    batch_lengths = self._ex_lengths[batch]
+                    tot_frames = batch_lengths.sum()
+                    tot_pad = (batch_lengths.max() - batch_lengths).sum()
                     logger.info(
                         padding_details.format(
                             i,
-                            batch_stats["tot_frames"][i],
-                            len(self._batches[i]),
-                            batch_stats["tot_pad_frames"][i],
-                            batch_stats["pad_%"][i],
+                            tot_frames,
+                            len(batch),
+                            tot_pad,
+                            tot_pad / tot_frames * 100,
                         )
                     )
 
@@ -702,6 +704,236 @@ class DynamicBatchSampler(Sampler):
         return len(self._batches)
 
 
+class PaddingAwareBatchSampler(Sampler):
+    """Packs examples into batches with a budget on the padded batch size.
+
+    The memory and compute needed for a batch are proportional to its padded
+    size: the length of its longest example times the number of examples.
+    This sampler limits that padded size (and optionally also the padded
+    size of the targets, e.g. in tokens), unlike DynamicBatchSampler which
+    limits the sum of the lengths.
+
+    Each epoch, the examples are shuffled and split into windows of
+    window_size examples. Each window is sorted by length and split into
+    batches of consecutive examples. Among the splits with the fewest batches
+    that fit the budgets, the one with the least padding is taken (dynamic
+    programming over the sorted window). A larger window gives less padding,
+    a smaller one more randomization.
+
+    The batches depend only on the seed and the epoch, so call set_epoch
+    before each epoch. Brain.fit only does that under DDP, where the sampler
+    is wrapped in DistributedSamplerWrapper; otherwise, call it yourself
+    (e.g. in on_stage_start), or the same batches are used at every epoch.
+    Note that the number of batches may change a little from one epoch to
+    the next.
+
+    Example
+    -------
+    >>> lengths = [5, 3, 9, 2, 2, 8, 4, 6]
+    >>> sampler = PaddingAwareBatchSampler(
+    ...     None, max_padded_length=16, lengths_list=lengths, shuffle=False
+    ... )
+    >>> sorted(sampler, key=min)
+    [[1, 6, 0], [2], [3, 4], [7, 5]]
+    >>> round(sampler.padding_stats()["padding_ratio"], 4)
+    0.1136
+
+    Arguments
+    ---------
+    dataset : torch.utils.data.Dataset
+        Pytorch Dataset from which elements will be sampled.
+    max_padded_length : float
+        Upper limit for the padded size of a batch: the number of examples
+        times the length of the longest one. An example longer than this is
+        put in a batch on its own.
+    length_func : callable
+        Function used to get the length of each example from the annotation
+        of a DynamicItemDataset.
+    lengths_list : list
+        Overrides length_func by giving the length of each example.
+    max_padded_target_length : float
+        If given, also limits the padded size of the targets in a batch.
+    target_length_func : callable
+        Function used to get the target length of each example from the
+        annotation of a DynamicItemDataset, e.g.
+        lambda x: len(x["wrd"].split()).
+    target_lengths_list : list
+        Overrides target_length_func by giving the target lengths.
+    window_size : int
+        The number of examples which are sorted and packed together.
+    max_batch_ex : int
+        If given, the maximum number of examples in a batch.
+    shuffle : bool
+        Whether to shuffle the examples before splitting them into windows.
+        Otherwise the windows follow the order of the dataset.
+    batch_ordering : str
+        If ``random``, batches are randomly permuted; otherwise ``ascending``
+        or ``descending`` sorted by length.
+    seed : int
+        The base seed for shuffling.
+    epoch : int
+        The epoch to start at.
+    lengths_cache : bool, str
+        Cache the lengths computed by length_func on disk, see
+        DynamicBatchSampler. The target lengths are cached next to it.
+    """
+
+    def __init__(
+        self,
+        dataset,
+        max_padded_length,
+        length_func=lambda x: x["duration"],
+        lengths_list=None,
+        max_padded_target_length=None,
+        target_length_func=None,
+        target_lengths_list=None,
+        window_size=1000,
+        max_batch_ex=None,
+        shuffle=True,
+        batch_ordering="random",
+        seed=42,
+        epoch=0,
+        lengths_cache=None,
+    ):
+        if batch_ordering not in ["random", "ascending", "descending"]:
+            raise ValueError(f"Unknown batch_ordering: {batch_ordering}")
+        self._lengths = self._get_lengths(
+            dataset, length_func, lengths_list, lengths_cache, "lengths"
+        )
+        self._target_lengths = None
+        if max_padded_target_length is not None:
+            if target_length_func is None and target_lengths_list is None:
+                raise ValueError(
+                    "max_padded_target_length needs target_length_func or "
+                    "target_lengths_list"
+                )
+            target_cache = lengths_cache
+            if isinstance(lengths_cache, str):
+                target_cache = lengths_cache + ".targets.npz"
+            self._target_lengths = self._get_lengths(
+                dataset,
+                target_length_func,
+                target_lengths_list,
+                target_cache,
+                "target_lengths",
+            )
+        self.max_padded_length = max_padded_length
+        self.max_padded_target_length = max_padded_target_length
+        self.window_size = window_size
+        self.max_batch_ex = max_batch_ex
+        self.shuffle = shuffle
+        self.batch_ordering = batch_ordering
+        self.seed = seed
+        self.epoch = epoch
+        self._generate_batches()
+
+    @staticmethod
+    def _get_lengths(dataset, length_func, lengths_list, lengths_cache, name):
+        if lengths_list is not None:
+            return np.asarray(lengths_list)
+        if not isinstance(dataset, DynamicItemDataset):
+            raise NotImplementedError(
+                "Dataset should be a Speechbrain DynamicItemDataset when using length function"
+            )
+        return _get_lengths(dataset, length_func, lengths_cache, name)
+
+    def _generate_batches(self):
+        num_examples = len(self._lengths)
+        if self.shuffle:
+            # deterministically shuffle based on epoch and seed
+            g = torch.Generator()
+            g.manual_seed(self.seed + self.epoch)
+            order = torch.randperm(num_examples, generator=g).numpy()
+        else:
+            order = np.arange(num_examples)
+
+        batches = []
+        for start in range(0, num_examples, self.window_size):
+            window = order[start : start + self.window_size]
+            window = window[np.argsort(self._lengths[window], kind="stable")]
+            targets = None
+            if self._target_lengths is not None:
+                targets = self._target_lengths[window]
+            bounds = _pack_sorted(
+                self._lengths[window],
+                self.max_padded_length,
+                self.max_batch_ex,
+                targets,
+                self.max_padded_target_length,
+            )
+            batches.extend(
+                window[begin:end] for begin, end in zip(bounds, bounds[1:])
+            )
+
+        max_lengths = np.array([self._lengths[batch[-1]] for batch in batches])
+        if self.batch_ordering == "random":
+            g = torch.Generator()
+            g.manual_seed(self.seed + self.epoch)
+            permutation = torch.randperm(len(batches), generator=g).numpy()
+        elif self.batch_ordering == "ascending":
+            permutation = np.argsort(max_lengths, kind="stable")
+        else:
+            permutation = np.argsort(-max_lengths, kind="stable")
+        self._batches = [batches[idx].tolist() for idx in permutation]
+
+        if self.epoch == 0:  # only log at first epoch
+            stats = self.padding_stats()
+            logger.info(
+                "PaddingAwareBatchSampler: {} batches, {:.1f} examples and "
+                "{:.2f}% padding per batch".format(
+                    stats["num_batches"],
+                    stats["examples_per_batch"],
+                    stats["padding_ratio"] * 100,
+                )
+            )
+
+    def padding_stats(self):
+        """Returns statistics of the padding in the batches of this epoch.
+
+        Returns
+        -------
+        dict
+            With the number of batches, mean examples per batch, total length
+            and padded length, and the padding ratio (the fraction of the
+            padded length which is padding). Also for the targets, if they
+            are used.
+        """
+        stats = {
+            "num_batches": len(self._batches),
+            "examples_per_batch": len(self._lengths)
+            / max(len(self._batches), 1),
+        }
+        names = [("", self._lengths)]
+        if self._target_lengths is not None:
+            names.append(("target_", self._target_lengths))
+        for prefix, lengths in names:
+            total = 0.0
+            padded = 0.0
+            for batch in self._batches:
+                batch_lengths = lengths[batch]
+                total += batch_lengths.sum()
+                padded += batch_lengths.max() * len(batch)
+            stats[prefix + "length"] = total
+            stats[prefix + "padded_length"] = padded
+            stats[prefix + "padding_ratio"] = 1 - total / max(padded, 1e-12)
+        return stats
+
+    def __iter__(self):
+        for batch in self._batches:
+            yield batch
+
+    def set_epoch(self, epoch):
+        """
+        You can also just access self.epoch, but we maintain this interface
+        to mirror torch.utils.data.distributed.DistributedSampler
+        """
+        self.epoch = epoch
+        self._generate_batches()
+
+    def __len__(self):
+        return len(self._batches)
+
+
 # Heavily inspired by Catalyst, which is under Apache 2.0 licence.
 # https://github.com/catalyst-team/catalyst/blob/51428d7756e62b9b8ee5379f38e9fd576eeb36e5/catalyst/data/sampler.py#L522
 class DistributedSamplerWrapper(DistributedSampler):
@@ -725,11 +957,24 @@ class DistributedSamplerWrapper(DistributedSampler):
         super().__init__(dataset=sampler, *args, **kwargs)
         self.sampler = sampler
 
+    def _update_length(self, num_indices):
+        """Recomputes the number of samples of each process, as in
+        DistributedSampler.__init__, for wrapped samplers (e.g. batch
+        samplers) whose length changes from one epoch to the next."""
+        if self.drop_last and num_indices % self.num_replicas != 0:
+            self.num_samples = math.ceil(
+                (num_indices - self.num_replicas) / self.num_replicas
+            )
+        else:
+            self.num_samples = math.ceil(num_indices / self.num_replicas)
+        self.total_size = self.num_samples * self.num_replicas
+
     def __iter__(self):
         # It is easiest to use a random access interface to the wrapped
         # sampler's indices, so we just fetch all indices from the wrapped
         # sampler
         sampler_indices = list(self.sampler.__iter__())
+        self._update_length(len(sampler_indices))
         indices_of_indices = super().__iter__()
         # Itemgetter fetches the wrapped sampler indices from the positions
         # pointed to by DistributedSampler
@@ -740,6 +985,7 @@ class DistributedSamplerWrapper(DistributedSampler):
         super().set_epoch(epoch)
         if hasattr(self.sampler, "set_epoch"):
             self.sampler.set_epoch(epoch)
+            self._update_length(len(self.sampler))
 
 
 class BalancingDataSampler(ReproducibleWeightedRandomSampler):
@@ -814,3 +1060,145 @@ class BalancingDataSampler(ReproducibleWeightedRandomSampler):
             [class_counter[class_id] for class_id in class_ids]
         )
         return weights
+
+
+def _get_lengths(dataset, length_func, lengths_cache=None, name="lengths"):
+    """Computes the lengths of the examples of a DynamicItemDataset.
+
+    If lengths_cache is given, the lengths of all the examples in the data
+    (also the ones filtered out of this dataset) are saved to the cache
+    file, along with a key identifying the manifest and length_func. If
+    lengths_cache is True, the file is <manifest>.<name>.npz.
+    """
+    if not lengths_cache:
+        return np.asarray(
+            [length_func(dataset.data[data_id]) for data_id in dataset.data_ids]
+        )
+
+    hasher = hashlib.sha1(hash_function(length_func).encode())
+    if dataset.manifest is not None:
+        manifest_path, replacements = dataset.manifest
+        manifest_path = str(manifest_path)
+        stat = os.stat(manifest_path)
+        hasher.update(
+            f"{manifest_path}{stat.st_size}{stat.st_mtime_ns}".encode()
+        )
+        hash_value(hasher, replacements)
+    elif lengths_cache is True:
+        raise ValueError(
+            "lengths_cache=True needs a dataset created from a manifest "
+            "(from_json or from_csv), otherwise pass the cache file path."
+        )
+    if lengths_cache is True:
+        lengths_cache = f"{manifest_path}.{name}.npz"
+    lengths_cache = str(lengths_cache)
+    key = hasher.hexdigest()
+
+    all_ids = list(dataset.data.keys())
+    lengths = None
+    if os.path.isfile(lengths_cache):
+        with np.load(lengths_cache) as cached:
+            if str(cached["key"]) == key and len(cached["lengths"]) == len(
+                all_ids
+            ):
+                lengths = cached["lengths"]
+                logger.info(f"Loaded example lengths from {lengths_cache}")
+    if lengths is None:
+        lengths = np.asarray(
+            [length_func(dataset.data[data_id]) for data_id in all_ids]
+        )
+        tmp_path = f"{lengths_cache}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as fo:
+            np.savez(fo, lengths=lengths, key=np.array(key))
+        os.replace(tmp_path, lengths_cache)
+        logger.info(f"Saved example lengths to {lengths_cache}")
+
+    if dataset.data_ids == all_ids:
+        return lengths
+    # Filtered and/or sorted dataset
+    id_to_index = {data_id: index for index, data_id in enumerate(all_ids)}
+    return lengths[[id_to_index[data_id] for data_id in dataset.data_ids]]
+
+
+def _pack_sorted(
+    lengths,
+    max_padded_length,
+    max_batch_ex=None,
+    targets=None,
+    max_padded_target_length=None,
+):
+    """Splits examples sorted by length into batches of consecutive examples.
+
+    Minimizes the number of batches that fit the budgets and, among those
+    splits, the padding. Returns the batch boundaries.
+
+    With count[j] the fewest batches for the first j examples, and lo[j] the
+    first example of the largest feasible batch ending at j, count[j] =
+    count[lo[j]] + 1. As lo is nondecreasing, the examples with count == k
+    form an interval, so the padding is optimized one interval at a time
+    (vectorized over all the pairs of ends in two consecutive intervals).
+
+    Example
+    -------
+    >>> _pack_sorted(np.array([1, 2, 2, 3, 5]), 6)
+    [0, 3, 4, 5]
+    """
+    num_examples = len(lengths)
+    if num_examples == 0:
+        return [0]
+    ends = np.arange(1, num_examples + 1)
+    limit = num_examples if max_batch_ex is None else max_batch_ex
+    with np.errstate(divide="ignore"):
+        sizes = np.floor(max_padded_length / lengths)
+    sizes = np.clip(np.minimum(sizes, limit), 1, None).astype(np.int64)
+    lo = np.maximum.accumulate(np.maximum(ends - sizes, 0))
+    if targets is not None:
+        lo = np.maximum(lo, _target_lo(targets, max_padded_target_length))
+
+    cumsum = np.concatenate([[0], np.cumsum(lengths, dtype=np.float64)])
+    padding = np.zeros(num_examples + 1)
+    back = np.zeros(num_examples + 1, dtype=np.int64)
+    prev = np.arange(1)  # Ends reachable with the fewest (zero) batches
+    while prev[-1] < num_examples:
+        last = np.searchsorted(lo, prev[-1], side="right")
+        current = np.arange(prev[-1] + 1, last + 1)
+        max_len = lengths[current - 1]
+        # padding of [i, j) = j * max_len - i * max_len - (cumsum[j] - cumsum[i])
+        cost = padding[prev] + cumsum[prev] - prev * max_len[:, None]
+        cost[prev[None, :] < lo[current - 1][:, None]] = np.inf
+        best = np.argmin(cost, axis=1)
+        back[current] = prev[best]
+        padding[current] = (
+            cost[np.arange(len(current)), best]
+            + current * max_len
+            - cumsum[current]
+        )
+        prev = current
+
+    bounds = [num_examples]
+    while bounds[-1] > 0:
+        bounds.append(int(back[bounds[-1]]))
+    return bounds[::-1]
+
+
+def _target_lo(targets, max_padded_target_length):
+    """For each end j, the first example of the largest batch ending at j
+    whose padded target length fits the budget (sliding window maximum)."""
+    targets = targets.tolist()
+    lo = np.empty(len(targets), dtype=np.int64)
+    window_max = collections.deque()
+    begin = 0
+    for end, target in enumerate(targets):
+        while window_max and targets[window_max[-1]] <= target:
+            window_max.pop()
+        window_max.append(end)
+        while (
+            begin < end
+            and (end - begin + 1) * targets[window_max[0]]
+            > max_padded_target_length
+        ):
+            begin += 1
+            if window_max[0] < begin:
+                window_max.popleft()
+        lo[end] = begin
+    return lo
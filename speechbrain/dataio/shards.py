@@ -0,0 +1,405 @@
+"""Sharded datasets for sequential reading of large corpora.
+
+Reading millions of small audio files in random order puts a heavy metadata
+and seek load on (network) filesystems. Instead, the data points can be
+packed into a few large tar shards, which are then read sequentially.
+
+The ShardWriter packs data points (annotations and files) into shards and
+writes an index. The ShardedDynamicItemDataset streams the shards and applies
+dynamic items just like the DynamicItemDataset. Randomization is done by
+shuffling the order of the shards, and by shuffling the data points in an
+in-memory buffer.
+
+Audio files are stored as they are (their encoded bytes), and
+`speechbrain.dataio.dataio.read_audio` accepts those bytes, so the same
+audio pipelines can be used.
+
+Example
+-------
+>>> import torch
+>>> from speechbrain.dataio.dataio import write_audio, read_audio
+>>> tmpdir = getfixture("tmpdir")
+>>> data = {}
+>>> for i in range(10):
+...     path = str(tmpdir / f"utt{i}.wav")
+...     write_audio(path, torch.full((100 + i,), i / 10), 16000)
+...     data[f"utt{i}"] = {"wav": path, "spk": f"spk{i % 2}"}
+>>> index = write_shards(data, tmpdir / "shards", ["wav"], max_items=4)
+>>> dataset = ShardedDynamicItemDataset(
+...     tmpdir / "shards",
+...     dynamic_items=[
+...         {"func": read_audio, "takes": "wav", "provides": "sig"}
+...     ],
+...     output_keys=["id", "spk", "sig"],
+... )
+>>> data_point = next(iter(dataset))
+>>> data_point["id"], data_point["spk"], data_point["sig"].shape
+('utt0', 'spk0', torch.Size([100]))
+>>> len(list(dataset))
+10
+"""
+import io
+import os
+import json
+import random
+import tarfile
+import logging
+import torch
+import torchaudio
+from torch.utils.data import IterableDataset, get_worker_info
+from speechbrain.utils.data_pipeline import DataPipeline
+from speechbrain.dataio.dataio import read_audio
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+
+
+class ShardWriter:
+    """Packs data points into tar shards, and writes an index of the shards.
+
+    Each data point is stored as a JSON member with the annotations, followed
+    by one member for each file. A new shard is started when the current one
+    has max_items data points, or is larger than max_size_mb. The index
+    (index.json in the shard directory) is written when the writer is closed.
+
+    Arguments
+    ---------
+    shard_dir : str
+        The directory where to write the shards.
+    max_items : int, None
+        Maximum number of data points in a shard.
+    max_size_mb : float, None
+        Start a new shard when the current one grows over this size.
+    prefix : str
+        Prefix for the shard file names.
+
+    Example
+    -------
+    >>> shard_dir = getfixture("tmpdir") / "shards"
+    >>> with ShardWriter(shard_dir, max_items=2) as writer:
+    ...     for i in range(3):
+    ...         writer.write(f"utt{i}", {"text": "hi"}, {"wav": b"RIFF..."})
+    >>> writer.index["num_items"], len(writer.index["shards"])
+    (3, 2)
+    """
+
+    def __init__(
+        self, shard_dir, max_items=1000, max_size_mb=1000.0, prefix="shard"
+    ):
+        self.shard_dir = str(shard_dir)
+        self.max_items = max_items
+        self.max_size = None
+        if max_size_mb is not None:
+            self.max_size = max_size_mb * 1024 * 1024
+        self.prefix = prefix
+        self.index = {
+            "num_items": 0,
+            "data_keys": None,
+            "file_keys": None,
+            "shards": [],
+        }
+        self._tar = None
+        self._shard_items = 0
+        os.makedirs(self.shard_dir, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, data_id, data_point, files={}):
+        """Adds a data point to the current shard.
+
+        Arguments
+        ---------
+        data_id : str
+            The id of the data point.
+        data_point : dict
+            The annotations, must be JSON serializable.
+        files : dict
+            Maps keys to the contents (bytes) of the files, or to the paths
+            of the files to store.
+        """
+        data_keys = sorted(data_point.keys())
+        file_keys = sorted(files.keys())
+        if "id" in data_keys or "id" in file_keys:
+            raise ValueError("The key 'id' is reserved for the data point id.")
+        if self.index["data_keys"] is None:
+            self.index["data_keys"] = data_keys
+            self.index["file_keys"] = file_keys
+        elif (
+            data_keys != self.index["data_keys"]
+            or file_keys != self.index["file_keys"]
+        ):
+            raise ValueError(
+                f"Data point {data_id} has different keys than the others"
+            )
+        if self._tar is None:
+            self._open_shard()
+        name = f"{self._shard_items:08d}"
+        header = {"id": data_id, "data": data_point, "files": file_keys}
+        self._add_member(f"{name}.json", json.dumps(header).encode("utf-8"))
+        for key in file_keys:
+            contents = files[key]
+            if not isinstance(contents, bytes):
+                with open(contents, "rb") as fi:
+                    contents = fi.read()
+            self._add_member(f"{name}.{key}", contents)
+        self._shard_items += 1
+        self.index["num_items"] += 1
+        self.index["shards"][-1]["num_items"] += 1
+        full_items = (
+            self.max_items is not None and self._shard_items >= self.max_items
+        )
+        full_size = (
+            self.max_size is not None and self._tar.offset >= self.max_size
+        )
+        if full_items or full_size:
+            self._close_shard()
+
+    def close(self):
+        """Closes the last shard and writes the index."""
+        self._close_shard()
+        with open(os.path.join(self.shard_dir, INDEX_FILE), "w") as fo:
+            json.dump(self.index, fo, indent=1)
+
+    def _open_shard(self):
+        shard_name = f"{self.prefix}-{len(self.index['shards']):06d}.tar"
+        self._tar = tarfile.open(os.path.join(self.shard_dir, shard_name), "w")
+        self._shard_items = 0
+        self.index["shards"].append({"path": shard_name, "num_items": 0})
+
+    def _close_shard(self):
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+
+    def _add_member(self, name, contents):
+        info = tarfile.TarInfo(name)
+        info.size = len(contents)
+        self._tar.addfile(info, io.BytesIO(contents))
+
+
+def write_shards(
+    data,
+    shard_dir,
+    file_keys=[],
+    shuffle=False,
+    seed=563375142,
+    **writer_kwargs,
+):
+    """Packs the data of a DynamicItemDataset into shards.
+
+    Arguments
+    ---------
+    data : dict
+        The data points by id, e.g. from `load_data_json` or `load_data_csv`.
+    shard_dir : str
+        The directory where to write the shards.
+    file_keys : list
+        The keys of the items which are files to pack into the shards.
+        The value can be a path, or a dict in the format of `read_audio` to
+        store an audio segment (as a wav file).
+    shuffle : bool
+        Whether to shuffle the data points before packing. This helps the
+        shard and buffer shuffling of ShardedDynamicItemDataset, e.g. if the
+        data is sorted by speaker.
+    seed : int
+        The seed for shuffling.
+    **writer_kwargs : dict
+        Arguments for the ShardWriter.
+
+    Returns
+    -------
+    dict
+        The index of the shards.
+    """
+    data_ids = list(data.keys())
+    if shuffle:
+        random.Random(seed).shuffle(data_ids)
+    with ShardWriter(shard_dir, **writer_kwargs) as writer:
+        for data_id in data_ids:
+            data_point = dict(data[data_id])
+            files = {key: data_point.pop(key) for key in file_keys}
+            for key, value in files.items():
+                if isinstance(value, dict):
+                    files[key] = _encode_segment(value)
+            writer.write(data_id, data_point, files)
+    return writer.index
+
+
+def _encode_segment(waveforms_obj):
+    """Reads an audio segment, returns it encoded as wav file bytes."""
+    audio = read_audio(waveforms_obj)
+    sample_rate = torchaudio.info(waveforms_obj["file"]).sample_rate
+    if audio.dim() == 1:
+        audio = audio.unsqueeze(1)
+    buffer = io.BytesIO()
+    torchaudio.save(buffer, audio.transpose(0, 1), sample_rate, format="wav")
+    return buffer.getvalue()
+
+
+class ShardedDynamicItemDataset(IterableDataset):
+    """Streams data points from the shards written by ShardWriter.
+
+    The data points have the annotations and the files (as bytes) of the
+    shards as static items, and the data point id with the key "id". The
+    dynamic items and output keys work as in DynamicItemDataset.
+
+    Each DDP process reads a separate subset of the shards, and so does each
+    DataLoader worker. The shards are split evenly between the DDP
+    processes, dropping the remainder, but the last shard is usually
+    smaller. To have exactly the same number of batches in each process,
+    use the dataset with a looped DataLoader (see `make_dataloader`
+    looped_nominal_epoch).
+
+    The order of the shards (with shuffling) and the dropped shards
+    (rotated, so that all the shards are read over the epochs) change every
+    epoch, so call set_epoch before each epoch. Brain.fit does that if the
+    dataset is the one of its train DataLoader.
+
+    Arguments
+    ---------
+    shard_dir : str
+        The directory with the shards and their index.
+    dynamic_items : list
+        Configuration for the dynamic items, see DynamicItemDataset.
+    output_keys : dict, list
+        The keys to include in the output, see DynamicItemDataset.
+    shuffle_shards : bool
+        Whether to shuffle the order of the shards (every epoch).
+    shuffle_buffer : int
+        If > 0, the data points are shuffled in a buffer of this size.
+        A larger buffer gives more randomness but takes more memory.
+    seed : int
+        The seed for shuffling.
+    split_by_rank : bool
+        Whether each DDP process should read a different subset of shards.
+    split_by_worker : bool
+        Whether each DataLoader worker should read a different subset of
+        shards. Otherwise each worker reads all the data.
+    """
+
+    def __init__(
+        self,
+        shard_dir,
+        dynamic_items=[],
+        output_keys=[],
+        shuffle_shards=False,
+        shuffle_buffer=0,
+        seed=563375142,
+        split_by_rank=True,
+        split_by_worker=True,
+    ):
+        self.shard_dir = str(shard_dir)
+        with open(os.path.join(self.shard_dir, INDEX_FILE)) as fi:
+            self.index = json.load(fi)
+        self.shuffle_shards = shuffle_shards
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.split_by_rank = split_by_rank
+        self.split_by_worker = split_by_worker
+        self.epoch = 0
+        static_keys = self.index["data_keys"] + self.index["file_keys"]
+        self.pipeline = DataPipeline(static_keys + ["id"], dynamic_items)
+        self.set_output_keys(output_keys)
+
+    def set_epoch(self, epoch):
+        """You can also just set attribute ``epoch`` directly."""
+        self.epoch = epoch
+
+    def add_dynamic_item(self, func, takes=None, provides=None):
+        """Makes a new dynamic item available on the dataset.
+
+        See `DynamicItemDataset.add_dynamic_item`.
+        """
+        self.pipeline.add_dynamic_item(func, takes, provides)
+
+    def set_output_keys(self, keys):
+        """Use this to change the output keys.
+
+        See `DynamicItemDataset.set_output_keys`.
+        """
+        self.pipeline.set_output_keys(keys)
+
+    def get_shards(self):
+        """Returns the paths of the shards for this process (and worker)."""
+        shards = [shard["path"] for shard in self.index["shards"]]
+        if self.shuffle_shards:
+            # Same seed in all processes, so that the splits are disjoint.
+            random.Random(self.seed + self.epoch).shuffle(shards)
+        if self.split_by_rank:
+            rank, world_size = _get_rank_and_world_size()
+            if len(shards) < world_size:
+                raise ValueError(
+                    f"Only {len(shards)} shards for {world_size} processes"
+                )
+            # Rotate the shards so that different ones are dropped each epoch
+            num_shards = len(shards) // world_size * world_size
+            shift = self.epoch * (len(shards) - num_shards) % len(shards)
+            shards = shards[shift:] + shards[:shift]
+            shards = shards[rank:num_shards:world_size]
+        worker_info = get_worker_info()
+        if self.split_by_worker and worker_info is not None:
+            if len(shards) < worker_info.num_workers:
+                logger.warning(
+                    f"Only {len(shards)} shards for {worker_info.num_workers} "
+                    "DataLoader workers, some workers will be idle."
+                )
+            shards = shards[worker_info.id :: worker_info.num_workers]
+        return [os.path.join(self.shard_dir, shard) for shard in shards]
+
+    def __iter__(self):
+        data_points = self._iter_data_points(self.get_shards())
+        if self.shuffle_buffer > 0:
+            rank, _ = _get_rank_and_world_size()
+            worker_info = get_worker_info()
+            worker_id = 0 if worker_info is None else worker_info.id
+            rng = random.Random(f"{self.seed}-{self.epoch}-{rank}-{worker_id}")
+            data_points = _buffered_shuffle(
+                data_points, self.shuffle_buffer, rng
+            )
+        for data_point in data_points:
+            yield self.pipeline.compute_outputs(data_point)
+
+    @staticmethod
+    def _iter_data_points(shards):
+        """Reads the data points sequentially from the shards."""
+        for shard in shards:
+            # Stream mode: a single sequential read of the shard.
+            with tarfile.open(shard, "r|") as tar:
+                data_point = None
+                for member in tar:
+                    contents = tar.extractfile(member).read()
+                    if member.name.endswith(".json"):
+                        header = json.loads(contents.decode("utf-8"))
+                        data_point = {"id": header["id"], **header["data"]}
+                        remaining_files = len(header["files"])
+                    else:
+                        key = member.name.split(".", 1)[1]
+                        data_point[key] = contents
+                        remaining_files -= 1
+                    if remaining_files == 0:
+                        yield data_point
+
+
+def _buffered_shuffle(iterable, buffer_size, rng):
+    """Shuffles the items from iterable in a buffer of limited size."""
+    buffer = []
+    for item in iterable:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+            continue
+        index = rng.randrange(buffer_size)
+        yield buffer[index]
+        buffer[index] = item
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+def _get_rank_and_world_size():
+    if torch.distributed.is_available() and torch.distributed.is_initialized():
+        return torch.distributed.get_rank(), torch.distributed.get_world_size()
+    return 0, 1
@@ -5,9 +5,14 @@ Authors
  * Aku Rouhe 2020
  * Sung-Lin Yeh 2020
 """
+import math
 import torch
 from itertools import groupby
 from speechbrain.dataio.dataio import length_to_mask
+from speechbrain.lm.arpa import read_arpa
+from speechbrain.lm.ngram import BackoffNgramLM, CompiledNgramLM
+
+NEGINFINITY = float("-inf")
 
 
 class CTCPrefixScorer:
@@ -374,3 +379,342 @@ def ctc_greedy_decode(probabilities, seq_lens, blank_id=-1):
         out = filter_ctc_output(predictions.tolist(), blank_id=blank_id)
         batch_outputs.append(out)
     return batch_outputs
+
+
+class CTCPrefixBeamSearcher:
+    """Standalone CTC prefix beam search with optional N-gram shallow fusion.
+
+    This implements the prefix beam search of Hannun et al.
+    (https://arxiv.org/abs/1408.2873). Each hypothesis (prefix) keeps the
+    probability of ending in blank and of ending in non-blank, so that
+    the different alignments of the same prefix are merged. The score of
+    a prefix is its CTC log-probability plus, if an LM is given,
+    ``lm_weight * log P_LM(prefix) + insertion_bonus * num_units``.
+    The LM units are either the tokens (lm_mode="token") or the words
+    (lm_mode="word"), in which case a word is scored when the next one
+    starts, and the last word at the end of the utterance.
+
+    To keep it fast, only the token_topk most likely tokens of each frame
+    are considered, and after each frame only the beam_size best prefixes
+    with a score within beam_prune_logp of the best one are kept.
+
+    Arguments
+    ---------
+    blank_index : int
+        The index of the blank token.
+    beam_size : int
+        The maximum number of prefixes kept after each frame.
+    token_topk : int
+        The number of most likely tokens considered at each frame.
+        If None, all the tokens are considered.
+    beam_prune_logp : float
+        Prefixes whose score is lower than the best score plus this value
+        are pruned (default: -10.0).
+    lm : BackoffNgramLM, CompiledNgramLM or str
+        An N-gram LM, or the path to an ARPA file or a saved
+        CompiledNgramLM to load one from. If None, no LM fusion is done.
+    lm_weight : float
+        The weight of the LM log-probabilities (default: 0.5).
+    insertion_bonus : float
+        A bonus added for each LM unit (word or token), to counter the
+        bias of the LM towards short hypotheses (default: 0.0).
+    lm_mode : str
+        "word" to query the LM with words, "token" to query it with
+        the tokens themselves (default: "word").
+    vocab_list : list
+        The string of each token index. Needed for LM fusion.
+    space_token : str
+        In word mode, a token whose string starts with space_token starts
+        a new word, e.g., the sentencepiece "▁" (default) or " " for
+        characters. The space_token itself is not part of the word.
+    unk_logprob : float
+        The LM log-probability (natural log) used for units that the LM
+        does not know (default: -10.0).
+    lm_logbase : float
+        The base of the LM log-probabilities, 10.0 for ARPA models
+        (default: 10.0).
+
+    Example
+    -------
+    >>> from speechbrain.lm.ngram import BackoffNgramLM, CompiledNgramLM
+    >>> probs = torch.tensor([[[0.1, 0.8, 0.1], [0.6, 0.2, 0.2],
+    ...                        [0.1, 0.1, 0.8], [0.9, 0.05, 0.05]]])
+    >>> lens = torch.tensor([1.0])
+    >>> searcher = CTCPrefixBeamSearcher(blank_index=0, beam_size=4)
+    >>> searcher(torch.log(probs), lens)
+    [[1, 2]]
+    >>> # Acoustically ambiguous, but the word LM prefers "b a":
+    >>> probs = torch.tensor([[[0.0, 0.5, 0.5], [1.0, 0.0, 0.0],
+    ...                        [0.0, 0.5, 0.5]]])
+    >>> ngrams = {1: {tuple(): {"a": -1.0, "b": -1.0, "</s>": -1.0}},
+    ...           2: {("<s>",): {"b": -0.1}, ("b",): {"a": -0.1},
+    ...               ("a",): {"</s>": -0.1}}}
+    >>> lm = BackoffNgramLM(ngrams, {1: {}})
+    >>> searcher = CTCPrefixBeamSearcher(
+    ...     blank_index=0, beam_size=4, lm=lm, lm_weight=1.0,
+    ...     vocab_list=["<blank>", "▁a", "▁b"]
+    ... )
+    >>> searcher(torch.log(probs), lens)
+    [[2, 1]]
+    """
+
+    def __init__(
+        self,
+        blank_index,
+        beam_size=10,
+        token_topk=10,
+        beam_prune_logp=-10.0,
+        lm=None,
+        lm_weight=0.5,
+        insertion_bonus=0.0,
+        lm_mode="word",
+        vocab_list=None,
+        space_token="▁",
+        unk_logprob=-10.0,
+        lm_logbase=10.0,
+    ):
+        if lm_mode not in ["word", "token"]:
+            raise ValueError("lm_mode must be 'word' or 'token'")
+        if isinstance(lm, str):
+            with open(lm, "rb") as fin:
+                magic = fin.read(len(CompiledNgramLM.MAGIC))
+            if magic == CompiledNgramLM.MAGIC:
+                lm = CompiledNgramLM.load(lm)
+            else:
+                with open(lm) as fin:
+                    _, ngrams, backoffs = read_arpa(fin)
+                lm = BackoffNgramLM(ngrams, backoffs)
+
+        self.blank_index = blank_index
+        self.beam_size = beam_size
+        self.token_topk = token_topk
+        self.beam_prune_logp = beam_prune_logp
+        self.lm = lm
+        self.lm_weight = lm_weight
+        self.insertion_bonus = insertion_bonus
+        self.lm_mode = lm_mode
+        self.vocab_list = vocab_list
+        self.space_token = space_token
+        self.unk_logprob = unk_logprob
+        self.lm_scale = math.log(lm_logbase)
+
+    def __call__(self, log_probs, seq_lens):
+        """Decodes a batch and returns the best hypothesis of each utterance.
+
+        Arguments
+        ---------
+        log_probs : torch.Tensor
+            The CTC log-probabilities, shape [batch, time, vocab].
+        seq_lens : torch.Tensor
+            Relative true sequence lengths, shape [batch].
+
+        Returns
+        -------
+        list
+            The token ids of the best hypothesis of each utterance.
+        """
+        return [beams[0][0] for beams in self.decode_beams(log_probs, seq_lens)]
+
+    def decode_beams(self, log_probs, seq_lens):
+        """Decodes a batch and returns the final beams of each utterance.
+
+        Arguments
+        ---------
+        log_probs : torch.Tensor
+            The CTC log-probabilities, shape [batch, time, vocab].
+        seq_lens : torch.Tensor
+            Relative true sequence lengths, shape [batch].
+
+        Returns
+        -------
+        list
+            For each utterance, a list of (token ids, score) tuples sorted
+            from the best to the worst score.
+        """
+        if self.lm is not None and self.vocab_list is None:
+            raise ValueError("vocab_list is needed for LM fusion.")
+
+        batch_max_len = log_probs.shape[1]
+        abs_lens = torch.round(seq_lens * batch_max_len).int().tolist()
+
+        # Pre-prune the tokens of every frame at once, on the device,
+        # and move only the candidates to the host.
+        if (
+            self.token_topk is not None
+            and self.token_topk < log_probs.shape[-1]
+        ):
+            frame_logps, frame_tokens = log_probs.topk(self.token_topk, dim=-1)
+        else:
+            frame_logps, frame_tokens = log_probs.sort(dim=-1, descending=True)
+        frame_logps = frame_logps.detach().cpu().tolist()
+        frame_tokens = frame_tokens.cpu().tolist()
+
+        return [
+            self._decode_utterance(
+                frame_logps[i][: abs_lens[i]], frame_tokens[i][: abs_lens[i]]
+            )
+            for i in range(len(abs_lens))
+        ]
+
+    def _decode_utterance(self, frame_logps, frame_tokens):
+        """Runs the prefix beam search over the frames of one utterance."""
+        # prefix -> [log P(prefix, ends in blank), log P(prefix, ends in non-blank)]
+        beams = {tuple(): [0.0, NEGINFINITY]}
+        # prefix -> (weighted LM score, LM context, partial word)
+        lm_states = {tuple(): (0.0, ("<s>",), "")}
+
+        for logps, tokens in zip(frame_logps, frame_tokens):
+            next_beams = {}
+            # new prefix -> (prefix, token), for the new LM states
+            extensions = {}
+            for prefix, (p_b, p_nb) in beams.items():
+                p_prefix = _log_add(p_b, p_nb)
+                last = prefix[-1] if prefix else None
+                for logp, token in zip(logps, tokens):
+                    if token == self.blank_index:
+                        probs = next_beams.setdefault(
+                            prefix, [NEGINFINITY, NEGINFINITY]
+                        )
+                        probs[0] = _log_add(probs[0], p_prefix + logp)
+                        continue
+
+                    new_prefix = prefix + (token,)
+                    probs = next_beams.setdefault(
+                        new_prefix, [NEGINFINITY, NEGINFINITY]
+                    )
+                    if token == last:
+                        # A repeated token needs a blank in between,
+                        # otherwise it collapses into the same prefix.
+                        probs[1] = _log_add(probs[1], p_b + logp)
+                        same = next_beams.setdefault(
+                            prefix, [NEGINFINITY, NEGINFINITY]
+                        )
+                        same[1] = _log_add(same[1], p_nb + logp)
+                    else:
+                        probs[1] = _log_add(probs[1], p_prefix + logp)
+
+                    if self.lm is not None and new_prefix not in lm_states:
+                        extensions[new_prefix] = (prefix, token)
+
+            if extensions:
+                self._extend_lm_states(lm_states, extensions)
+            beams = self._prune(next_beams, lm_states)
+            if self.lm is not None:
+                # Forget the LM states of the pruned prefixes
+                lm_states = {prefix: lm_states[prefix] for prefix in beams}
+
+        # Score the end of the utterance with the LM.
+        final_scores = {
+            prefix: _log_add(p_b, p_nb) for prefix, (p_b, p_nb) in beams.items()
+        }
+        if self.lm is not None:
+            lm_scores = self._final_lm_scores([lm_states[p] for p in beams])
+            for prefix, lm_score in zip(beams, lm_scores):
+                final_scores[prefix] += lm_score
+        ranked = sorted(final_scores.items(), key=lambda x: x[1], reverse=True)
+        return [(list(prefix), score) for prefix, score in ranked]
+
+    def _prune(self, beams, lm_states):
+        """Keeps the beam_size best prefixes within beam_prune_logp."""
+        scores = {}
+        for prefix, (p_b, p_nb) in beams.items():
+            scores[prefix] = _log_add(p_b, p_nb)
+            if self.lm is not None:
+                scores[prefix] += lm_states[prefix][0]
+        ranked = sorted(scores, key=scores.get, reverse=True)[: self.beam_size]
+        threshold = scores[ranked[0]] + self.beam_prune_logp
+        return {p: beams[p] for p in ranked if scores[p] >= threshold}
+
+    def _lm_unit_logprobs(self, units, contexts):
+        """LM log-probabilities of units in their contexts, converted to
+        natural log, or unk_logprob for the units that the LM does not know.
+        The queries are scored at once if the LM has batch_logprob."""
+        if not units:
+            return []
+        if hasattr(self.lm, "batch_logprob"):
+            logprobs = self.lm.batch_logprob(units, contexts).tolist()
+        else:
+            logprobs = [
+                self.lm.logprob(unit, context)
+                for unit, context in zip(units, contexts)
+            ]
+        return [
+            self.unk_logprob
+            if logprob == NEGINFINITY
+            else logprob * self.lm_scale
+            for logprob in logprobs
+        ]
+
+    def _push_context(self, context, unit):
+        """Appends a unit to an LM context, keeping only what can be used."""
+        if self.lm.top_order == 1:
+            return tuple()
+        return (context + (unit,))[-(self.lm.top_order - 1) :]
+
+    def _extend_lm_states(self, lm_states, extensions):
+        """Adds the LM states of the prefixes extended by a token. The LM
+        units that they complete are scored with one batched query.
+
+        Arguments
+        ---------
+        lm_states : dict
+            Maps the prefixes to their LM state, updated in place.
+        extensions : dict
+            Maps each new prefix to the (prefix, token) it extends.
+        """
+        new_states = {}
+        units, contexts = [], []
+        for new_prefix, (prefix, token) in extensions.items():
+            score, context, word = lm_states[prefix]
+            piece = self.vocab_list[token]
+            unit = None
+            if self.lm_mode == "token":
+                unit = piece
+            elif piece.startswith(self.space_token):
+                # The previous word is complete
+                unit = word or None
+                word = piece[len(self.space_token) :]
+            else:
+                word = word + piece
+            if unit is not None:
+                units.append(unit)
+                contexts.append(context)
+            new_states[new_prefix] = (score, context, word, unit)
+
+        logprobs = iter(self._lm_unit_logprobs(units, contexts))
+        for new_prefix, (score, context, word, unit) in new_states.items():
+            if unit is not None:
+                score += self.lm_weight * next(logprobs) + self.insertion_bonus
+                context = self._push_context(context, unit)
+            lm_states[new_prefix] = (score, context, word)
+
+    def _final_lm_scores(self, lm_states):
+        """The LM scores of prefixes (given by their LM states) including
+        their last word and the end of sentence."""
+        units, contexts = [], []
+        for _, context, word in lm_states:
+            if word:
+                units.append(word)
+                contexts.append(context)
+                context = self._push_context(context, word)
+            units.append("</s>")
+            contexts.append(context)
+
+        logprobs = iter(self._lm_unit_logprobs(units, contexts))
+        scores = []
+        for score, _, word in lm_states:
+            if word:
+                score += self.lm_weight * next(logprobs) + self.insertion_bonus
+            scores.append(score + self.lm_weight * next(logprobs))
+        return scores
+
+
+def _log_add(a, b):
+    """Computes log(exp(a) + exp(b)) on Python floats."""
+    if a == NEGINFINITY:
+        return b
+    if b == NEGINFINITY:
+        return a
+    if a > b:
+        return a + math.log1p(math.exp(b - a))
+    return b + math.log1p(math.exp(a - b))
@@ -1233,15 +1233,23 @@ class S2SRNNBeamSearchTransformerLM(S2SRNNBeamSearcher):
 
     def lm_forward_step(self, inp_tokens, memory):
         """Performs a step in the LM during beamsearch."""
-        memory = _update_mem(inp_tokens, memory)
         if not next(self.lm.parameters()).is_cuda:
             self.lm.to(inp_tokens.device)
+        if hasattr(self.lm, "forward_step"):
+            # the memory is the cache of the incremental LM
+            logits, memory = self.lm.forward_step(inp_tokens, memory)
+            log_probs = self.softmax(logits / self.temperature_lm)
+            return log_probs, memory
+
+        memory = _update_mem(inp_tokens, memory)
         logits = self.lm(memory)
         log_probs = self.softmax(logits / self.temperature_lm)
         return log_probs[:, -1, :], memory
 
     def permute_lm_mem(self, memory, index):
         """Permutes the LM ,emory during beamsearch"""
+        if isinstance(memory, dict):
+            return _permute_cache(memory, index)
         memory = torch.index_select(memory, dim=0, index=index)
         return memory
 
@@ -1331,6 +1339,37 @@ def _update_mem(inp_tokens, memory):
     return torch.cat([memory, inp_tokens.unsqueeze(1)], dim=-1)
 
 
+def _permute_cache(cache, index):
+    """This function reorders, in place, the tensors of a cache returned by
+    an incremental (e.g., transformer) model along the batch dimension.
+
+    Arguments
+    ---------
+    cache : dict
+        The cache, possibly containing lists and tuples of tensors.
+    index : torch.Tensor
+        The index of the previous path.
+
+    Example
+    -------
+    >>> cache = {"kv": [(torch.arange(3), torch.arange(3))]}
+    >>> cache = _permute_cache(cache, torch.tensor([2, 2, 0]))
+    >>> cache["kv"][0][0]
+    tensor([2, 2, 0])
+    """
+
+    def _permute(item):
+        if isinstance(item, torch.Tensor):
+            return torch.index_select(item, dim=0, index=index)
+        if isinstance(item, (list, tuple)):
+            return type(item)(_permute(i) for i in item)
+        return item
+
+    for key, value in cache.items():
+        cache[key] = _permute(value)
+    return cache
+
+
 class S2STransformerBeamSearch(S2SBeamSearcher):
     """This class implements the beam search decoding
     for Transformer.
@@ -1342,6 +1381,13 @@ class S2STransformerBeamSearch(S2SBeamSearcher):
         The model to use for decoding.
     linear : torch.nn.Module
         A linear output layer.
+    use_kv_cache : bool
+        If True, the model is decoded incrementally with its decode_step
+        method: only the newest token is processed at each step, while the
+        self-attention keys/values of the previous tokens and the
+        projections of the encoder states are cached (default: False).
+        The attention returned at each step is then the one of the newest
+        token only, shape (batch, src_len).
     **kwargs
         Arguments to pass to S2SBeamSearcher
 
@@ -1351,7 +1397,12 @@ class S2STransformerBeamSearch(S2SBeamSearcher):
     """
 
     def __init__(
-        self, modules, temperature=1.0, temperature_lm=1.0, **kwargs,
+        self,
+        modules,
+        temperature=1.0,
+        temperature_lm=1.0,
+        use_kv_cache=False,
+        **kwargs,
     ):
         super(S2STransformerBeamSearch, self).__init__(**kwargs)
 
@@ -1362,6 +1413,7 @@ class S2STransformerBeamSearch(S2SBeamSearcher):
 
         self.temperature = temperature
         self.temperature_lm = temperature_lm
+        self.use_kv_cache = use_kv_cache
 
     def reset_mem(self, batch_size, device):
         """Needed to reset the memory during beamsearch."""
@@ -1373,16 +1425,37 @@ class S2STransformerBeamSearch(S2SBeamSearcher):
 
     def permute_mem(self, memory, index):
         """Permutes the memory."""
+        if self.use_kv_cache:
+            # The projected encoder states ("cross_attn") are the same for
+            # all the beams of an utterance, so only the self-attention
+            # keys/values have to follow the beams.
+            memory["self_attn"] = [
+                (
+                    torch.index_select(key, dim=0, index=index),
+                    torch.index_select(value, dim=0, index=index),
+                )
+                for key, value in memory["self_attn"]
+            ]
+            return memory
         memory = torch.index_select(memory, dim=0, index=index)
         return memory
 
     def permute_lm_mem(self, memory, index):
         """Permutes the memory of the language model."""
+        if isinstance(memory, dict):
+            return _permute_cache(memory, index)
         memory = torch.index_select(memory, dim=0, index=index)
         return memory
 
     def forward_step(self, inp_tokens, memory, enc_states, enc_lens):
         """Performs a step in the implemented beamsearcher."""
+        if self.use_kv_cache:
+            pred, attn, memory = self.model.decode_step(
+                inp_tokens, enc_states, memory
+            )
+            prob_dist = self.softmax(self.fc(pred) / self.temperature)
+            return prob_dist[:, -1, :], memory, attn
+
         memory = _update_mem(inp_tokens, memory)
         pred, attn = self.model.decode(memory, enc_states)
         prob_dist = self.softmax(self.fc(pred) / self.temperature)
@@ -1390,9 +1463,15 @@ class S2STransformerBeamSearch(S2SBeamSearcher):
 
     def lm_forward_step(self, inp_tokens, memory):
         """Performs a step in the implemented LM module."""
-        memory = _update_mem(inp_tokens, memory)
         if not next(self.lm_modules.parameters()).is_cuda:
             self.lm_modules.to(inp_tokens.device)
+        if hasattr(self.lm_modules, "forward_step"):
+            # the memory is the cache of the incremental LM
+            logits, memory = self.lm_modules.forward_step(inp_tokens, memory)
+            log_probs = self.softmax(logits / self.temperature_lm)
+            return log_probs, memory
+
+        memory = _update_mem(inp_tokens, memory)
         logits = self.lm_modules(memory)
         log_probs = self.softmax(logits / self.temperature_lm)
         return log_probs[:, -1, :], memory
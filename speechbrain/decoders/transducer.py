@@ -40,6 +40,13 @@ class TransducerBeamSearcher(torch.nn.Module):
         that are added in A (process_hyp).
         Reference: https://arxiv.org/pdf/1911.01629.pdf
         Reference: https://github.com/kaldi-asr/kaldi/blob/master/src/decoder/simple-decoder.cc (See PruneToks)
+    max_symbols_per_step : int
+        The maximum number of symbols emitted at each time step by the
+        greedy search. (default: 1)
+    modified_beam_search : bool
+        Use the batched modified beam search, which emits at most one symbol
+        per time step, instead of the beam search of
+        https://arxiv.org/pdf/1911.01629.pdf. (default: False)
 
     Example
     -------
@@ -95,6 +102,8 @@ class TransducerBeamSearcher(torch.nn.Module):
         lm_weight=0.0,
         state_beam=2.3,
         expand_beam=2.3,
+        max_symbols_per_step=1,
+        modified_beam_search=False,
     ):
         super(TransducerBeamSearcher, self).__init__()
         self.decode_network_lst = decode_network_lst
@@ -111,10 +120,14 @@ class TransducerBeamSearcher(torch.nn.Module):
 
         self.state_beam = state_beam
         self.expand_beam = expand_beam
+        self.max_symbols_per_step = max_symbols_per_step
+        self.modified_beam_search = modified_beam_search
         self.softmax = torch.nn.LogSoftmax(dim=-1)
 
         if self.beam_size <= 1:
             self.searcher = self.transducer_greedy_decode
+        elif self.modified_beam_search:
+            self.searcher = self.transducer_modified_beam_search_decode
         else:
             self.searcher = self.transducer_beam_search_decode
 
@@ -137,10 +150,16 @@ class TransducerBeamSearcher(torch.nn.Module):
     def transducer_greedy_decode(self, tn_output):
         """Transducer greedy decoder is a greedy decoder over batch which apply Transducer rules:
             1- for each time step in the Transcription Network (TN) output:
-                -> Update the ith utterance only if
-                    the previous target != the new one (we save the hiddens and the target)
-                -> otherwise:
-                ---> keep the previous target prediction from the decoder
+                -> for up to max_symbols_per_step symbols:
+                ---> Update the utterances whose prediction is non blank
+                    (we save the hiddens and the target)
+                ---> otherwise: keep the previous target prediction from the
+                    decoder, and move to the next time step
+
+        The whole batch is processed at once: the predictions and the
+        non-blank masks stay on the device, and the prediction network is
+        run on all the utterances, with the hiddens and outputs of the
+        masked ones left unchanged.
 
         Arguments
         ----------
@@ -154,64 +173,69 @@ class TransducerBeamSearcher(torch.nn.Module):
             Outputs a logits tensor [B,T,1,Output_Dim]; padding
             has not been removed.
         """
-        hyp = {
-            "prediction": [[] for _ in range(tn_output.size(0))],
-            "logp_scores": [0.0 for _ in range(tn_output.size(0))],
-        }
+        batch_size, max_steps = tn_output.shape[:2]
+        max_symbols = self.max_symbols_per_step
+        # The symbol emitted at (time step, symbol), or -1 for none
+        predictions = torch.full(
+            (batch_size, max_steps * max_symbols),
+            -1,
+            device=tn_output.device,
+            dtype=torch.long,
+        )
+        logp_scores = torch.zeros(batch_size, device=tn_output.device)
+
         # prepare BOS = Blank for the Prediction Network (PN)
-        hidden = None
-        input_PN = (
-            torch.ones(
-                (tn_output.size(0), 1),
-                device=tn_output.device,
-                dtype=torch.int32,
-            )
-            * self.blank_id
+        input_PN = torch.full(
+            (batch_size, 1),
+            self.blank_id,
+            device=tn_output.device,
+            dtype=torch.long,
         )
         # First forward-pass on PN
         out_PN, hidden = self._forward_PN(input_PN, self.decode_network_lst)
         # For each time step
-        for t_step in range(tn_output.size(1)):
-            # do unsqueeze over since tjoint must be have a 4 dim [B,T,U,Hidden]
-            log_probs = self._joint_forward_step(
-                tn_output[:, t_step, :].unsqueeze(1).unsqueeze(1),
-                out_PN.unsqueeze(1),
-            )
-            # Sort outputs at time
-            logp_targets, positions = torch.max(
-                self.softmax(log_probs).squeeze(1).squeeze(1), dim=1
-            )
-            # Batch hidden update
-            have_update_hyp = []
-            for i in range(positions.size(0)):
-                # Update hiddens only if
-                # 1- current prediction is non blank
-                if positions[i].item() != self.blank_id:
-                    hyp["prediction"][i].append(positions[i].item())
-                    hyp["logp_scores"][i] += logp_targets[i]
-                    input_PN[i][0] = positions[i]
-                    have_update_hyp.append(i)
-            if len(have_update_hyp) > 0:
-                # Select sentence to update
-                # And do a forward steps + generated hidden
-                (
-                    selected_input_PN,
-                    selected_hidden,
-                ) = self._get_sentence_to_update(
-                    have_update_hyp, input_PN, hidden
+        for t_step in range(max_steps):
+            # The utterances that can still emit at this time step
+            active = torch.ones_like(logp_scores, dtype=torch.bool)
+            for symbol in range(max_symbols):
+                # do unsqueeze over since tjoint must be have a 4 dim [B,T,U,Hidden]
+                log_probs = self._joint_forward_step(
+                    tn_output[:, t_step, :].unsqueeze(1).unsqueeze(1),
+                    out_PN.unsqueeze(1),
+                )
+                # Sort outputs at time
+                logp_targets, positions = torch.max(
+                    log_probs.squeeze(1).squeeze(1), dim=1
                 )
-                selected_out_PN, selected_hidden = self._forward_PN(
-                    selected_input_PN, self.decode_network_lst, selected_hidden
+                # Update hiddens only if current prediction is non blank
+                emitted = (positions != self.blank_id) & active
+                if symbol > 0 and not emitted.any():
+                    break
+                predictions[:, t_step * max_symbols + symbol] = torch.where(
+                    emitted, positions, predictions.new_tensor(-1)
                 )
-                # update hiddens and out_PN
-                out_PN[have_update_hyp] = selected_out_PN
-                hidden = self._update_hiddens(
-                    have_update_hyp, selected_hidden, hidden
+                logp_scores += torch.where(
+                    emitted, logp_targets, logp_targets.new_tensor(0.0)
                 )
 
+                # Batch forward step on PN, keep the non-updated ones
+                input_PN = torch.where(
+                    emitted.unsqueeze(1), positions.unsqueeze(1), input_PN
+                )
+                new_out_PN, new_hidden = self._forward_PN(
+                    input_PN, self.decode_network_lst, hidden
+                )
+                out_PN = torch.where(emitted.view(-1, 1, 1), new_out_PN, out_PN)
+                hidden = self._mask_hiddens(emitted, new_hidden, hidden)
+                active = emitted
+
+        prediction = [
+            utterance[utterance >= 0].tolist()
+            for utterance in predictions.cpu()
+        ]
         return (
-            hyp["prediction"],
-            torch.Tensor(hyp["logp_scores"]).exp().mean(),
+            prediction,
+            logp_scores.exp().mean(),
             None,
             None,
         )
@@ -376,6 +400,196 @@ class TransducerBeamSearcher(torch.nn.Module):
             nbest_batch_score,
         )
 
+    def transducer_modified_beam_search_decode(self, tn_output):
+        """Transducer modified beam search decoder is a beam search decoder
+        over batch which apply Transducer rules, with at most one symbol per
+        time step:
+            1- for each time step in the Transcription Network (TN) output:
+                -> Do one forward on Joint network for all the hyps of all
+                    the utterances
+                -> Select the topK <= beam extensions (blank or one symbol)
+                    of the hyps of each utterance
+                -> Merge the hyps that have the same prediction
+                -> Do one forward on PN (and LM) for the hyps extended by
+                    a symbol
+
+        All the hyps of all the utterances are kept in stacked tensors of
+        [batch, beam] rows, with the PN (and LM) outputs and hiddens of
+        their prediction. At each time step, the PN (and LM) only run on
+        the hyps extended by a symbol; the hyps extended with blank keep
+        the cached outputs of their source hyp.
+
+        Arguments
+        ----------
+        tn_output : torch.tensor
+            Output from transcription network with shape
+            [batch, time_len, hiddens].
+
+        Returns
+        -------
+        torch.tensor
+            Outputs a logits tensor [B,T,1,Output_Dim]; padding
+            has not been removed.
+        """
+        batch_size, max_steps = tn_output.shape[:2]
+        beam = self.beam_size
+        device = tn_output.device
+        # The hyps of the ith utterance are the rows i*beam ... (i+1)*beam-1
+        first_rows = torch.arange(batch_size, device=device).unsqueeze(1)
+        first_rows = first_rows * beam
+        # Predictions (-1 after the end), their lengths, and their scores
+        predictions = torch.full(
+            (batch_size, beam, max_steps), -1, device=device, dtype=torch.long
+        )
+        lengths = torch.zeros(
+            (batch_size, beam), device=device, dtype=torch.long
+        )
+        logp_scores = torch.full(
+            (batch_size, beam), float("-inf"), device=device
+        )
+        logp_scores[:, 0] = 0.0
+
+        # prepare BOS = Blank for the Prediction Network (PN)
+        input_PN = torch.full(
+            (batch_size * beam, 1),
+            self.blank_id,
+            device=device,
+            dtype=torch.long,
+        )
+        # First forward-pass on PN (and LM)
+        out_PN, hidden = self._forward_PN(input_PN, self.decode_network_lst)
+        if self.lm_weight > 0:
+            log_probs_lm, hidden_lm = self._lm_forward_step(input_PN, None)
+
+        # For each time step
+        for t_step in range(max_steps):
+            # do unsqueeze over since tjoint must be have a 4 dim [B,T,U,Hidden]
+            log_probs = self._joint_forward_step(
+                tn_output[:, t_step, :]
+                .repeat_interleave(beam, dim=0)
+                .unsqueeze(1)
+                .unsqueeze(1),
+                out_PN.unsqueeze(1),
+            ).view(batch_size, beam, -1)
+            if self.lm_weight > 0:
+                lm_scores = self.lm_weight * log_probs_lm.view(
+                    batch_size, beam, -1
+                )
+                lm_scores[..., self.blank_id] = 0.0
+                log_probs = log_probs + lm_scores
+
+            # Select the topK extensions of the hyps of each utterance
+            num_tokens = log_probs.size(-1)
+            logp_scores, indices = torch.topk(
+                (logp_scores.unsqueeze(-1) + log_probs).view(batch_size, -1),
+                k=beam,
+                dim=-1,
+            )
+            sources = torch.div(indices, num_tokens, rounding_mode="floor")
+            positions = indices % num_tokens
+            emitted = positions != self.blank_id
+
+            # Extend the predictions of the selected hyps
+            predictions = predictions.gather(
+                1, sources.unsqueeze(-1).expand(-1, -1, max_steps)
+            )
+            lengths = lengths.gather(1, sources)
+            predictions.scatter_(
+                2,
+                lengths.unsqueeze(-1),
+                torch.where(emitted, positions, -1).unsqueeze(-1),
+            )
+            lengths = lengths + emitted
+            logp_scores = self._merge_duplicate_hyps(
+                predictions[..., : t_step + 1], logp_scores
+            )
+
+            # Forward step on PN (and LM) for the hyps extended by a symbol,
+            # the others keep the cached outputs of their source hyp
+            rows = (first_rows + sources).view(-1)
+            updated = emitted.view(-1).nonzero(as_tuple=True)[0]
+            out_PN, hidden = self._get_sentence_to_update(rows, out_PN, hidden)
+            if self.lm_weight > 0:
+                log_probs_lm, hidden_lm = self._get_sentence_to_update(
+                    rows, log_probs_lm, hidden_lm
+                )
+            if len(updated) == 0:
+                continue
+            input_PN = positions.view(-1, 1)[updated]
+            _, selected_hidden = self._get_sentence_to_update(
+                updated, out_PN, hidden
+            )
+            out_PN[updated], selected_hidden = self._forward_PN(
+                input_PN, self.decode_network_lst, selected_hidden
+            )
+            hidden = self._update_hiddens(updated, selected_hidden, hidden)
+            if self.lm_weight > 0:
+                _, selected_hidden_lm = self._get_sentence_to_update(
+                    updated, log_probs_lm, hidden_lm
+                )
+                (
+                    log_probs_lm[updated],
+                    selected_hidden_lm,
+                ) = self._lm_forward_step(input_PN, selected_hidden_lm)
+                hidden_lm = self._update_hiddens(
+                    updated, selected_hidden_lm, hidden_lm
+                )
+
+        # Add norm score (the predictions of the other searcher start with
+        # blank, hence the + 1)
+        norm_scores = (logp_scores / (lengths + 1)).cpu()
+        predictions, lengths = predictions.cpu(), lengths.cpu()
+        nbest_batch = []
+        nbest_batch_score = []
+        for i_batch in range(batch_size):
+            order = norm_scores[i_batch].argsort(descending=True)
+            order = order[norm_scores[i_batch, order] > float("-inf")]
+            order = order[: self.nbest].tolist()
+            nbest_batch.append(
+                [
+                    predictions[i_batch, k, : lengths[i_batch, k]].tolist()
+                    for k in order
+                ]
+            )
+            nbest_batch_score.append(
+                [norm_scores[i_batch, k].item() for k in order]
+            )
+        return (
+            [nbest_utt[0] for nbest_utt in nbest_batch],
+            torch.Tensor(
+                [nbest_utt_score[0] for nbest_utt_score in nbest_batch_score]
+            )
+            .exp()
+            .mean(),
+            nbest_batch,
+            nbest_batch_score,
+        )
+
+    def _merge_duplicate_hyps(self, predictions, logp_scores):
+        """Merge the hyps of an utterance that have the same prediction:
+        the first one gets the log-sum of their scores, and the others get
+        a score of -inf.
+
+        Arguments
+        ----------
+        predictions : torch.tensor
+            Predictions of the hyps [batch, beam, max_len], padded with -1.
+        logp_scores : torch.tensor
+            Scores of the hyps [batch, beam].
+
+        Returns
+        -------
+        torch.tensor
+            The scores after merging [batch, beam].
+        """
+        same = (predictions.unsqueeze(2) == predictions.unsqueeze(1)).all(-1)
+        merged = torch.where(
+            same, logp_scores.unsqueeze(1), float("-inf")
+        ).logsumexp(-1)
+        beam_index = torch.arange(same.size(-1), device=same.device)
+        first = same.int().argmax(-1) == beam_index
+        return torch.where(first, merged, float("-inf"))
+
     def _joint_forward_step(self, h_i, out_PN):
         """Join predictions (TN & PN)."""
 
@@ -436,7 +650,9 @@ class TransducerBeamSearcher(torch.nn.Module):
 
         selected_output_PN = output_PN[selected_sentences, :]
         # for LSTM hiddens (hn, hc)
-        if isinstance(hidden, tuple):
+        if hidden is None:
+            hidden_update_hyp = None
+        elif isinstance(hidden, tuple):
             hidden0_update_hyp = hidden[0][:, selected_sentences, :]
             hidden1_update_hyp = hidden[1][:, selected_sentences, :]
             hidden_update_hyp = (hidden0_update_hyp, hidden1_update_hyp)
@@ -462,6 +678,8 @@ class TransducerBeamSearcher(torch.nn.Module):
             Updated hidden tensor.
         """
 
+        if hidden is None:
+            return None
         if isinstance(hidden, tuple):
             hidden[0][:, selected_sentences, :] = updated_hidden[0]
             hidden[1][:, selected_sentences, :] = updated_hidden[1]
@@ -469,6 +687,34 @@ class TransducerBeamSearcher(torch.nn.Module):
             hidden[:, selected_sentences, :] = updated_hidden
         return hidden
 
+    def _mask_hiddens(self, mask, updated_hidden, hidden):
+        """Take the updated hiddens where mask is True, and keep the
+        previous ones elsewhere.
+
+        Arguments
+        ----------
+        mask : torch.tensor
+            Boolean tensor [batch], True for the updated sentences.
+        updated_hidden : torch.tensor
+            Hidden tensor (or tuple of tensors for LSTM) of the whole batch,
+            after the update.
+        hidden : torch.tensor
+            Hidden tensor (or tuple of tensors for LSTM) before the update.
+
+        Returns
+        -------
+        torch.tensor
+            Updated hidden tensor.
+        """
+        if updated_hidden is None:
+            return None
+        if isinstance(hidden, tuple):
+            return tuple(
+                self._mask_hiddens(mask, new, old)
+                for new, old in zip(updated_hidden, hidden)
+            )
+        return torch.where(mask.view(1, -1, 1), updated_hidden, hidden)
+
     def _forward_PN(self, out_PN, decode_network_lst, hidden=None):
         """Compute forward-pass through a list of prediction network (PN) layers.
 
@@ -61,6 +61,7 @@ Authors
 """
 import collections
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -185,6 +186,118 @@ def read_arpa(fstream):
     return num_ngrams, ngrams_by_order, backoffs_by_order
 
 
+def read_arpa_arrays(fstream):
+    r"""
+    Reads an ARPA format N-gram language model from a stream into arrays
+
+    Unlike `read_arpa`, the N-grams are written into numpy arrays (allocated
+    from the counts of the \data\ section) as they are read, without
+    building dicts, which keeps the memory low for large models. Used by
+    `speechbrain.lm.ngram.CompiledNgramLM.from_arpa`.
+
+    Arguments
+    ---------
+    fstream : TextIO
+        Text file stream (as commonly returned by open()) to read the model
+        from.
+
+    Returns
+    -------
+    list
+        The words, indexed by their id, in the order in which they first
+        appear.
+    list
+        The word ids of the N-grams of each order (order 1 first), as int32
+        arrays of shape [num_ngrams, order].
+    list
+        The log probabilities (first column) of each order, as float32
+        arrays aligned with the N-grams.
+    list
+        The log backoff weights (last column) of each order, as float32
+        arrays aligned with the N-grams, 0 where there is none.
+
+    Raises
+    ------
+    ValueError
+        If no LM is found or the file is badly formatted.
+
+    Example
+    -------
+    >>> import io
+    >>> lines = ["\\data\\", "ngram 1=2", "ngram 2=1", "",
+    ...          "\\1-grams:", "-0.3 a -0.1", "-0.5 b", "",
+    ...          "\\2-grams:", "-0.2 a b", "", "\\end\\"]
+    >>> vocab, ngram_ids, logprobs, backoffs = read_arpa_arrays(
+    ...     io.StringIO("\n".join(lines))
+    ... )
+    >>> vocab
+    ['a', 'b']
+    >>> ngram_ids[1]
+    array([[0, 1]], dtype=int32)
+    >>> backoffs[0]
+    array([-0.1,  0. ], dtype=float32)
+    """
+    _find_data_section(fstream)
+    num_ngrams = {}
+    vocab = []
+    word_to_id = {}
+    sections = {}
+    for line in fstream:
+        line = line.strip()
+        if not line:
+            continue
+        if line[:5] == "ngram":
+            lhs, rhs = line.split("=")
+            num_ngrams[int(lhs.split()[1])] = int(rhs)
+        elif _starts_ngrams_section(line):
+            order = _parse_order(line)
+            if order not in num_ngrams:
+                raise ValueError("Not a properly formatted ARPA file")
+            count = num_ngrams[order]
+            ngram_ids = np.empty((count, order), dtype=np.int32)
+            logprobs = np.empty(count, dtype=np.float32)
+            backoffs = np.zeros(count, dtype=np.float32)
+            i = 0
+            while i < count:
+                line = next(fstream, None)
+                if line is None:
+                    raise ValueError("Not a properly formatted ARPA file")
+                parts = line.split()
+                if not parts:
+                    continue
+                try:
+                    logprobs[i] = float(parts[0])
+                except ValueError:
+                    raise ValueError("Not a properly formatted ARPA file")
+                if len(parts) == order + 2:
+                    backoffs[i] = float(parts[-1])
+                    words = parts[1:-1]
+                elif len(parts) == order + 1:
+                    words = parts[1:]
+                else:
+                    raise ValueError("Not a properly formatted ARPA file")
+                for j, word in enumerate(words):
+                    if word not in word_to_id:
+                        word_to_id[word] = len(vocab)
+                        vocab.append(word)
+                    ngram_ids[i, j] = word_to_id[word]
+                i += 1
+            sections[order] = (ngram_ids, logprobs, backoffs)
+        elif _ends_arpa(line):
+            break
+        else:
+            raise ValueError("Not a properly formatted ARPA file")
+    if not num_ngrams or not num_ngrams.keys() == sections.keys():
+        raise ValueError("Not a properly formatted ARPA file")
+    orders = sorted(sections)
+    return (
+        vocab,
+        [sections[order][0] for order in orders],
+        [sections[order][1] for order in orders],
+        [sections[order][2] for order in orders],
+    )
+
+
 def _find_data_section(fstream):
     r"""
     Reads (lines) from the stream until the \data\ header is found.
@@ -5,6 +5,9 @@ Authors
  * Aku Rouhe 2020
 """
 import collections
+import json
+import numpy as np
+from speechbrain.lm.arpa import read_arpa_arrays
 
 NEGINFINITY = float("-inf")
 
@@ -106,6 +109,393 @@ class BackoffNgramLM:
         return lp + backoff_log_weight
 
 
+class CompiledNgramLM:
+    """
+    Array-backed backoff N-gram language model
+
+    This is a compact, read-only version of `BackoffNgramLM` with the same
+    query semantics. The words are mapped to integer ids, and each order N
+    is stored as a sorted array of integer keys, with aligned arrays of log
+    probabilities and backoff log weights. The key of an N-gram is
+    ``context_index * vocab_size + word_id``, where context_index is the
+    position of its first N-1 words in the order N-1 arrays. Lookups are
+    binary searches, which can be done for many queries at once with
+    `batch_logprob`.
+
+    The model can be saved to a single binary file with `save` and loaded
+    back with `load`, which memory-maps the arrays instead of reading them.
+
+    The probabilities are stored in float32. N-grams which only appear as
+    contexts (or only have a backoff weight) have a NaN log probability.
+
+    Arguments
+    ---------
+    vocab : list
+        The words, indexed by their id.
+    keys : list
+        The sorted keys of each order (order 1 first), as numpy arrays.
+    logprobs : list
+        The log probabilities aligned with the keys of each order.
+    backoffs : list
+        The backoff log weights aligned with the keys of each order.
+
+    Example
+    -------
+    >>> ngrams = {1: {tuple(): {'a': -0.6931, 'b': -0.6931}},
+    ...           2: {('a',): {'a': -0.6931, 'b': -0.6931},
+    ...               ('b',): {'a': -0.6931}}}
+    >>> backoffs = {1: {('b',): -0.5}}
+    >>> lm = CompiledNgramLM.from_ngrams(ngrams, backoffs)
+    >>> round(lm.logprob('b', ('b',)), 4)
+    -1.1931
+    >>> lm.batch_logprob(['a', 'b', 'c'], [('a',), ('b',), ()])
+    array([-0.6931, -1.1931,    -inf], dtype=float32)
+    """
+
+    MAGIC = b"SBNGRAM1"
+    ALIGNMENT = 64
+
+    def __init__(self, vocab, keys, logprobs, backoffs):
+        if not len(keys) == len(logprobs) == len(backoffs):
+            raise ValueError("Need keys, logprobs and backoffs of each order")
+        self.vocab = list(vocab)
+        self.word_to_id = {word: i for i, word in enumerate(self.vocab)}
+        self.vocab_size = len(self.vocab)
+        self.keys = keys
+        self.logprobs = logprobs
+        self.backoffs = backoffs
+        self.top_order = len(keys)
+
+    @classmethod
+    def from_ngrams(cls, ngrams, backoffs):
+        """Compiles the model from the dicts returned by
+        `speechbrain.lm.arpa.read_arpa` (as used by `BackoffNgramLM`).
+        To compile an ARPA file, `from_arpa` needs much less memory.
+
+        Arguments
+        ---------
+        ngrams : dict
+            The N-gram log probabilities, see `BackoffNgramLM`.
+        backoffs : dict
+            The backoff log weights, see `BackoffNgramLM`.
+
+        Returns
+        -------
+        CompiledNgramLM
+        """
+        vocab = []
+        word_to_id = {}
+
+        def to_ids(ngram):
+            for word in ngram:
+                if word not in word_to_id:
+                    word_to_id[word] = len(vocab)
+                    vocab.append(word)
+            return [word_to_id[word] for word in ngram]
+
+        ngram_ids, logprobs, backoff_weights = [], [], []
+        for order in range(1, len(ngrams) + 1):
+            dists = ngrams[order]
+            weights = backoffs.get(order, {})
+            order_ids, order_logprobs, order_backoffs = [], [], []
+            for context, dist in dists.items():
+                for token, logprob in dist.items():
+                    ngram = context + (token,)
+                    order_ids.append(to_ids(ngram))
+                    order_logprobs.append(logprob)
+                    order_backoffs.append(weights.get(ngram, 0.0))
+            # Backoff weights of N-grams which have no probability
+            for ngram, weight in weights.items():
+                if ngram[-1] not in dists.get(ngram[:-1], {}):
+                    order_ids.append(to_ids(ngram))
+                    order_logprobs.append(np.nan)
+                    order_backoffs.append(weight)
+            ngram_ids.append(
+                np.array(order_ids, dtype=np.int32).reshape(-1, order)
+            )
+            logprobs.append(np.array(order_logprobs, dtype=np.float32))
+            backoff_weights.append(np.array(order_backoffs, dtype=np.float32))
+        return cls._from_arrays(vocab, ngram_ids, logprobs, backoff_weights)
+
+    @classmethod
+    def from_arpa(cls, fstream):
+        """Compiles the model from an ARPA file. The N-grams are read
+        straight into arrays (see `speechbrain.lm.arpa.read_arpa_arrays`),
+        without the dicts of `read_arpa`.
+
+        Arguments
+        ---------
+        fstream : TextIO
+            Text file stream of the ARPA file.
+
+        Returns
+        -------
+        CompiledNgramLM
+        """
+        return cls._from_arrays(*read_arpa_arrays(fstream))
+
+    @classmethod
+    def _from_arrays(cls, vocab, ngram_ids, logprobs, backoffs):
+        """Compiles the model from the word ids [num_ngrams, order], log
+        probabilities and backoff weights of the N-grams of each order."""
+        ngram_ids, logprobs, backoffs = (
+            list(ngram_ids),
+            list(logprobs),
+            list(backoffs),
+        )
+        top_order = len(ngram_ids)
+        # The context of each N-gram must be indexable in the lower order:
+        # add the missing ones, with no probability
+        for order in range(top_order, 1, -1):
+            lower = ngram_ids[order - 2]
+            combined = np.concatenate([lower, ngram_ids[order - 1][:, :-1]])
+            _, first = np.unique(combined, axis=0, return_index=True)
+            missing = combined[np.sort(first[first >= len(lower)])]
+            if len(missing) > 0:
+                ngram_ids[order - 2] = np.concatenate([lower, missing])
+                logprobs[order - 2] = np.concatenate(
+                    [
+                        logprobs[order - 2],
+                        np.full(len(missing), np.nan, dtype=np.float32),
+                    ]
+                )
+                backoffs[order - 2] = np.concatenate(
+                    [
+                        backoffs[order - 2],
+                        np.zeros(len(missing), dtype=np.float32),
+                    ]
+                )
+
+        vocab_size = len(vocab)
+        keys, sorted_logprobs, sorted_backoffs = [], [], []
+        for order in range(1, top_order + 1):
+            order_ids = ngram_ids[order - 1]
+            context_index = np.zeros(len(order_ids), dtype=np.int64)
+            for i in range(order - 1):
+                context_index = _find(
+                    keys[i], vocab_size, context_index, order_ids[:, i]
+                )
+            order_keys = context_index * vocab_size + order_ids[:, -1]
+            sort = np.argsort(order_keys, kind="stable")
+            keys.append(order_keys[sort])
+            sorted_logprobs.append(logprobs[order - 1][sort])
+            sorted_backoffs.append(backoffs[order - 1][sort])
+        return cls(vocab, keys, sorted_logprobs, sorted_backoffs)
+
+    def save(self, path):
+        """Saves the model into a single memory-mappable binary file.
+
+        Arguments
+        ---------
+        path : str, Path
+            Where to save the model.
+        """
+        arrays = {}
+        for order in range(self.top_order):
+            arrays[f"keys_{order + 1}"] = self.keys[order]
+            arrays[f"logprobs_{order + 1}"] = self.logprobs[order]
+            arrays[f"backoffs_{order + 1}"] = self.backoffs[order]
+
+        # The header lists where each array is found in the file
+        header = {"top_order": self.top_order, "vocab": self.vocab}
+        header["arrays"] = {}
+        offset = 0
+        for name, array in arrays.items():
+            header["arrays"][name] = {
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "offset": offset,
+            }
+            offset += _aligned(array.nbytes, self.ALIGNMENT)
+        header_bytes = json.dumps(header).encode("utf-8")
+        data_start = _aligned(
+            len(self.MAGIC) + 8 + len(header_bytes), self.ALIGNMENT
+        )
+
+        with open(path, "wb") as fo:
+            fo.write(self.MAGIC)
+            fo.write(len(header_bytes).to_bytes(8, "little"))
+            fo.write(header_bytes)
+            for name, array in arrays.items():
+                start = data_start + header["arrays"][name]["offset"]
+                fo.write(b"\0" * (start - fo.tell()))
+                fo.write(np.ascontiguousarray(array).tobytes())
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Loads a model saved with `save`.
+
+        Arguments
+        ---------
+        path : str, Path
+            The file to load.
+        mmap : bool
+            If True (default), the arrays are memory-mapped, so that they
+            are read lazily and shared between processes.
+
+        Returns
+        -------
+        CompiledNgramLM
+        """
+        with open(path, "rb") as fi:
+            if fi.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise ValueError(f"{path} is not a compiled N-gram LM")
+            header_len = int.from_bytes(fi.read(8), "little")
+            header = json.loads(fi.read(header_len).decode("utf-8"))
+        data_start = _aligned(len(cls.MAGIC) + 8 + header_len, cls.ALIGNMENT)
+
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            shape = tuple(spec["shape"])
+            offset = data_start + spec["offset"]
+            if shape[0] == 0:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            elif mmap:
+                arrays[name] = np.memmap(
+                    str(path),
+                    dtype=dtype,
+                    mode="r",
+                    offset=offset,
+                    shape=shape,
+                )
+            else:
+                with open(path, "rb") as fi:
+                    fi.seek(offset)
+                    arrays[name] = np.fromfile(
+                        fi, dtype=dtype, count=int(np.prod(shape))
+                    )
+
+        orders = range(1, header["top_order"] + 1)
+        return cls(
+            header["vocab"],
+            [arrays[f"keys_{order}"] for order in orders],
+            [arrays[f"logprobs_{order}"] for order in orders],
+            [arrays[f"backoffs_{order}"] for order in orders],
+        )
+
+    def logprob(self, token, context=tuple()):
+        """Computes the backoff log probability of a single token,
+        same interface as `BackoffNgramLM.logprob`."""
+        return float(self.batch_logprob([token], [context])[0])
+
+    def batch_logprob(self, tokens, contexts):
+        """Computes the backoff log probabilities of many queries at once.
+
+        Arguments
+        ---------
+        tokens : list, numpy.ndarray
+            The queried tokens, as words or as an integer array of word ids
+            (see `word_ids`), where unknown words have id -1.
+        contexts : list, numpy.ndarray
+            The context of each query, as tuples of words, or as an integer
+            array of word ids of shape [num_queries, context_length],
+            left-padded with -1. Longer contexts than the model can use are
+            truncated.
+
+        Returns
+        -------
+        numpy.ndarray
+            The log probabilities (float32), -inf for unknown tokens.
+        """
+        tokens = self._to_ids(tokens)
+        contexts = self._context_ids(contexts)
+        num_queries, max_context = contexts.shape
+
+        # ctx_indices[j]: the index of the last j context words as a j-gram
+        # in the order j arrays (-1 if not found).
+        ctx_indices = [np.zeros(num_queries, dtype=np.int64)]
+        for j in range(1, max_context + 1):
+            index = np.zeros(num_queries, dtype=np.int64)
+            for i in range(max_context - j, max_context):
+                order = i - (max_context - j) + 1
+                index = self._find(order, index, contexts[:, i])
+            ctx_indices.append(index)
+
+        result = np.full(num_queries, NEGINFINITY, dtype=np.float32)
+        acc_backoff = np.zeros(num_queries, dtype=np.float32)
+        pending = np.ones(num_queries, dtype=bool)
+        for j in range(max_context, -1, -1):
+            # Queries are done at the longest available context first
+            index = self._find(j + 1, ctx_indices[j], tokens)
+            found = pending & (index >= 0)
+            if found.any():
+                logprob = self.logprobs[j][index[found]]
+                found[found] = ~np.isnan(logprob)
+            result[found] = self.logprobs[j][index[found]] + acc_backoff[found]
+            pending &= ~found
+            if j > 0:
+                # Backoff to the shorter context
+                has_context = pending & (ctx_indices[j] >= 0)
+                acc_backoff[has_context] += self.backoffs[j - 1][
+                    ctx_indices[j][has_context]
+                ]
+        return result
+
+    def word_ids(self, words):
+        """Maps words to integer ids, -1 for unknown words.
+
+        Arguments
+        ---------
+        words : list
+            The words to map.
+
+        Returns
+        -------
+        numpy.ndarray
+            The ids.
+        """
+        return np.array(
+            [self.word_to_id.get(word, -1) for word in words], dtype=np.int64
+        )
+
+    def _to_ids(self, tokens):
+        if isinstance(tokens, np.ndarray):
+            return tokens.astype(np.int64)
+        return self.word_ids(tokens)
+
+    def _context_ids(self, contexts):
+        max_context = self.top_order - 1
+        if isinstance(contexts, np.ndarray):
+            if contexts.shape[1] > max_context:
+                contexts = contexts[:, contexts.shape[1] - max_context :]
+            return contexts.astype(np.int64)
+        ids = np.full((len(contexts), max_context), -1, dtype=np.int64)
+        if max_context == 0:
+            return ids
+        for i, context in enumerate(contexts):
+            context = context[-max_context:]
+            if context:
+                ids[i, max_context - len(context) :] = self.word_ids(context)
+        return ids
+
+    def _find(self, order, context_index, word_id):
+        """Looks up (context_index, word_id) in the arrays of an order.
+        Returns the positions, -1 where not found."""
+        return _find(
+            self.keys[order - 1], self.vocab_size, context_index, word_id
+        )
+
+
+def _find(keys, vocab_size, context_index, word_id):
+    """Looks up the keys context_index * vocab_size + word_id in the sorted
+    keys. Returns the positions, -1 where not found."""
+    valid = (context_index >= 0) & (word_id >= 0)
+    query = context_index * vocab_size + word_id
+    position = np.searchsorted(keys, query)
+    position = np.minimum(position, len(keys) - 1)
+    if len(keys) > 0:
+        valid &= keys[position] == query
+    else:
+        valid[:] = False
+    return np.where(valid, position, -1)
+
+
+def _aligned(size, alignment):
+    """Rounds size up to a multiple of alignment."""
+    return (size + alignment - 1) // alignment * alignment
+
+
 def ngram_evaluation_details(data, LM):
     """
     Evaluates the N-gram LM on each sentence in data
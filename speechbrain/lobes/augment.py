@@ -345,6 +345,12 @@ class EnvCorrupt(torch.nn.Module):
         Sample rate of input audio signals used for adding noise.
     clean_sample_rate: int
         Sample rate of original (clean) audio signals.
+    noise_bank : bool
+        If True, the noises are loaded once and kept in memory, on the device
+        of the inputs (see ``AddNoise``).
+    rir_bank : bool
+        If True, the impulse responses are loaded once and kept in memory, on
+        the device of the inputs (see ``AddReverb``).
 
     Example
     -------
@@ -372,6 +378,8 @@ class EnvCorrupt(torch.nn.Module):
         reverb_sample_rate=16000,
         noise_sample_rate=16000,
         clean_sample_rate=16000,
+        noise_bank=False,
+        rir_bank=False,
     ):
         super().__init__()
 
@@ -404,6 +412,7 @@ class EnvCorrupt(torch.nn.Module):
                 rir_scale_factor=rir_scale_factor,
                 reverb_sample_rate=reverb_sample_rate,
                 clean_sample_rate=clean_sample_rate,
+                rir_bank=rir_bank,
             )
 
         if babble_speaker_count > 0 and babble_prob > 0.0:
@@ -423,6 +432,7 @@ class EnvCorrupt(torch.nn.Module):
                 snr_high=noise_snr_high,
                 noise_sample_rate=noise_sample_rate,
                 clean_sample_rate=clean_sample_rate,
+                noise_bank=noise_bank,
             )
 
     def forward(self, waveforms, lengths):
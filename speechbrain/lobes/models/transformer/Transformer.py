@@ -233,14 +233,17 @@ class PositionalEncoding(nn.Module):
         pe = pe.unsqueeze(0)
         self.register_buffer("pe", pe)
 
-    def forward(self, x):
+    def forward(self, x, offset=0):
         """
         Arguments
         ---------
         x : tensor
             Input feature shape (batch, time, fea)
+        offset : int
+            Position of the first frame of x, e.g., the number of
+            already processed steps when decoding incrementally.
         """
-        return self.pe[:, : x.size(1)].clone().detach()
+        return self.pe[:, offset : offset + x.size(1)].clone().detach()
 
 
 class TransformerEncoderLayer(nn.Module):
@@ -372,6 +375,79 @@ class TransformerEncoderLayer(nn.Module):
             output = self.norm2(output)
         return output, self_attn
 
+    def forward_step(
+        self,
+        src,
+        self_kv=None,
+        src_key_padding_mask: Optional[torch.Tensor] = None,
+    ):
+        """Incremental version of forward for causal (e.g., language model)
+        encoders. Only the newest position is processed, and it attends to
+        the keys and values of the previous positions stored in self_kv.
+
+        Arguments
+        ----------
+        src : torch.Tensor
+            The newest position of the sequence, shape (batch, 1, fea).
+        self_kv : tuple
+            The projected keys and values of the previous positions,
+            or None at the first step.
+        src_key_padding_mask : torch.Tensor, optional
+            The mask for the keys of all the positions so far,
+            including the newest one.
+
+        Returns
+        -------
+        output : torch.Tensor
+            The output of the layer for the newest position.
+        self_kv : tuple
+            The keys and values including the newest position.
+
+        Example
+        -------
+        >>> x = torch.rand((8, 1, 512))
+        >>> net = TransformerEncoderLayer(512, 8, d_model=512)
+        >>> output, self_kv = net.forward_step(x)
+        >>> output, self_kv = net.forward_step(x, self_kv)
+        >>> self_kv[0].shape
+        torch.Size([8, 8, 2, 64])
+        """
+        if not isinstance(self.self_att, sb.nnet.attention.MultiheadAttention):
+            raise NotImplementedError(
+                "Incremental processing is only supported with regularMHA."
+            )
+
+        if self.normalize_before:
+            src1 = self.norm1(src)
+        else:
+            src1 = src
+
+        key, value = self.self_att.project_key_value(src1, src1)
+        if self_kv is not None:
+            key = torch.cat([self_kv[0], key], dim=2)
+            value = torch.cat([self_kv[1], value], dim=2)
+        self_kv = (key, value)
+        output, _ = self.self_att.forward_cached(
+            src1, self_kv, key_padding_mask=src_key_padding_mask
+        )
+
+        # add & norm
+        src = src + self.dropout1(output)
+        if not self.normalize_before:
+            src = self.norm1(src)
+
+        if self.normalize_before:
+            src1 = self.norm2(src)
+        else:
+            src1 = src
+        output = self.pos_ffn(src1)
+
+        # add & norm
+        output = src + self.dropout2(output)
+        if not self.normalize_before:
+            output = self.norm2(output)
+        return output, self_kv
+
 
 class TransformerEncoder(nn.Module):
     """This class implements the transformer encoder.
@@ -485,6 +561,56 @@ class TransformerEncoder(nn.Module):
         output = self.norm(output)
         return output, attention_lst
 
+    def forward_step(
+        self,
+        src,
+        cache=None,
+        src_key_padding_mask: Optional[torch.Tensor] = None,
+    ):
+        """Incremental step for causal encoders which only processes the
+        newest position, see TransformerEncoderLayer.forward_step.
+
+        Arguments
+        ----------
+        src : tensor
+            The newest position of the sequence, shape (batch, 1, fea).
+        cache : list
+            The keys and values of each layer returned by the previous
+            step, or None at the first step.
+        src_key_padding_mask : tensor
+            The mask for the keys of all the positions so far (optional).
+
+        Returns
+        -------
+        output : tensor
+            The encoder output for the newest position.
+        cache : list
+            The updated keys and values of each layer.
+
+        Example
+        -------
+        >>> x = torch.rand((8, 1, 512))
+        >>> net = TransformerEncoder(1, 8, 512, d_model=512)
+        >>> output, cache = net.forward_step(x)
+        >>> output, cache = net.forward_step(x, cache)
+        >>> output.shape
+        torch.Size([8, 1, 512])
+        """
+        if cache is None:
+            cache = [None] * len(self.layers)
+
+        output = src
+        self_kvs = []
+        for enc_layer, self_kv in zip(self.layers, cache):
+            output, self_kv = enc_layer.forward_step(
+                output,
+                self_kv=self_kv,
+                src_key_padding_mask=src_key_padding_mask,
+            )
+            self_kvs.append(self_kv)
+        output = self.norm(output)
+        return output, self_kvs
+
 
 class TransformerDecoderLayer(nn.Module):
     """This class implements the self-attention decoder layer.
@@ -653,6 +779,112 @@ class TransformerDecoderLayer(nn.Module):
 
         return tgt, self_attn, multihead_attention
 
+    def forward_step(
+        self,
+        tgt,
+        memory,
+        self_kv=None,
+        cross_kv=None,
+        memory_key_padding_mask=None,
+    ):
+        """Incremental version of forward which only processes the newest
+        target position. The keys and values of the previous positions are
+        taken from self_kv and the projections of the encoder states from
+        cross_kv, so that they are not computed again at every step.
+
+        Arguments
+        ----------
+        tgt: tensor
+            The newest position of the target sequence, shape (batch, 1, fea).
+        memory: tensor
+            The sequence from the last layer of the encoder. Only used
+            when cross_kv is None.
+        self_kv: tuple
+            The projected self-attention keys and values of the previous
+            positions, or None at the first step.
+        cross_kv: tuple
+            The projected keys and values of memory, or None at the
+            first step.
+        memory_key_padding_mask: tensor
+            The mask for the memory keys per batch (optional).
+
+        Returns
+        -------
+        tgt : tensor
+            The output of the layer for the newest position.
+        multihead_attention : tensor
+            The attention over memory, shape (batch, 1, src_len).
+        self_kv : tuple
+            The self-attention keys and values including the newest position.
+        cross_kv : tuple
+            The projected keys and values of memory.
+
+        Example
+        -------
+        >>> src = torch.rand((8, 60, 512))
+        >>> tgt = torch.rand((8, 1, 512))
+        >>> net = TransformerDecoderLayer(1024, 8, d_model=512)
+        >>> output, attn, self_kv, cross_kv = net.forward_step(tgt, src)
+        >>> output, attn, self_kv, cross_kv = net.forward_step(
+        ...     tgt, src, self_kv, cross_kv
+        ... )
+        >>> self_kv[0].shape
+        torch.Size([8, 8, 2, 64])
+        """
+        if not isinstance(self.self_attn, sb.nnet.attention.MultiheadAttention):
+            raise NotImplementedError(
+                "Incremental decoding is only supported with regularMHA."
+            )
+
+        if self.normalize_before:
+            tgt1 = self.norm1(tgt)
+        else:
+            tgt1 = tgt
+
+        # self-attention of the newest position over all the positions so far
+        key, value = self.self_attn.project_key_value(tgt1, tgt1)
+        if self_kv is not None:
+            key = torch.cat([self_kv[0], key], dim=2)
+            value = torch.cat([self_kv[1], value], dim=2)
+        self_kv = (key, value)
+        tgt2, _ = self.self_attn.forward_cached(tgt1, self_kv)
+
+        # add & norm
+        tgt = tgt + self.dropout1(tgt2)
+        if not self.normalize_before:
+            tgt = self.norm1(tgt)
+
+        if self.normalize_before:
+            tgt1 = self.norm2(tgt)
+        else:
+            tgt1 = tgt
+
+        # the encoder states are projected only once
+        if cross_kv is None:
+            cross_kv = self.mutihead_attn.project_key_value(memory, memory)
+        tgt2, multihead_attention = self.mutihead_attn.forward_cached(
+            tgt1, cross_kv, key_padding_mask=memory_key_padding_mask
+        )
+
+        # add & norm
+        tgt = tgt + self.dropout2(tgt2)
+        if not self.normalize_before:
+            tgt = self.norm2(tgt)
+
+        if self.normalize_before:
+            tgt1 = self.norm3(tgt)
+        else:
+            tgt1 = tgt
+
+        tgt2 = self.pos_ffn(tgt1)
+
+        # add & norm
+        tgt = tgt + self.dropout3(tgt2)
+        if not self.normalize_before:
+            tgt = self.norm3(tgt)
+
+        return tgt, multihead_attention, self_kv, cross_kv
+
 
 class TransformerDecoder(nn.Module):
     """This class implements the Transformer decoder.
@@ -762,6 +994,74 @@ class TransformerDecoder(nn.Module):
 
         return output, self_attns, multihead_attns
 
+    def forward_step(
+        self, tgt, memory, cache=None, memory_key_padding_mask=None,
+    ):
+        """Incremental decoding step which only processes the newest target
+        position, see TransformerDecoderLayer.forward_step.
+
+        Arguments
+        ----------
+        tgt : tensor
+            The newest position of the target sequence, shape (batch, 1, fea).
+        memory : tensor
+            The sequence from the last layer of the encoder (required).
+        cache : dict
+            The cache returned by the previous step, or None at the first
+            step. It stores, for each layer, the self-attention keys and
+            values under "self_attn" and the projected memory under
+            "cross_attn".
+        memory_key_padding_mask : tensor
+            The mask for the memory keys per batch (optional).
+
+        Returns
+        -------
+        output : tensor
+            The decoder output for the newest position.
+        multihead_attns : list
+            The attention over memory for each layer.
+        cache : dict
+            The updated cache, to be passed to the next step.
+
+        Example
+        -------
+        >>> src = torch.rand((8, 60, 512))
+        >>> tgt = torch.rand((8, 1, 512))
+        >>> net = TransformerDecoder(1, 8, 1024, d_model=512)
+        >>> output, _, cache = net.forward_step(tgt, src)
+        >>> output, _, cache = net.forward_step(tgt, src, cache)
+        >>> output.shape
+        torch.Size([8, 1, 512])
+        """
+        if cache is None:
+            cache = {
+                "self_attn": [None] * len(self.layers),
+                "cross_attn": [None] * len(self.layers),
+            }
+
+        output = tgt
+        multihead_attns, self_kvs, cross_kvs = [], [], []
+        for dec_layer, self_kv, cross_kv in zip(
+            self.layers, cache["self_attn"], cache["cross_attn"]
+        ):
+            output, multihead_attn, self_kv, cross_kv = dec_layer.forward_step(
+                output,
+                memory,
+                self_kv=self_kv,
+                cross_kv=cross_kv,
+                memory_key_padding_mask=memory_key_padding_mask,
+            )
+            multihead_attns.append(multihead_attn)
+            self_kvs.append(self_kv)
+            cross_kvs.append(cross_kv)
+        output = self.norm(output)
+
+        return (
+            output,
+            multihead_attns,
+            {"self_attn": self_kvs, "cross_attn": cross_kvs},
+        )
+
 
 class NormalizedEmbedding(nn.Module):
     """This class implements the normalized embedding layer for the transformer.
@@ -276,6 +276,76 @@ class TransformerASR(TransformerInterface):
         )
         return prediction, multihead_attns[-1]
 
+    @torch.no_grad()
+    def decode_step(self, tgt, encoder_out, cache=None, enc_len=None):
+        """This method implements an incremental decoding step for the
+        transformer model. Unlike decode, only the newest token is fed to the
+        decoder, and the self-attention keys/values of the previous tokens
+        as well as the projected encoder states are taken from the cache.
+
+        Arguments
+        ---------
+        tgt : torch.Tensor
+            The newest token of each sequence, shape (batch,).
+        encoder_out : torch.Tensor
+            Hidden output of the encoder.
+        cache : dict
+            The cache returned by the previous step, None at the first step.
+        enc_len : torch.LongTensor
+            The actual length of encoder states.
+
+        Returns
+        -------
+        prediction : torch.Tensor
+            The decoder output for the newest token, shape (batch, 1, d_model).
+        attn : torch.Tensor
+            The attention of the last layer over the encoder states for the
+            newest token, shape (batch, src_len).
+        cache : dict
+            The updated cache, see TransformerDecoder.forward_step.
+
+        Example
+        -------
+        >>> src = torch.rand([8, 120, 512])
+        >>> tgt = torch.randint(0, 720, [8, 3])
+        >>> net = TransformerASR(
+        ...     720, 512, 512, 8, 1, 1, 1024, activation=torch.nn.GELU
+        ... ).eval()
+        >>> enc_out = net.encode(src)
+        >>> cache = None
+        >>> for t in range(tgt.shape[1]):
+        ...     pred, attn, cache = net.decode_step(tgt[:, t], enc_out, cache)
+        >>> full_pred, _ = net.decode(tgt, enc_out)
+        >>> torch.allclose(pred[:, -1], full_pred[:, -1], atol=1e-5)
+        True
+        """
+        step = 0
+        if cache is not None:
+            step = cache["self_attn"][0][0].shape[2]
+
+        src_key_padding_mask = None
+        if enc_len is not None:
+            src_key_padding_mask = (1 - length_to_mask(enc_len)).bool()
+
+        tgt = self.custom_tgt_module(tgt.unsqueeze(1))
+        if self.attention_type == "RelPosMHAXL":
+            # we use fixed positional encodings in the decoder
+            tgt = tgt + self.positional_encoding_decoder(tgt, offset=step)
+            if cache is None:
+                encoder_out = encoder_out + self.positional_encoding_decoder(
+                    encoder_out
+                )
+        elif self.positional_encoding_type == "fixed_abs_sine":
+            tgt = tgt + self.positional_encoding(tgt, offset=step)
+
+        prediction, multihead_attns, cache = self.decoder.forward_step(
+            tgt,
+            encoder_out,
+            cache=cache,
+            memory_key_padding_mask=src_key_padding_mask,
+        )
+        return prediction, multihead_attns[-1].squeeze(1), cache
+
     def encode(self, src, wav_len=None):
         """
         Encoder forward pass
@@ -150,6 +150,74 @@ class TransformerLM(TransformerInterface):
         pred = self.output_proj(encoder_out)
         return pred
 
+    def forward_step(self, src, cache=None, pad_idx=0):
+        """Incremental version of forward, e.g., for shallow fusion in beam
+        search. Only the newest token is processed, while the keys and values
+        of the previous tokens are kept in the cache. The result is the same
+        as the last position of forward over the whole token history.
+
+        Arguments
+        ---------
+        src : tensor
+            The newest token of each sequence, shape (batch,).
+        cache : dict
+            The cache returned by the previous step, None at the first step.
+        pad_idx : int
+            The index for <pad> token (default=0).
+
+        Returns
+        -------
+        pred : tensor
+            The logits for the next token, shape (batch, vocab).
+        cache : dict
+            The updated cache. All its tensors have the batch on the first
+            dimension, so that it can be reordered with index_select.
+
+        Example
+        -------
+        >>> src = torch.randint(1, 720, [8, 5])
+        >>> net = TransformerLM(720, 512, 8, 1, 0, 1024, activation=torch.nn.GELU)
+        >>> net = net.eval()
+        >>> cache = None
+        >>> for t in range(src.shape[1]):
+        ...     pred, cache = net.forward_step(src[:, t], cache)
+        >>> torch.allclose(pred, net(src)[:, -1], atol=1e-5)
+        True
+        """
+        if self.num_decoder_layers > 0:
+            # The decoder attends to the encoder states of the whole history,
+            # so the previous positions are not fixed: recompute everything.
+            tokens = src.unsqueeze(1)
+            if cache is not None:
+                tokens = torch.cat([cache["tokens"], tokens], dim=-1)
+            pred = self.forward(tokens)
+            return pred[:, -1], {"tokens": tokens}
+
+        src_key_padding_mask = src.eq(pad_idx).unsqueeze(1)
+        step = 0
+        self_kvs = None
+        if cache is not None:
+            step = cache["key_padding_mask"].shape[1]
+            self_kvs = cache["self_attn"]
+            src_key_padding_mask = torch.cat(
+                [cache["key_padding_mask"], src_key_padding_mask], dim=-1
+            )
+
+        src = self.custom_src_module(src.unsqueeze(1))
+        if self.embedding_proj is not None:
+            src = self.embedding_proj(src)
+        src = src + self.positional_encoding(src, offset=step)
+        encoder_out, self_kvs = self.encoder.forward_step(
+            src, cache=self_kvs, src_key_padding_mask=src_key_padding_mask,
+        )
+
+        pred = self.output_proj(encoder_out)
+        cache = {
+            "self_attn": self_kvs,
+            "key_padding_mask": src_key_padding_mask,
+        }
+        return pred[:, -1], cache
+
     def _reset_params(self):
         for p in self.parameters():
             if p.dim() > 1:
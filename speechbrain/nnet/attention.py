@@ -777,6 +777,108 @@ class MultiheadAttention(nn.Module):
             output = output.permute(1, 0, 2)
             return output
 
+    def _in_projection(self, x, idx):
+        """Applies the query (idx=0), key (idx=1) or value (idx=2) input
+        projection of the wrapped torch.nn.MultiheadAttention and splits
+        the heads, giving a tensor of shape (B, nhead, L, head_dim).
+        """
+        att = self.att
+        start, end = idx * att.embed_dim, (idx + 1) * att.embed_dim
+        if att._qkv_same_embed_dim:
+            weight = att.in_proj_weight[start:end]
+        else:
+            weight = (att.q_proj_weight, att.k_proj_weight, att.v_proj_weight)[
+                idx
+            ]
+        bias = None
+        if att.in_proj_bias is not None:
+            bias = att.in_proj_bias[start:end]
+
+        x = F.linear(x, weight, bias)
+        batch_size, length, _ = x.shape
+        return x.view(
+            batch_size, length, att.num_heads, att.head_dim
+        ).transpose(1, 2)
+
+    def project_key_value(self, key, value):
+        """Computes the projected keys and values used by `forward_cached`.
+
+        Arguments
+        ---------
+        key : torch.Tensor
+            (B, S, E) where S is the source sequence length.
+        value : torch.Tensor
+            (B, S, E) where S is the source sequence length.
+
+        Returns
+        -------
+        key : torch.Tensor
+            (B, nhead, S, head_dim) projected keys.
+        value : torch.Tensor
+            (B, nhead, S, head_dim) projected values.
+
+        Example
+        -------
+        >>> inputs = torch.rand([8, 60, 512])
+        >>> net = MultiheadAttention(nhead=8, d_model=inputs.shape[-1])
+        >>> k, v = net.project_key_value(inputs, inputs)
+        >>> k.shape
+        torch.Size([8, 8, 60, 64])
+        """
+        if self.att.bias_k is not None or self.att.add_zero_attn:
+            raise NotImplementedError(
+                "Cached attention does not support add_bias_kv or add_zero_attn."
+            )
+        return self._in_projection(key, 1), self._in_projection(value, 2)
+
+    def forward_cached(self, query, key_value, key_padding_mask=None):
+        """Attends the query to keys and values which were already projected
+        with `project_key_value`. This avoids projecting the same keys and
+        values again, e.g., at each step of autoregressive decoding.
+
+        Arguments
+        ---------
+        query : torch.Tensor
+            (B, L, E) where L is the target sequence length.
+        key_value : tuple
+            The projected keys and values, each of shape
+            (B, nhead, S, head_dim).
+        key_padding_mask : torch.Tensor, optional
+            (B, S) BoolTensor, the positions with the value of True
+            will be ignored.
+
+        Returns
+        -------
+        attn_output : torch.Tensor
+            (B, L, E) where L is the target sequence length.
+        attn_output_weights : torch.Tensor
+            (B, L, S) attention weights averaged over heads.
+
+        Example
+        -------
+        >>> inputs = torch.rand([8, 60, 512])
+        >>> net = MultiheadAttention(nhead=8, d_model=inputs.shape[-1])
+        >>> kv = net.project_key_value(inputs, inputs)
+        >>> outputs, attn = net.forward_cached(inputs[:, -1:], kv)
+        >>> outputs.shape
+        torch.Size([8, 1, 512])
+        """
+        key, value = key_value
+        q = self._in_projection(query, 0) / math.sqrt(self.att.head_dim)
+        scores = torch.matmul(q, key.transpose(-2, -1))
+        if key_padding_mask is not None:
+            scores = scores.masked_fill(
+                key_padding_mask[:, None, None, :], float("-inf")
+            )
+        attn = F.softmax(scores, dim=-1)
+        attn = F.dropout(attn, p=self.att.dropout, training=self.training)
+
+        output = torch.matmul(attn, value)
+        batch_size, _, length, _ = output.shape
+        output = output.transpose(1, 2).reshape(batch_size, length, -1)
+        output = self.att.out_proj(output)
+        return output, attn.mean(dim=1)
+
 
 class PositionalwiseFeedForward(nn.Module):
     """The class implements the positional-wise feed forward module in
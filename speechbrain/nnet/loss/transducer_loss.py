@@ -1,34 +1,35 @@
 """
-Transducer loss implementation (depends on numba)
+Transducer loss implementation
+
+The forward-backward algorithm runs with Numba CUDA kernels for inputs on a
+CUDA device (when Numba is installed), and otherwise with a vectorized
+PyTorch implementation which works on any device.
 
 Authors
  * Abdelwahab Heba 2020
 """
 
+import math
 import torch
+import torch.nn.functional as F
 from torch.autograd import Function
 from torch.nn import Module
 
 try:
     from numba import cuda
 except ImportError:
-    err_msg = "The optional dependency Numba is needed to use this module\n"
-    err_msg += "Cannot import numba. To use Transducer loss\n"
-    err_msg += "Please follow the instructions below\n"
-    err_msg += "=============================\n"
-    err_msg += "If you use your localhost:\n"
-    err_msg += "pip install numba\n"
-    err_msg += "export NUMBAPRO_LIBDEVICE='/usr/local/cuda/nvvm/libdevice/' \n"
-    err_msg += "export NUMBAPRO_NVVM='/usr/local/cuda/nvvm/lib64/libnvvm.so' \n"
-    err_msg += "================================ \n"
-    err_msg += "If you use conda:\n"
-    err_msg += "conda install numba cudatoolkit=9.0"
-    raise ImportError(err_msg)
+    cuda = None
 
-import math
+
+def _cuda_jit(signature):
+    """Compiles a Numba CUDA kernel, or leaves the function as is if Numba
+    is not installed (the PyTorch implementation is used instead)."""
+    if cuda is None:
+        return lambda kernel: kernel
+    return cuda.jit(signature)
 
 
-@cuda.jit(
+@_cuda_jit(
     "(float32[:,:,:,:], int32[:,:], float32[:,:,:], float32[:], int32[:], int32[:], int32, int32[:,:])"
 )
 def cu_kernel_forward(log_probs, labels, alpha, log_p, T, U, blank, lock):
@@ -106,7 +107,7 @@ def cu_kernel_forward(log_probs, labels, alpha, log_p, T, U, blank, lock):
             ) / T[b]
 
 
-@cuda.jit(
+@_cuda_jit(
     "(float32[:,:,:,:], int32[:,:], float32[:,:,:], float32[:], int32[:], int32[:], int32, int32[:,:])"
 )
 def cu_kernel_backward(log_probs, labels, beta, log_p, T, U, blank, lock):
@@ -180,7 +181,7 @@ def cu_kernel_backward(log_probs, labels, beta, log_p, T, U, blank, lock):
         log_p[b] = beta[b, 0, 0] / T[b]
 
 
-@cuda.jit(
+@_cuda_jit(
     "(float32[:,:,:,:], int32[:,:],float32[:,:,:], float32[:,:,:], float32[:,:,:,:], int32[:], int32[:], int32)"
 )
 def cu_kernel_compute_grad(log_probs, labels, alpha, beta, grads, T, U, blank):
@@ -236,6 +237,148 @@ def cu_kernel_compute_grad(log_probs, labels, alpha, beta, grads, T, U, blank):
                 )
 
 
+def _skew(x):
+    """Returns the anti-diagonals of x [B, T, U]: out[b, n, u] = x[b, n-u, u]
+    (-inf outside of x), with shape [B, T+U-1, U]."""
+    B, maxT, maxU = x.shape
+    n = torch.arange(maxT + maxU - 1, device=x.device).unsqueeze(1)
+    u = torch.arange(maxU, device=x.device).unsqueeze(0)
+    t = n - u
+    out = x[:, t.clamp(0, maxT - 1), u]
+    return out.masked_fill(~((t >= 0) & (t < maxT)), float("-inf"))
+
+
+def _unskew(x, maxT):
+    """Inverse of _skew: returns out[b, t, u] = x[b, t+u, u]."""
+    t = torch.arange(maxT, device=x.device).unsqueeze(1)
+    u = torch.arange(x.shape[2], device=x.device).unsqueeze(0)
+    return x[:, t + u, u]
+
+
+def transducer_forward_backward(blank_lp, emit_lp, T, U):
+    """Forward-backward algorithm on the transducer lattice, in PyTorch.
+
+    The nodes (t, u) on the same anti-diagonal t + u = n only depend on the
+    nodes of diagonal n - 1 (alpha) or n + 1 (beta), so the recursions are
+    vectorized over the batch and the nodes of each diagonal.
+
+    Arguments
+    ---------
+    blank_lp : tensor
+        3D Tensor of (batch x TimeLength x LabelLength) of the blank
+        log-probabilities.
+    emit_lp : tensor
+        3D Tensor of (batch x TimeLength x LabelLength) of the
+        log-probabilities of the next label (the last column is unused).
+    T : tensor
+        1D Tensor of (batch) containing TimeLength of each target.
+    U : tensor
+        1D Tensor of (batch) containing LabelLength of each target.
+
+    Returns
+    -------
+    log_p : tensor
+        1D Tensor of (batch) of the log-likelihood of each target.
+    blank_grads, emit_grads : tensor
+        3D Tensors of (batch x TimeLength x LabelLength) of the derivatives
+        of log_p with respect to blank_lp and emit_lp (the occupation
+        probabilities of the blank and label transitions).
+
+    Example
+    -------
+    >>> blank_lp = torch.log(torch.full((1, 2, 2), 0.5))
+    >>> emit_lp = torch.log(torch.full((1, 2, 2), 0.5))
+    >>> log_p, _, _ = transducer_forward_backward(
+    ...     blank_lp, emit_lp, torch.tensor([2]), torch.tensor([1])
+    ... )
+    >>> log_p.exp()
+    tensor([0.2500])
+    """
+    B, maxT, maxU = blank_lp.shape
+    device = blank_lp.device
+    T, U = T.long().to(device), U.long().to(device)
+    blank_d, emit_d = _skew(blank_lp), _skew(emit_lp)
+    num_diags = blank_d.shape[1]
+
+    # Nodes of each utterance, on the diagonals
+    n = torch.arange(num_diags, device=device).view(1, -1, 1)
+    u = torch.arange(maxU, device=device).view(1, 1, -1)
+    valid = (n - u >= 0) & (n - u < T.view(-1, 1, 1)) & (u <= U.view(-1, 1, 1))
+    # Last node (T-1, U) of each utterance, with the final blank
+    is_last = (n == (T + U - 1).view(-1, 1, 1)) & (u == U.view(-1, 1, 1))
+    last_blank = blank_lp[torch.arange(B, device=device), T - 1, U]
+
+    alpha = torch.full_like(blank_d, float("-inf"))
+    alpha[:, 0, 0] = 0.0
+    for i in range(1, num_diags):
+        no_emit = alpha[:, i - 1] + blank_d[:, i - 1]
+        emit = F.pad(
+            alpha[:, i - 1, :-1] + emit_d[:, i - 1, :-1],
+            (1, 0),
+            value=float("-inf"),
+        )
+        alpha[:, i] = torch.logaddexp(no_emit, emit).masked_fill(
+            ~valid[:, i], float("-inf")
+        )
+
+    beta = torch.full_like(blank_d, float("-inf"))
+    for i in range(num_diags - 1, -1, -1):
+        if i < num_diags - 1:
+            no_emit = beta[:, i + 1] + blank_d[:, i]
+            emit = (
+                F.pad(beta[:, i + 1, 1:], (0, 1), value=float("-inf"))
+                + emit_d[:, i]
+            )
+            beta[:, i] = torch.logaddexp(no_emit, emit).masked_fill(
+                ~valid[:, i], float("-inf")
+            )
+        beta[:, i] = torch.where(
+            is_last[:, i], last_blank.unsqueeze(1), beta[:, i]
+        )
+    log_p = beta[:, 0, 0]
+
+    # Occupation probabilities of the transitions
+    alpha, beta = _unskew(alpha, maxT), _unskew(beta, maxT)
+    beta_next_t = F.pad(beta[:, 1:], (0, 0, 0, 1), value=float("-inf"))
+    beta_next_t[torch.arange(B, device=device), T - 1, U] = 0.0
+    beta_next_u = F.pad(beta[:, :, 1:], (0, 1), value=float("-inf"))
+    log_p_ = log_p.view(-1, 1, 1)
+    blank_grads = (alpha + blank_lp + beta_next_t - log_p_).exp()
+    emit_grads = (alpha + emit_lp + beta_next_u - log_p_).exp()
+    return log_p, blank_grads, emit_grads
+
+
+def _gather_emit(x, labels, maxU):
+    """Gathers x[b, t, u, labels[b, u]] into a [B, T, maxU] tensor (the last
+    column is -inf)."""
+    labels = labels.long()[:, : maxU - 1]
+    index = labels.unsqueeze(1).expand(-1, x.shape[1], -1).unsqueeze(-1)
+    emit = x[:, :, : maxU - 1].gather(3, index).squeeze(-1)
+    return F.pad(emit, (0, 1), value=float("-inf"))
+
+
+def _scatter_emit(grads, labels, emit_grads, maxU):
+    """Adds emit_grads[b, t, u] to grads[b, t, u, labels[b, u]]."""
+    labels = labels.long()[:, : maxU - 1]
+    index = labels.unsqueeze(1).expand(-1, grads.shape[1], -1).unsqueeze(-1)
+    grads[:, :, : maxU - 1].scatter_add_(
+        3, index, emit_grads[:, :, : maxU - 1].unsqueeze(-1)
+    )
+
+
+def _reduce(log_p, T, reduction):
+    """Normalizes the log-likelihoods over time and reduces the losses."""
+    log_p = log_p / T.to(log_p)
+    if reduction == "mean":
+        return -log_p.mean()
+    elif reduction == "sum":
+        return sum(-log_p)
+    elif reduction == "none":
+        return -log_p
+    else:
+        raise Exception("Unexpected reduction {}".format(reduction))
+
+
 class Transducer(Function):
     """
     This class implements the Transducer loss computation with forward-backward algorithm
@@ -244,6 +387,11 @@ class Transducer(Function):
     This class use torch.autograd.Function. In fact of using the forward-backward algorithm,
     we need to compute the gradient manually.
 
+    The Numba CUDA kernels are used for inputs on a CUDA device, and the
+    PyTorch implementation (transducer_forward_backward) otherwise. Both
+    return the negative log-likelihood normalized by the TimeLength, and
+    the gradients of the (unnormalized) negative log-likelihood.
+
     This class can't be instantiated, please refer to TransducerLoss class
 
     It is also possible to use this class directly by using Transducer.apply
@@ -254,6 +402,19 @@ class Transducer(Function):
         """Computes the transducer loss."""
         log_probs = log_probs.detach()
         B, maxT, maxU, A = log_probs.shape
+        if cuda is None or not log_probs.is_cuda:
+            log_p, blank_grads, emit_grads = transducer_forward_backward(
+                log_probs[..., blank],
+                _gather_emit(log_probs, labels, maxU),
+                T,
+                U,
+            )
+            grads = torch.zeros_like(log_probs)
+            grads[..., blank] = -blank_grads
+            _scatter_emit(grads, labels, -emit_grads, maxU)
+            ctx.grads = grads
+            return _reduce(log_p, T, reduction)
+
         grads = torch.zeros(
             (B, maxT, maxU, A), dtype=torch.float32, device=log_probs.device
         )
@@ -276,7 +437,6 @@ class Transducer(Function):
         )
         ctx.grads = grads
         del alpha, beta, lock, log_p_beta, T, U, log_probs, labels
-        torch.cuda.empty_cache()
         if reduction == "mean":
             return -log_p_alpha.mean()
         elif reduction == "sum":
@@ -293,6 +453,57 @@ class Transducer(Function):
         return ctx.grads.mul_(grad_output), None, None, None, None, None, None
 
 
+class FusedTransducer(Function):
+    """
+    This class implements the Transducer loss computation from the logits,
+    merging the log-softmax and the loss (function merging, from "Improving
+    RNN Transducer Modeling for End-to-End Speech Recognition", Li et al.
+    2019).
+
+    Only the blank and label log-probabilities are computed in the forward,
+    and the gradients with respect to the logits are computed directly in
+    the backward, as softmax * occupation - one_hot(transition) terms. So
+    the only 4D tensor created is the gradient of the logits, instead of
+    the log-probabilities, their gradients and the gradient of the logits.
+
+    The loss and gradients are the same as the log-softmax followed by
+    Transducer (computed with transducer_forward_backward).
+
+    It is also possible to use this class directly by using
+    FusedTransducer.apply
+    """
+
+    @staticmethod
+    def forward(ctx, logits, labels, T, U, blank, reduction):
+        """Computes the transducer loss."""
+        B, maxT, maxU, A = logits.shape
+        with torch.no_grad():
+            # One utterance at a time, to bound the temporary memory
+            lse = torch.stack([logit.logsumexp(-1) for logit in logits])
+            log_p, blank_grads, emit_grads = transducer_forward_backward(
+                logits[..., blank] - lse,
+                _gather_emit(logits, labels, maxU) - lse,
+                T,
+                U,
+            )
+        ctx.save_for_backward(logits, labels, lse, blank_grads, emit_grads)
+        ctx.blank = blank
+        return _reduce(log_p, T, reduction)
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        """Backward computations for the transducer loss."""
+        logits, labels, lse, blank_grads, emit_grads = ctx.saved_tensors
+        maxU = logits.shape[2]
+        # softmax * occupation of the node, computed in place
+        grads = torch.sub(logits.detach(), lse.unsqueeze(-1))
+        grads.exp_().mul_((blank_grads + emit_grads).unsqueeze(-1))
+        grads[..., ctx.blank] -= blank_grads
+        _scatter_emit(grads, labels, -emit_grads, maxU)
+        grads.mul_(grad_output.view(-1, 1, 1, 1).to(grads))
+        return grads, None, None, None, None, None, None
+
+
 class TransducerLoss(Module):
     """
     This class implements the Transduce loss computation with forward-backward algorithm.
@@ -301,51 +512,33 @@ class TransducerLoss(Module):
     The TranducerLoss(nn.Module) use Transducer(autograd.Function)
     to compute the forward-backward loss and gradients.
 
-    Input tensors must be on a cuda device.
+    With fused=True, the loss is computed from the logits with
+    FusedTransducer, which needs less memory.
 
     Example
     -------
     >>> import torch
     >>> loss = TransducerLoss(blank=0)
-    >>> logits = torch.randn((1,2,3,5)).cuda().requires_grad_()
-    >>> labels = torch.Tensor([[1,2]]).cuda().int()
-    >>> act_length = torch.Tensor([2]).cuda().int()
+    >>> logits = torch.randn((1,2,3,5)).requires_grad_()
+    >>> labels = torch.Tensor([[1,2]]).int()
+    >>> act_length = torch.Tensor([2]).int()
     >>> # U = label_length+1
-    >>> label_length = torch.Tensor([2]).cuda().int()
+    >>> label_length = torch.Tensor([2]).int()
     >>> l = loss(logits, labels, act_length, label_length)
     >>> l.backward()
     """
 
-    def __init__(self, blank=0, reduction="mean"):
+    def __init__(self, blank=0, reduction="mean", fused=False):
         super(TransducerLoss, self).__init__()
         self.blank = blank
         self.reduction = reduction
-        self.loss = Transducer.apply
-        try:
-            cuda.cuda_paths
-        except ImportError:
-            err_msg = "cannot import numba. To use Transducer loss\n"
-            err_msg += "=============================\n"
-            err_msg += "If you use your localhost:\n"
-            err_msg += "pip install numba\n"
-            err_msg += (
-                "export NUMBAPRO_LIBDEVICE='/usr/local/cuda/nvvm/libdevice/' \n"
-            )
-            err_msg += "export NUMBAPRO_NVVM='/usr/local/cuda/nvvm/lib64/libnvvm.so' \n"
-            err_msg += "================================ \n"
-            err_msg += "If you use conda:\n"
-            err_msg += "conda install numba cudatoolkit=XX (XX is your cuda toolkit version)"
-            raise ImportError(err_msg)
+        self.fused = fused
+        self.loss = FusedTransducer.apply if fused else Transducer.apply
 
     def forward(self, logits, labels, T, U):
         """Computes the transducer loss."""
+        if self.fused:
+            return self.loss(logits, labels, T, U, self.blank, self.reduction)
         # Transducer.apply function take log_probs tensor.
-        if logits.device == labels.device == T.device == U.device == "cuda":
-            log_probs = logits.log_softmax(-1)
-            return self.loss(
-                log_probs, labels, T, U, self.blank, self.reduction
-            )
-        else:
-            raise ValueError(
-                f"Found inputs tensors to be on {[logits.device, labels.device, T.device, U.device]} while needed to be on a 'cuda' device to use the transducer loss."
-            )
+        log_probs = logits.log_softmax(-1)
+        return self.loss(log_probs, labels, T, U, self.blank, self.reduction)
@@ -32,6 +32,7 @@ def transducer_loss(
     blank_index,
     reduction="mean",
     use_torchaudio=True,
+    fused=False,
 ):
     """Transducer loss, see `speechbrain/nnet/loss/transducer_loss.py`.
 
@@ -51,7 +52,12 @@ def transducer_loss(
         Specifies the reduction to apply to the output: 'mean' | 'batchmean' | 'sum'.
     use_torchaudio: bool
         If True, use Transducer loss implementation from torchaudio, otherwise,
-        use Speechbrain Numba implementation.
+        use Speechbrain implementation (Numba on CUDA devices, PyTorch
+        otherwise).
+    fused : bool
+        If True (and use_torchaudio is False), the Speechbrain loss is
+        computed from the logits without materializing the log-softmax
+        and its gradients, which saves memory.
     """
     input_lens = (input_lens * logits.shape[1]).round().int()
     target_lens = (target_lens * targets.shape[1]).round().int()
@@ -64,7 +70,7 @@ def transducer_loss(
             err_msg += "Cannot import torchaudio.functional.rnnt_loss.\n"
             err_msg += "To use it, please install torchaudio >= 0.10.0\n"
             err_msg += "==================\n"
-            err_msg += "Otherwise, you can use our numba implementation, set `use_torchaudio=False`.\n"
+            err_msg += "Otherwise, you can use our implementation, set `use_torchaudio=False`.\n"
             raise ImportError(err_msg)
 
         return rnnt_loss(
@@ -76,8 +82,15 @@ def transducer_loss(
             reduction=reduction,
         )
     else:
-        from speechbrain.nnet.loss.transducer_loss import Transducer
+        from speechbrain.nnet.loss.transducer_loss import (
+            FusedTransducer,
+            Transducer,
+        )
 
+        if fused:
+            return FusedTransducer.apply(
+                logits, targets, input_lens, target_lens, blank_index, reduction
+            )
         # Transducer.apply function take log_probs tensor.
         log_probs = logits.log_softmax(-1)
         return Transducer.apply(
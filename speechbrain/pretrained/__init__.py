@@ -1,3 +1,4 @@
 """Pretrained models"""
 
 from .interfaces import *  # noqa
+from .batching import DynamicBatcher  # noqa
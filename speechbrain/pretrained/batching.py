@@ -0,0 +1,312 @@
+"""Dynamic batching of concurrent requests to pretrained models.
+
+A service that receives many concurrent requests, each with a single
+utterance, would otherwise call the *_batch methods of the Pretrained
+interfaces with batches of one. The DynamicBatcher collects the requests
+in a queue and runs them together, in batches of similar lengths.
+"""
+import time
+import inspect
+import asyncio
+import logging
+import threading
+import collections
+import concurrent.futures
+import torch
+
+logger = logging.getLogger(__name__)
+
+_Request = collections.namedtuple("_Request", ["wav", "future", "arrival"])
+
+
+class DynamicBatcher:
+    """Runs the requests of concurrent callers in batches.
+
+    The requests are queued, and a background thread runs them with
+    batch_fn as soon as max_batch_size requests are waiting, or as soon as
+    the oldest request has waited for max_wait seconds. The oldest request
+    is always in the next batch, with the waiting requests whose lengths
+    are the closest to its own, to limit the padding.
+
+    The outputs of batch_fn are split into the outputs of each request:
+    tensors along their first dimension, lists by item, and tuples (e.g.
+    several return values) and dicts element-wise. Note that the tensor
+    outputs of a request keep the padding of the batch.
+
+    The batcher is thread-safe, and can be used from asyncio code with
+    submit_async.
+
+    Arguments
+    ---------
+    batch_fn : callable
+        Called with a batch of waveforms [batch, time] or [batch, time,
+        channels] and (if it takes them) their relative lengths [batch],
+        e.g. EncoderDecoderASR.transcribe_batch or
+        EncoderClassifier.classify_batch.
+    max_batch_size : int
+        Maximum number of requests in a batch.
+    max_wait : float
+        Maximum time (in seconds) that a request waits for other requests
+        before its batch is run.
+    takes_lengths : bool
+        Whether batch_fn takes the relative lengths as second argument.
+        If None, it is True if batch_fn takes more than one argument.
+    max_history : int
+        Number of recent batches (and their requests) used for the
+        statistics.
+
+    Example
+    -------
+    >>> def batch_fn(wavs, wav_lens):
+    ...     return wavs.sum(dim=1), [len(wav) for wav in wavs]
+    >>> with DynamicBatcher(batch_fn, max_batch_size=4) as batcher:
+    ...     futures = [batcher.submit(torch.ones(3)) for _ in range(8)]
+    ...     outputs = [future.result() for future in futures]
+    >>> outputs[0]
+    (tensor(3.), 3)
+    >>> batcher.stats()["num_requests"]
+    8
+    """
+
+    def __init__(
+        self,
+        batch_fn,
+        max_batch_size=16,
+        max_wait=0.01,
+        takes_lengths=None,
+        max_history=1000,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        if takes_lengths is None:
+            parameters = inspect.signature(batch_fn).parameters
+            takes_lengths = len(parameters) > 1
+        self.takes_lengths = takes_lengths
+
+        self._pending = []
+        self._closed = False
+        self._condition = threading.Condition()
+        self._stats_lock = threading.Lock()
+        self._num_requests = 0
+        self._num_batches = 0
+        self._queue_times = collections.deque(maxlen=max_history)
+        self._batch_sizes = collections.deque(maxlen=max_history)
+        self._padding = collections.deque(maxlen=max_history)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, wav):
+        """Queues a request.
+
+        Arguments
+        ---------
+        wav : torch.tensor
+            The waveform of the request, [time] or [time, channels].
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Its result is the output of batch_fn for this request.
+        """
+        future = concurrent.futures.Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot submit to a closed DynamicBatcher")
+            self._pending.append(_Request(wav, future, time.monotonic()))
+            self._condition.notify()
+        return future
+
+    async def submit_async(self, wav):
+        """Queues a request and waits for its output, in asyncio code."""
+        return await asyncio.wrap_future(self.submit(wav))
+
+    def __call__(self, wav):
+        """Queues a request and waits for its output."""
+        return self.submit(wav).result()
+
+    def close(self):
+        """Runs the requests that are still waiting, then stops the
+        background thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def stats(self):
+        """Returns the statistics of the batcher.
+
+        The queue times (from the submission of a request to the start of
+        its batch, in seconds), the batch sizes and the padding (fraction of
+        the batch that is padding) are computed on the recent batches.
+
+        Returns
+        -------
+        dict
+            With keys num_requests, num_batches, mean_batch_size,
+            mean_padding, and mean_queue_time, p50_queue_time and
+            p99_queue_time.
+        """
+        with self._stats_lock:
+            stats = {
+                "num_requests": self._num_requests,
+                "num_batches": self._num_batches,
+            }
+            if not self._batch_sizes:
+                return stats
+            queue_times = torch.tensor(self._queue_times, dtype=torch.float64)
+            batch_sizes = torch.tensor(self._batch_sizes, dtype=torch.float64)
+            padding = torch.tensor(self._padding, dtype=torch.float64)
+        stats["mean_batch_size"] = batch_sizes.mean().item()
+        stats["mean_padding"] = padding.mean().item()
+        stats["mean_queue_time"] = queue_times.mean().item()
+        stats["p50_queue_time"] = queue_times.quantile(0.5).item()
+        stats["p99_queue_time"] = queue_times.quantile(0.99).item()
+        return stats
+
+    def _run(self):
+        """Runs the batches in the background thread."""
+        while True:
+            with self._condition:
+                while not self._batch_ready():
+                    if not self._pending:
+                        if self._closed:
+                            return
+                        self._condition.wait()
+                    else:
+                        oldest = self._pending[0].arrival
+                        self._condition.wait(
+                            oldest + self.max_wait - time.monotonic()
+                        )
+                requests = self._take_batch()
+            self._run_batch(requests)
+
+    def _batch_ready(self):
+        """Whether the next batch should run now."""
+        if not self._pending:
+            return False
+        waited = time.monotonic() - self._pending[0].arrival
+        return (
+            self._closed
+            or len(self._pending) >= self.max_batch_size
+            or waited >= self.max_wait
+        )
+
+    def _take_batch(self):
+        """Removes the next batch from the pending requests: the oldest one
+        and those with the closest lengths."""
+        if len(self._pending) <= self.max_batch_size:
+            requests, self._pending = self._pending, []
+            return requests
+        oldest_len = len(self._pending[0].wav)
+        closest = sorted(
+            range(1, len(self._pending)),
+            key=lambda i: abs(len(self._pending[i].wav) - oldest_len),
+        )
+        selected = set([0] + closest[: self.max_batch_size - 1])
+        requests = [self._pending[i] for i in sorted(selected)]
+        self._pending = [
+            request
+            for i, request in enumerate(self._pending)
+            if i not in selected
+        ]
+        return requests
+
+    def _run_batch(self, requests):
+        """Runs batch_fn on the requests and sets the results of their
+        futures."""
+        requests = [
+            request
+            for request in requests
+            if request.future.set_running_or_notify_cancel()
+        ]
+        if not requests:
+            return
+        start = time.monotonic()
+        lengths = torch.tensor(
+            [len(request.wav) for request in requests], dtype=torch.float
+        )
+        try:
+            wavs = torch.nn.utils.rnn.pad_sequence(
+                [request.wav for request in requests], batch_first=True
+            )
+            with torch.no_grad():
+                if self.takes_lengths:
+                    outputs = self.batch_fn(wavs, lengths / lengths.max())
+                else:
+                    outputs = self.batch_fn(wavs)
+            results = split_batch_outputs(outputs, len(requests))
+        except Exception as e:
+            logger.exception("DynamicBatcher: batch failed")
+            for request in requests:
+                request.future.set_exception(e)
+            return
+
+        with self._stats_lock:
+            self._num_requests += len(requests)
+            self._num_batches += 1
+            self._batch_sizes.append(len(requests))
+            self._padding.append(
+                1
+                - lengths.sum().item() / (len(requests) * lengths.max().item())
+            )
+            self._queue_times.extend(start - r.arrival for r in requests)
+        for request, result in zip(requests, results):
+            request.future.set_result(result)
+
+
+def split_batch_outputs(outputs, batch_size):
+    """Splits the outputs of a batch into the outputs of each item.
+
+    Tensors are split along their first dimension and lists by item. Tuples
+    and dicts are split element-wise (each element being an output for the
+    whole batch). Anything else, e.g. None, is given to all the items.
+
+    Arguments
+    ---------
+    outputs : any
+        The outputs for the batch.
+    batch_size : int
+        The number of items in the batch.
+
+    Returns
+    -------
+    list
+        The outputs of each item.
+
+    Example
+    -------
+    >>> split_batch_outputs((torch.tensor([1, 2]), ["a", "b"]), 2)
+    [(tensor(1), 'a'), (tensor(2), 'b')]
+    """
+    if isinstance(outputs, torch.Tensor) and outputs.dim() > 0:
+        if outputs.shape[0] != batch_size:
+            raise ValueError(
+                f"Expected {batch_size} outputs, got a tensor of shape "
+                f"{tuple(outputs.shape)}"
+            )
+        return list(outputs)
+    elif isinstance(outputs, list):
+        if len(outputs) != batch_size:
+            raise ValueError(
+                f"Expected {batch_size} outputs, got {len(outputs)}"
+            )
+        return outputs
+    elif isinstance(outputs, tuple):
+        split = [split_batch_outputs(output, batch_size) for output in outputs]
+        return [tuple(item) for item in zip(*split)]
+    elif isinstance(outputs, dict):
+        split = {
+            key: split_batch_outputs(output, batch_size)
+            for key, output in outputs.items()
+        }
+        return [
+            {key: split[key][i] for key in split} for i in range(batch_size)
+        ]
+    return [outputs] * batch_size
@@ -9,9 +9,13 @@ Authors:
  * Abdel Heba 2021
  * Andreas Nautsch 2022
 """
+import os
+import sys
+import queue
 import logging
 import hashlib
-import sys
+import threading
+import concurrent.futures
 import speechbrain
 import torch
 import torchaudio
@@ -22,6 +26,7 @@ from torch.nn import DataParallel as DP
 from hyperpyyaml import load_hyperpyyaml
 from speechbrain.pretrained.fetching import fetch
 from speechbrain.dataio.preprocess import AudioNormalizer
+from speechbrain.decoders.ctc import CTCPrefixBeamSearcher
 import torch.nn.functional as F
 from torch.nn.parallel import DistributedDataParallel as DDP
 from speechbrain.utils.data_utils import split_path
@@ -30,6 +35,7 @@ from speechbrain.dataio.batch import PaddedBatch, PaddedData
 from speechbrain.utils.data_pipeline import DataPipeline
 from speechbrain.utils.callchains import lengths_arg_exists
 from speechbrain.utils.superpowers import import_from_path
+from joblib.externals.loky import get_reusable_executor
 
 logger = logging.getLogger(__name__)
 
@@ -525,7 +531,230 @@ class EndToEndSLU(Pretrained):
         return self.decode_batch(wavs, wav_lens)
 
 
-class EncoderDecoderASR(Pretrained):
+class LongFormTranscriptionMixin:
+    """Transcription of long audio files, for the ASR interfaces.
+
+    Each file is read in overlapping windows of bounded size, that are
+    packed into batches (possibly with windows of other files) and
+    transcribed with transcribe_batch(). The token sequences of consecutive
+    windows are then stitched at their overlap. So the memory used does not
+    depend on the length of the files and the cost is linear in it.
+
+    The windows can also be taken from the speech segments found by a VAD,
+    in which case long segments are split into overlapping windows as well.
+
+    The class using it must provide transcribe_batch(wavs, wav_lens), which
+    returns the predicted words and tokens, and _decode_tokens(token_seqs),
+    which turns token sequences into words.
+    """
+
+    def transcribe_long_file(self, path, **kwargs):
+        """Transcribes a (possibly very long) audio file.
+
+        Arguments
+        ---------
+        path : str
+            Path to the audio file to transcribe.
+        **kwargs
+            See transcribe_long_files.
+
+        Returns
+        -------
+        str
+            The transcription of the file.
+        """
+        return self.transcribe_long_files([path], **kwargs)[path]
+
+    def transcribe_long_files(
+        self,
+        paths,
+        window_size=30.0,
+        overlap=5.0,
+        batch_size=8,
+        vad=None,
+        num_workers=1,
+    ):
+        """Transcribes (possibly very long) audio files.
+
+        Arguments
+        ---------
+        paths : list
+            Paths to the audio files to transcribe.
+        window_size : float
+            Length (in seconds) of the windows given to the model.
+        overlap : float
+            Overlap (in seconds) between consecutive windows, used to stitch
+            their transcriptions. Must be less than half of window_size.
+        batch_size : int
+            Number of windows transcribed at once.
+        vad : VAD
+            If given, only the speech segments found by this VAD are
+            transcribed, and the transcriptions of the segments are
+            joined with spaces.
+        num_workers : int
+            Number of threads reading the audio files.
+
+        Returns
+        -------
+        dict
+            The transcription of each file, indexed by the paths.
+        """
+        if not 0 <= 2 * overlap < window_size:
+            raise ValueError("overlap must be less than half of window_size")
+
+        # Token sequences of the windows of each segment of each file
+        window_tokens = [{} for _ in paths]
+
+        def read_file(idx):
+            path = paths[idx]
+            if not os.path.isfile(path):
+                source, fl = split_path(path)
+                path = fetch(fl, source=source)
+            segments = None
+            if vad is not None:
+                segments = vad.get_speech_segments(path).tolist()
+            for key, wav in self._read_windows(
+                path, window_size, overlap, segments
+            ):
+                yield (idx, *key), wav
+
+        def process_batch(batch):
+            wavs = [wav for _, wav in batch]
+            wav_lens = torch.tensor(
+                [len(wav) for wav in wavs], dtype=torch.float
+            )
+            wavs = torch.nn.utils.rnn.pad_sequence(wavs, batch_first=True)
+            _, predicted_tokens = self.transcribe_batch(
+                wavs, wav_lens / wav_lens.max()
+            )
+            for ((idx, segment, window), wav), tokens in zip(
+                batch, predicted_tokens
+            ):
+                duration = len(wav) / self.audio_normalizer.sample_rate
+                window_tokens[idx].setdefault(segment, []).append(
+                    ([int(token) for token in tokens], duration)
+                )
+
+        batch = []
+        for item in _read_in_background(
+            read_file, len(paths), num_workers, prefetch=2 * batch_size
+        ):
+            batch.append(item)
+            if len(batch) == batch_size:
+                process_batch(batch)
+                batch = []
+        if batch:
+            process_batch(batch)
+
+        transcriptions = {}
+        for path, segments in zip(paths, window_tokens):
+            tokens = [
+                _stitch_windows(segments[segment], overlap)
+                for segment in sorted(segments)
+            ]
+            words = self._decode_tokens(tokens)
+            transcriptions[path] = " ".join(w for w in words if w)
+        return transcriptions
+
+    def _read_windows(self, path, window_size, overlap, segments=None):
+        """Yields ((segment, window), waveform) for the overlapping windows
+        of the audio file (or of its speech segments, given in seconds), in
+        order. The waveforms are normalized with the audio_normalizer."""
+        info = torchaudio.info(path)
+        sample_rate = info.sample_rate
+        if segments is None:
+            segments = [(0.0, info.num_frames / sample_rate)]
+        window_len = int(window_size * sample_rate)
+        step = window_len - int(overlap * sample_rate)
+
+        for segment, (begin, end) in enumerate(segments):
+            begin = int(begin * sample_rate)
+            end = min(int(end * sample_rate), info.num_frames)
+            window, start = 0, begin
+            while start < end:
+                num_frames = min(window_len, end - start)
+                signal, sr = torchaudio.load(
+                    path,
+                    frame_offset=start,
+                    num_frames=num_frames,
+                    channels_first=False,
+                )
+                yield (segment, window), self.audio_normalizer(signal, sr)
+                if start + window_len >= end:
+                    break
+                window, start = window + 1, start + step
+
+
+def _stitch_windows(windows, overlap):
+    """Stitches the token sequences of consecutive overlapping windows.
+
+    Arguments
+    ---------
+    windows : list
+        The (tokens, duration in seconds) of each window, in order.
+    overlap : float
+        The overlap (in seconds) between consecutive windows.
+
+    Returns
+    -------
+    list
+        The stitched token sequence.
+
+    Example
+    -------
+    >>> _stitch_windows([([1, 2, 3, 4, 5], 5.0), ([4, 5, 6, 7], 4.0)], 2.0)
+    [1, 2, 3, 4, 5, 6, 7]
+    """
+    tokens, _ = windows[0]
+    for (left, left_dur), (right, right_dur) in zip(windows, windows[1:]):
+        # Number of tokens expected in the overlap of each window
+        left_overlap = round(len(left) * overlap / left_dur)
+        right_overlap = round(len(right) * overlap / right_dur)
+        tokens = _merge_overlap(tokens, right, left_overlap, right_overlap)
+    return tokens
+
+
+def _merge_overlap(left, right, left_overlap, right_overlap):
+    """Merges two token sequences whose ends overlap.
+
+    The longest common run of tokens between the end of left and the start
+    of right (searched within twice the expected overlap) is used to align
+    them. If there is no long enough common run, the overlap is split in
+    the middle.
+
+    Example
+    -------
+    >>> _merge_overlap([1, 2, 3, 4, 5], [4, 5, 6], 2, 2)
+    [1, 2, 3, 4, 5, 6]
+    >>> _merge_overlap([1, 2, 3, 4], [8, 9, 5, 6], 2, 2)
+    [1, 2, 3, 9, 5, 6]
+    """
+    tail_len = min(len(left), 2 * left_overlap + 1)
+    head_len = min(len(right), 2 * right_overlap + 1)
+    tail, head = left[len(left) - tail_len :], right[:head_len]
+
+    # Longest common substring of tail and head
+    best_len, best_tail_end, best_head_end = 0, 0, 0
+    previous = [0] * (head_len + 1)
+    for i in range(1, tail_len + 1):
+        current = [0] * (head_len + 1)
+        for j in range(1, head_len + 1):
+            if tail[i - 1] == head[j - 1]:
+                current[j] = previous[j - 1] + 1
+                if current[j] > best_len:
+                    best_len, best_tail_end, best_head_end = current[j], i, j
+        previous = current
+
+    if best_len > 0 and best_len >= min(left_overlap, right_overlap) // 2:
+        cut = len(left) - tail_len + best_tail_end
+        return left[:cut] + right[best_head_end:]
+    return (
+        left[: len(left) - (left_overlap + 1) // 2]
+        + right[right_overlap // 2 :]
+    )
+
+
+class EncoderDecoderASR(Pretrained, LongFormTranscriptionMixin):
     """A ready-to-use Encoder-Decoder ASR model
 
     The class can be used either to run only the encoder (encode()) to extract
@@ -633,12 +862,15 @@ class EncoderDecoderASR(Pretrained):
             wav_lens = wav_lens.to(self.device)
             encoder_out = self.encode_batch(wavs, wav_lens)
             predicted_tokens, scores = self.mods.decoder(encoder_out, wav_lens)
-            predicted_words = [
-                self.tokenizer.decode_ids(token_seq)
-                for token_seq in predicted_tokens
-            ]
+            predicted_words = self._decode_tokens(predicted_tokens)
         return predicted_words, predicted_tokens
 
+    def _decode_tokens(self, token_seqs):
+        """Converts the predicted token sequences into words."""
+        return [
+            self.tokenizer.decode_ids(token_seq) for token_seq in token_seqs
+        ]
+
     def forward(self, wavs, wav_lens):
         """Runs full transcription - note: no gradients through decoding"""
         return self.transcribe_batch(wavs, wav_lens)
@@ -722,7 +954,7 @@ class WaveformEncoder(Pretrained):
         return self.encode_batch(wavs, wav_lens)
 
 
-class EncoderASR(Pretrained):
+class EncoderASR(Pretrained, LongFormTranscriptionMixin):
     """A ready-to-use Encoder ASR model
 
     The class can be used either to run only the encoder (encode()) to extract
@@ -730,6 +962,11 @@ class EncoderASR(Pretrained):
     (transcribe()) to transcribe speech. The given YAML must contains the fields
     specified in the *_NEEDED[] lists.
 
+    The decoding_function is called on the encoder output and the relative
+    lengths, e.g., ctc_greedy_decode or, for beam search with an optional
+    N-gram LM, a speechbrain.decoders.ctc.CTCPrefixBeamSearcher (its
+    vocab_list is then taken from the tokenizer if not given).
+
     Example
     -------
     >>> from speechbrain.pretrained import EncoderASR
@@ -750,6 +987,28 @@ class EncoderASR(Pretrained):
         self.tokenizer = self.hparams.tokenizer
         self.decoding_function = self.hparams.decoding_function
 
+        # The prefix beam search needs the token strings for LM fusion
+        if (
+            isinstance(self.decoding_function, CTCPrefixBeamSearcher)
+            and self.decoding_function.vocab_list is None
+        ):
+            self.decoding_function.vocab_list = self._get_vocab_list()
+
+    def _get_vocab_list(self):
+        """Returns the string of each token index of the tokenizer."""
+        if isinstance(
+            self.tokenizer, speechbrain.dataio.encoder.CTCTextEncoder
+        ):
+            return [
+                self.tokenizer.ind2lab[i] for i in range(len(self.tokenizer))
+            ]
+        elif isinstance(self.tokenizer, sentencepiece.SentencePieceProcessor):
+            return [
+                self.tokenizer.id_to_piece(i)
+                for i in range(self.tokenizer.get_piece_size())
+            ]
+        return None
+
     def transcribe_file(self, path):
         """Transcribes the given audiofile into a sequence of words.
 
@@ -831,27 +1090,26 @@ class EncoderASR(Pretrained):
             wav_lens = wav_lens.to(self.device)
             encoder_out = self.encode_batch(wavs, wav_lens)
             predictions = self.decoding_function(encoder_out, wav_lens)
-            if isinstance(
-                self.tokenizer, speechbrain.dataio.encoder.CTCTextEncoder
-            ):
-                predicted_words = [
-                    "".join(self.tokenizer.decode_ndim(token_seq))
-                    for token_seq in predictions
-                ]
-            elif isinstance(
-                self.tokenizer, sentencepiece.SentencePieceProcessor
-            ):
-                predicted_words = [
-                    self.tokenizer.decode_ids(token_seq)
-                    for token_seq in predictions
-                ]
-            else:
-                sys.exit(
-                    "The tokenizer must be sentencepiece or CTCTextEncoder"
-                )
+            predicted_words = self._decode_tokens(predictions)
 
         return predicted_words, predictions
 
+    def _decode_tokens(self, token_seqs):
+        """Converts the predicted token sequences into words."""
+        if isinstance(
+            self.tokenizer, speechbrain.dataio.encoder.CTCTextEncoder
+        ):
+            return [
+                "".join(self.tokenizer.decode_ndim(token_seq))
+                for token_seq in token_seqs
+            ]
+        elif isinstance(self.tokenizer, sentencepiece.SentencePieceProcessor):
+            return [
+                self.tokenizer.decode_ids(token_seq) for token_seq in token_seqs
+            ]
+        else:
+            sys.exit("The tokenizer must be sentencepiece or CTCTextEncoder")
+
     def forward(self, wavs, wav_lens):
         """Runs the encoder"""
         return self.encode_batch(wavs, wav_lens)
@@ -1183,6 +1441,39 @@ class VAD(Pretrained):
             Tensor containing the frame-level speech probabilities for the
             input audio file.
         """
+        prob_chunks = []
+        for small_chunks, large_chunk_len in self._read_large_chunks(
+            audio_file, large_chunk_size, small_chunk_size, overlap_small_chunk
+        ):
+            # Getting (in parallel) the frame-level speech probabilities
+            small_chunks_prob = self.get_speech_prob_chunk(small_chunks)
+
+            # Appending the frame-level speech probabilities of the large chunk
+            prob_chunks.append(
+                self._fold_chunk_probs(
+                    small_chunks_prob,
+                    large_chunk_len,
+                    small_chunk_size,
+                    overlap_small_chunk,
+                )
+            )
+
+        return self._concat_chunk_probs(prob_chunks, audio_file)
+
+    def _read_large_chunks(
+        self,
+        audio_file,
+        large_chunk_size,
+        small_chunk_size,
+        overlap_small_chunk,
+        device=None,
+    ):
+        """Reads the large chunks of the input audio file sequentially and
+        yields the small chunks extracted from each of them, together with
+        the length (in samples) of the (padded) large chunk."""
+        if device is None:
+            device = self.device
+
         # Getting the total size of the input file
         sample_rate, audio_len = self._get_audio_info(audio_file)
 
@@ -1204,7 +1495,6 @@ class VAD(Pretrained):
         small_chunk_len_step = int(sample_rate * small_chunk_step)
 
         # Loop over big chunks
-        prob_chunks = []
         last_chunk = False
         begin_sample = 0
         while True:
@@ -1213,7 +1503,7 @@ class VAD(Pretrained):
             large_chunk, fs = torchaudio.load(
                 audio_file, frame_offset=begin_sample, num_frames=long_chunk_len
             )
-            large_chunk = large_chunk.to(self.device)
+            large_chunk = large_chunk.to(device)
 
             # Manage padding of the last small chunk
             if last_chunk or large_chunk.shape[-1] < small_chunk_len:
@@ -1229,38 +1519,7 @@ class VAD(Pretrained):
                 stride=(1, small_chunk_len_step),
             )
             small_chunks = small_chunks.squeeze(0).transpose(0, 1)
-
-            # Getting (in parallel) the frame-level speech probabilities
-            small_chunks_prob = self.get_speech_prob_chunk(small_chunks)
-            small_chunks_prob = small_chunks_prob[:, :-1, :]
-
-            # Manage overlapping chunks
-            if overlap_small_chunk:
-                small_chunks_prob = self._manage_overlapped_chunks(
-                    small_chunks_prob
-                )
-
-            # Prepare for folding
-            small_chunks_prob = small_chunks_prob.permute(2, 1, 0)
-
-            # Computing lengths in samples
-            out_len = int(
-                large_chunk.shape[-1] / (sample_rate * self.time_resolution)
-            )
-            kernel_len = int(small_chunk_size / self.time_resolution)
-            step_len = int(small_chunk_step / self.time_resolution)
-
-            # Folding the frame-level predictions
-            small_chunks_prob = torch.nn.functional.fold(
-                small_chunks_prob,
-                output_size=(1, out_len),
-                kernel_size=(1, kernel_len),
-                stride=(1, step_len),
-            )
-
-            # Appending the frame-level speech probabilities of the large chunk
-            small_chunks_prob = small_chunks_prob.squeeze(1).transpose(-1, -2)
-            prob_chunks.append(small_chunks_prob)
+            yield small_chunks, large_chunk.shape[-1]
 
             # Check stop condition
             if last_chunk:
@@ -1273,6 +1532,52 @@ class VAD(Pretrained):
             if begin_sample + long_chunk_len > audio_len:
                 last_chunk = True
 
+    def _fold_chunk_probs(
+        self,
+        small_chunks_prob,
+        large_chunk_len,
+        small_chunk_size,
+        overlap_small_chunk,
+    ):
+        """Combines the speech probabilities of the small chunks into the
+        frame-level probabilities of the large chunk they come from."""
+        small_chunks_prob = small_chunks_prob[:, :-1, :]
+
+        # Setting the step size of the small chunk
+        small_chunk_step = small_chunk_size
+        if overlap_small_chunk:
+            small_chunk_step = small_chunk_size / 2
+
+        # Manage overlapping chunks
+        if overlap_small_chunk:
+            small_chunks_prob = self._manage_overlapped_chunks(
+                small_chunks_prob
+            )
+
+        # Prepare for folding
+        small_chunks_prob = small_chunks_prob.permute(2, 1, 0)
+
+        # Computing lengths in samples
+        out_len = int(
+            large_chunk_len / (self.sample_rate * self.time_resolution)
+        )
+        kernel_len = int(small_chunk_size / self.time_resolution)
+        step_len = int(small_chunk_step / self.time_resolution)
+
+        # Folding the frame-level predictions
+        small_chunks_prob = torch.nn.functional.fold(
+            small_chunks_prob,
+            output_size=(1, out_len),
+            kernel_size=(1, kernel_len),
+            stride=(1, step_len),
+        )
+        return small_chunks_prob.squeeze(1).transpose(-1, -2)
+
+    def _concat_chunk_probs(self, prob_chunks, audio_file):
+        """Concatenates the probabilities of the large chunks and removes the
+        frames computed on the padding."""
+        sample_rate, audio_len = self._get_audio_info(audio_file)
+
         # Converting the list to a tensor
         prob_vad = torch.cat(prob_chunks, dim=1)
         last_elem = int(audio_len / (self.time_resolution * sample_rate))
@@ -1335,6 +1640,16 @@ class VAD(Pretrained):
         if wav_lens is None:
             wav_lens = torch.ones(wavs.shape[0], device=self.device)
 
+        outputs = self._encode_chunk(wavs, wav_lens)
+        outputs, h = self.mods.rnn(outputs)
+        outputs = self.mods.dnn(outputs)
+        output_prob = torch.sigmoid(outputs)
+
+        return output_prob
+
+    def _encode_chunk(self, wavs, wav_lens):
+        """Computes the normalized features and the CNN outputs that are fed
+        to the recurrent layers."""
         # Storing waveform in the specified device
         wavs, wav_lens = wavs.to(self.device), wav_lens.to(self.device)
         wavs = wavs.float()
@@ -1349,12 +1664,7 @@ class VAD(Pretrained):
             outputs.shape[1],
             outputs.shape[2] * outputs.shape[3],
         )
-
-        outputs, h = self.mods.rnn(outputs)
-        outputs = self.mods.dnn(outputs)
-        output_prob = torch.sigmoid(outputs)
-
-        return output_prob
+        return outputs
 
     def apply_threshold(
         self, vad_prob, activation_th=0.5, deactivation_th=0.25
@@ -1596,9 +1906,9 @@ class VAD(Pretrained):
                     "segment_%03d " + value_format + value_format + "NON_SPEECH"
                 )
                 if print_boundaries:
-                    print(print_str % (cnt_seg, end_value, audio_len))
+                    print(print_str % (cnt_seg, last_end, audio_len))
                 if save_path is not None:
-                    f.write(print_str % (cnt_seg, end_value, audio_len) + "\n")
+                    f.write(print_str % (cnt_seg, last_end, audio_len) + "\n")
 
         if save_path is not None:
             f.close()
@@ -2014,6 +2324,217 @@ class VAD(Pretrained):
             overlap_small_chunk=overlap_small_chunk,
         )
 
+        boundaries = self._postprocess_speech_prob(
+            prob_chunks,
+            audio_file,
+            apply_energy_VAD=apply_energy_VAD,
+            close_th=close_th,
+            len_th=len_th,
+            activation_th=activation_th,
+            deactivation_th=deactivation_th,
+            en_activation_th=en_activation_th,
+            en_deactivation_th=en_deactivation_th,
+        )
+
+        # Double check speech segments
+        if double_check:
+            boundaries = self.double_check_speech_segments(
+                boundaries, audio_file, speech_th=speech_th
+            )
+
+        return boundaries
+
+    def get_speech_segments_batch(
+        self,
+        audio_files,
+        batch_size=32,
+        num_workers=2,
+        n_jobs=1,
+        save_dir=None,
+        large_chunk_size=30,
+        small_chunk_size=10,
+        overlap_small_chunk=False,
+        apply_energy_VAD=False,
+        double_check=True,
+        close_th=0.250,
+        len_th=0.250,
+        activation_th=0.5,
+        deactivation_th=0.25,
+        en_activation_th=0.5,
+        en_deactivation_th=0.0,
+        speech_th=0.50,
+    ):
+        """Detects the speech segments of many audio files.
+
+        The results are the same as calling get_speech_segments on each file,
+        but the work is organized to keep the device busy:
+            1- The audio files are read in background threads.
+            2- The small chunks of several files are packed into batches of
+               batch_size chunks for the neural network.
+            3- The post-processing of each file (thresholding, energy VAD,
+               merging and removal of short segments) runs in a pool of
+               n_jobs worker processes, while the next batches are computed.
+            4- The double check runs the neural VAD on the candidate
+               segments of each file, as soon as they are available.
+
+        Arguments
+        ---------
+        audio_files : list
+            Paths to the audio files.
+        batch_size : int
+            Number of small chunks processed by the neural network at once.
+            The small chunks of a large chunk are always in the same batch.
+        num_workers : int
+            Number of threads reading the audio files.
+        n_jobs : int
+            Number of worker processes for the post-processing. With 1, the
+            post-processing runs in the calling process.
+        save_dir : str
+            If given, the boundaries of each file are saved in this
+            directory, in a text file named after the audio file.
+        large_chunk_size, small_chunk_size, overlap_small_chunk,
+        apply_energy_VAD, double_check, close_th, len_th, activation_th,
+        deactivation_th, en_activation_th, en_deactivation_th, speech_th
+            See get_speech_segments.
+
+        Returns
+        -------
+        boundaries : dict
+            The boundaries of the speech segments of each audio file, as
+            returned by get_speech_segments, indexed by the paths in
+            audio_files.
+        """
+        postprocess_kwargs = {
+            "apply_energy_VAD": apply_energy_VAD,
+            "close_th": close_th,
+            "len_th": len_th,
+            "activation_th": activation_th,
+            "deactivation_th": deactivation_th,
+            "en_activation_th": en_activation_th,
+            "en_deactivation_th": en_deactivation_th,
+        }
+        if save_dir is not None:
+            os.makedirs(save_dir, exist_ok=True)
+
+        executor = None
+        if n_jobs > 1:
+            executor = get_reusable_executor(max_workers=n_jobs)
+
+        local_files = [None] * len(audio_files)
+        file_probs = [[] for _ in audio_files]
+        results = [None] * len(audio_files)
+        postprocessing = {}
+
+        def finish(idx, boundaries):
+            # Double check speech segments
+            if double_check:
+                boundaries = self.double_check_speech_segments(
+                    boundaries, local_files[idx], speech_th=speech_th
+                )
+            results[idx] = boundaries
+            if save_dir is not None:
+                name = os.path.splitext(os.path.basename(audio_files[idx]))[0]
+                self.save_boundaries(
+                    boundaries,
+                    save_path=os.path.join(save_dir, name + ".txt"),
+                    print_boundaries=False,
+                    audio_file=local_files[idx],
+                )
+
+        def collect_postprocessing(wait):
+            if not postprocessing:
+                return
+            done, _ = concurrent.futures.wait(
+                postprocessing,
+                timeout=None if wait else 0,
+                return_when=concurrent.futures.ALL_COMPLETED
+                if wait
+                else concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                finish(postprocessing.pop(future), future.result())
+
+        def process_batch(batch):
+            small_chunks = torch.cat([item[1] for item in batch])
+            probs = self.get_speech_prob_chunk(small_chunks)
+            probs = probs.split([item[1].shape[0] for item in batch])
+            for (idx, _, large_chunk_len, last), prob in zip(batch, probs):
+                file_probs[idx].append(
+                    self._fold_chunk_probs(
+                        prob,
+                        large_chunk_len,
+                        small_chunk_size,
+                        overlap_small_chunk,
+                    )
+                )
+                if not last:
+                    continue
+                prob_chunks = self._concat_chunk_probs(
+                    file_probs[idx], local_files[idx]
+                )
+                file_probs[idx] = None
+                if executor is None:
+                    boundaries = self._postprocess_speech_prob(
+                        prob_chunks, local_files[idx], **postprocess_kwargs
+                    )
+                    finish(idx, boundaries)
+                else:
+                    future = executor.submit(
+                        _postprocess_speech_prob,
+                        self.time_resolution,
+                        self.sample_rate,
+                        prob_chunks.cpu(),
+                        local_files[idx],
+                        postprocess_kwargs,
+                    )
+                    postprocessing[future] = idx
+
+        def read_file(idx):
+            # Fetch audio file from web if not local
+            audio_file = audio_files[idx]
+            if not os.path.isfile(audio_file):
+                source, fl = split_path(audio_file)
+                audio_file = fetch(fl, source=source)
+            local_files[idx] = audio_file
+            chunks = self._read_large_chunks(
+                audio_file,
+                large_chunk_size,
+                small_chunk_size,
+                overlap_small_chunk,
+                device="cpu",
+            )
+            return _mark_last(idx, chunks)
+
+        batch = []
+        for item in _read_in_background(
+            read_file, len(audio_files), num_workers, prefetch=2 * batch_size
+        ):
+            num_chunks = sum(batch_item[1].shape[0] for batch_item in batch)
+            if batch and num_chunks + item[1].shape[0] > batch_size:
+                process_batch(batch)
+                batch = []
+                collect_postprocessing(wait=False)
+            batch.append(item)
+        if batch:
+            process_batch(batch)
+        collect_postprocessing(wait=True)
+
+        return dict(zip(audio_files, results))
+
+    def _postprocess_speech_prob(
+        self,
+        prob_chunks,
+        audio_file,
+        apply_energy_VAD,
+        close_th,
+        len_th,
+        activation_th,
+        deactivation_th,
+        en_activation_th,
+        en_deactivation_th,
+    ):
+        """Derives the speech segments from the frame-level probabilities
+        (steps 2 to 6 of get_speech_segments)."""
         # Apply a threshold to get candidate speech segments
         prob_th = self.apply_threshold(
             prob_chunks,
@@ -2039,12 +2560,6 @@ class VAD(Pretrained):
         # Remove short segments
         boundaries = self.remove_short_segments(boundaries, len_th=len_th)
 
-        # Double check speech segments
-        if double_check:
-            boundaries = self.double_check_speech_segments(
-                boundaries, audio_file, speech_th=speech_th
-            )
-
         return boundaries
 
     def forward(self, wavs, wav_lens=None):
@@ -2052,6 +2567,303 @@ class VAD(Pretrained):
         return self.get_speech_prob_chunk(wavs, wav_lens)
 
 
+def _read_in_background(read_item, num_items, num_workers, prefetch):
+    """Yields the outputs of the generators read_item(0), ...,
+    read_item(num_items - 1), which are run in num_workers threads.
+
+    The outputs of each generator are yielded in order, but the outputs of
+    different generators are interleaved. At most prefetch outputs are
+    waiting to be consumed.
+    """
+    outputs = queue.Queue(maxsize=prefetch)
+    items = iter(range(num_items))
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def put(output):
+        while not stop.is_set():
+            try:
+                outputs.put(output, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    idx = next(items, None)
+                if idx is None:
+                    break
+                for output in read_item(idx):
+                    if not put((output, None)):
+                        return
+            put((None, StopIteration()))
+        except Exception as e:
+            put((None, e))
+
+    threads = [
+        threading.Thread(target=worker, daemon=True)
+        for _ in range(max(1, num_workers))
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        running = len(threads)
+        while running:
+            output, error = outputs.get()
+            if isinstance(error, StopIteration):
+                running -= 1
+            elif error is not None:
+                raise error
+            else:
+                yield output
+    finally:
+        # Also reached if the consumer stops early.
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def _mark_last(idx, chunks):
+    """Yields (idx, *chunk, is_last) for the chunks of a file."""
+    previous = next(chunks)
+    for current in chunks:
+        yield (idx, *previous, False)
+        previous = current
+    yield (idx, *previous, True)
+
+
+def _postprocess_speech_prob(
+    time_resolution, sample_rate, prob_chunks, audio_file, kwargs
+):
+    """Runs the post-processing of VAD.get_speech_segments in a worker
+    process. The post-processing does not use the neural modules, so a VAD
+    without modules is used instead of sending the model to the worker."""
+    vad = VAD.__new__(VAD)
+    vad.__dict__.update(
+        time_resolution=time_resolution, sample_rate=sample_rate
+    )
+    return vad._postprocess_speech_prob(prob_chunks, audio_file, **kwargs)
+
+
+class StreamingVAD:
+    """Online Voice Activity Detection on top of a pretrained VAD model.
+
+    Audio is pushed in frames of any size and the finalized speech segments
+    are returned as soon as they are known. The audio is processed in chunks
+    of chunk_size seconds. Each chunk is encoded together with left_context
+    seconds of past audio and right_context seconds of look-ahead, so the
+    latency is bounded by chunk_size + right_context (plus close_th, before
+    a segment can no longer be merged with the next one). If the recurrent
+    layers of the model are unidirectional, their hidden state is also
+    carried over from one chunk to the next.
+
+    Only the audio of the current window and a few counters are kept, so the
+    memory does not grow with the length of the stream. The thresholding,
+    merging and removal of short segments follow get_speech_segments, but
+    the energy VAD and the double check are not applied, as they need the
+    audio of whole segments.
+
+    Arguments
+    ---------
+    vad : VAD
+        The pretrained VAD model.
+    chunk_size : float
+        Size (in seconds) of the chunks that are processed at once.
+    left_context : float
+        Past audio (in seconds) encoded together with each chunk.
+    right_context : float
+        Future audio (in seconds) encoded together with each chunk.
+    activation_th : float
+        Threshold of the neural posteriors above which starting a speech
+        segment.
+    deactivation_th : float
+        Threshold of the neural posteriors below which ending a speech
+        segment.
+    close_th : float
+        If the distance between boundaries is smaller than close_th, the
+        segments will be merged.
+    len_th : float
+        Segments that are not longer than len_th are removed.
+
+    Example
+    -------
+    >>> from speechbrain.pretrained import VAD
+    >>> tmpdir = getfixture("tmpdir")
+    >>> vad = VAD.from_hparams(
+    ...     source="speechbrain/vad-crdnn-libriparty",
+    ...     savedir=tmpdir,
+    ... )
+    >>> stream = StreamingVAD(vad)
+    >>> signal = vad.load_audio("tests/samples/single-mic/example1.wav")
+    >>> segments = []
+    >>> for frame in signal.split(1600):
+    ...     segments.extend(stream.process(frame))
+    >>> segments.extend(stream.finalize())
+    """
+
+    def __init__(
+        self,
+        vad,
+        chunk_size=1.0,
+        left_context=4.0,
+        right_context=0.5,
+        activation_th=0.5,
+        deactivation_th=0.25,
+        close_th=0.250,
+        len_th=0.250,
+    ):
+        self.vad = vad
+        self.time_resolution = vad.time_resolution
+        self.hop_len = int(round(vad.sample_rate * vad.time_resolution))
+        self.chunk_frames = max(1, int(round(chunk_size / vad.time_resolution)))
+        self.left_frames = int(round(left_context / vad.time_resolution))
+        self.right_frames = int(round(right_context / vad.time_resolution))
+        self.activation_th = activation_th
+        self.deactivation_th = deactivation_th
+        self.close_th = close_th
+        self.len_th = len_th
+
+        # The hidden state can only be carried over in the forward direction
+        rnn = getattr(vad.mods.rnn, "rnn", vad.mods.rnn)
+        self.carry_state = not getattr(rnn, "bidirectional", True)
+        self.reset()
+
+    def reset(self):
+        """Forgets the stream, to start processing a new one."""
+        self._buffer = torch.zeros(0, device=self.vad.device)
+        self._context_len = 0
+        self._num_samples = 0
+        self._frame = 0
+        self._hidden = None
+        self._active_start = None
+        self._pending = None
+
+    def process(self, frame):
+        """Pushes a frame of audio and returns the finalized segments.
+
+        Arguments
+        ---------
+        frame : torch.Tensor
+            Audio samples, of shape [time] or [1, time], at the sample rate
+            of the model.
+
+        Returns
+        -------
+        segments : torch.Tensor
+            Tensor of shape [segments, 2] with the begin and end second of
+            the speech segments that were finalized by this frame.
+        """
+        frame = frame.reshape(-1).to(self.vad.device).float()
+        self._buffer = torch.cat([self._buffer, frame])
+        self._num_samples += frame.shape[0]
+
+        segments = []
+        chunk_len = self.chunk_frames * self.hop_len
+        window_len = chunk_len + self.right_frames * self.hop_len
+        while self._buffer.shape[0] >= self._context_len + window_len:
+            window = self._buffer[: self._context_len + window_len]
+            prob = self._chunk_prob(window, self.chunk_frames)
+            self._update_segments(prob, segments)
+
+            # Keep the end of the chunk as left context for the next one
+            context_len = min(
+                self.left_frames * self.hop_len, self._context_len + chunk_len
+            )
+            drop = self._context_len + chunk_len - context_len
+            self._buffer = self._buffer[drop:]
+            self._context_len = context_len
+
+        self._release_pending(segments)
+        return torch.FloatTensor(segments).reshape(-1, 2)
+
+    def finalize(self):
+        """Processes the rest of the stream and returns the last segments.
+
+        The object is reset afterwards, so it can be used for a new stream.
+
+        Returns
+        -------
+        segments : torch.Tensor
+            Tensor of shape [segments, 2] with the begin and end second of
+            the remaining speech segments.
+        """
+        segments = []
+        num_frames = self._num_samples // self.hop_len - self._frame
+        if num_frames > 0:
+            prob = self._chunk_prob(self._buffer, num_frames)
+            self._update_segments(prob, segments)
+
+        # Speech lasting until the end of the stream
+        if self._active_start is not None:
+            self._add_segment(self._active_start, self._frame - 1, segments)
+        if self._pending is not None:
+            self._emit(self._pending, segments)
+
+        self.reset()
+        return torch.FloatTensor(segments).reshape(-1, 2)
+
+    def _chunk_prob(self, window, num_frames):
+        """Returns the speech probabilities of num_frames frames, starting
+        after the left context of the window."""
+        first = self._context_len // self.hop_len
+        with torch.no_grad():
+            outputs = self.vad._encode_chunk(
+                window.unsqueeze(0), torch.ones(1, device=self.vad.device)
+            )
+            if self.carry_state:
+                outputs = outputs[:, first : first + num_frames]
+                outputs, self._hidden = self.vad.mods.rnn(
+                    outputs, hx=self._hidden
+                )
+            else:
+                outputs, _ = self.vad.mods.rnn(outputs)
+                outputs = outputs[:, first : first + num_frames]
+            outputs = self.vad.mods.dnn(outputs)
+        return torch.sigmoid(outputs).reshape(-1)
+
+    def _update_segments(self, prob, segments):
+        """Applies the activation/deactivation thresholds frame by frame."""
+        for value in prob.tolist():
+            if self._active_start is None:
+                if value >= self.activation_th:
+                    self._active_start = self._frame
+            elif value < self.deactivation_th:
+                self._add_segment(self._active_start, self._frame - 1, segments)
+                self._active_start = None
+            self._frame += 1
+
+    def _add_segment(self, begin, end, segments):
+        """Merges a new segment with the pending one, if they are close."""
+        boundaries = (torch.tensor([begin, end]) * self.time_resolution).float()
+        if self._pending is None:
+            self._pending = boundaries
+        elif boundaries[0] - self._pending[1] <= self.close_th:
+            self._pending[1] = boundaries[1]
+        else:
+            self._emit(self._pending, segments)
+            self._pending = boundaries
+
+    def _release_pending(self, segments):
+        """Emits the pending segment once no later segment can be merged."""
+        if self._pending is None:
+            return
+        next_begin = self._frame
+        if self._active_start is not None:
+            next_begin = self._active_start
+        next_begin = (torch.tensor(next_begin) * self.time_resolution).float()
+        if next_begin - self._pending[1] > self.close_th:
+            self._emit(self._pending, segments)
+            self._pending = None
+
+    def _emit(self, boundaries, segments):
+        """Appends a finalized segment, unless it is too short."""
+        if boundaries[1] - boundaries[0] > self.len_th:
+            segments.append(boundaries.tolist())
+
+
 class SepformerSeparation(Pretrained):
     """A "ready-to-use" speech separation model.
 
@@ -277,6 +277,77 @@ def convolve1d(
     return convolved.transpose(2, 1)
 
 
+def fft_convolve(waveforms, kernel_fft, kernel_len, n_fft, output_len=None):
+    """Causal (linear) convolution with kernels whose FFT is precomputed.
+
+    If the whole convolution fits in n_fft samples, it is computed with a
+    single FFT. Otherwise, the signals are split in overlapping blocks of
+    n_fft samples, which are convolved separately (overlap-save). In both
+    cases the same kernel FFT is used, so it can be computed once and reused
+    for signals of any length.
+
+    Arguments
+    ---------
+    waveforms : tensor
+        The signals to convolve, with shape `[batch, time, channels]`.
+    kernel_fft : tensor
+        The rfft of the kernels, zero-padded to n_fft samples, with shape
+        `[batch, channels, n_fft // 2 + 1]`. The batch and channels
+        dimensions can be 1, to use the same kernel for all of them.
+    kernel_len : int
+        The length of the kernels. Should not be larger than n_fft.
+    n_fft : int
+        The size of the FFT.
+    output_len : int
+        The number of output samples. Defaults to the length of the full
+        convolution, i.e. `time + kernel_len - 1`.
+
+    Returns
+    -------
+    The convolved signals, with shape `[batch, output_len, channels]`.
+
+    Example
+    -------
+    >>> signal = torch.rand(2, 1000, 1)
+    >>> kernel = torch.rand(1, 1, 100)
+    >>> kernel_fft = torch.fft.rfft(kernel, n=256)
+    >>> blocks = fft_convolve(signal, kernel_fft, 100, 256)
+    >>> full = fft_convolve(signal, torch.fft.rfft(kernel, n=2048), 100, 2048)
+    >>> blocks.shape
+    torch.Size([2, 1099, 1])
+    >>> torch.allclose(blocks, full, atol=1e-4)
+    True
+    """
+    if kernel_len > n_fft:
+        raise ValueError("The kernels are longer than the FFT size")
+
+    # Move time dimension last, which pad and fft expect.
+    waveforms = waveforms.transpose(1, 2)
+    length = waveforms.size(-1)
+    if output_len is None:
+        output_len = length + kernel_len - 1
+
+    # The whole convolution fits in one FFT
+    if n_fft >= max(length + kernel_len - 1, output_len):
+        result = torch.fft.rfft(waveforms, n=n_fft) * kernel_fft
+        convolved = torch.fft.irfft(result, n=n_fft)[..., :output_len]
+        return convolved.transpose(1, 2)
+
+    # Overlap-save: each block gives hop valid output samples
+    hop = n_fft - kernel_len + 1
+    num_blocks = math.ceil(output_len / hop)
+    padded_len = (num_blocks - 1) * hop + n_fft
+    waveforms = torch.nn.functional.pad(
+        waveforms,
+        (kernel_len - 1, max(0, padded_len - kernel_len + 1 - length)),
+    )
+    blocks = waveforms[..., :padded_len].unfold(-1, n_fft, hop)
+    result = torch.fft.rfft(blocks, n=n_fft) * kernel_fft.unsqueeze(-2)
+    convolved = torch.fft.irfft(result, n=n_fft)[..., kernel_len - 1 :]
+    convolved = convolved.reshape(*convolved.shape[:-2], num_blocks * hop)
+    return convolved[..., :output_len].transpose(1, 2)
+
+
 def reverberate(waveforms, rir_waveform, rescale_amp="avg"):
     """
     General function to contaminate a given signal with reverberation given a
@@ -14,6 +14,8 @@ Authors
 
 # Importing libraries
 import math
+import threading
+import collections
 import torch
 import torch.nn.functional as F
 from speechbrain.dataio.legacy import ExtendedCSVDataset
@@ -22,10 +24,17 @@ from speechbrain.processing.signal_processing import (
     compute_amplitude,
     dB_to_amplitude,
     convolve1d,
+    fft_convolve,
     notch_filter,
+    rescale,
     reverberate,
 )
 
+# Polyphase filters shared by all the Resample instances, see
+# Resample._get_kernel. Keyed by (orig_freq, new_freq, width, device, dtype).
+_resample_kernels = {}
+_resample_kernels_lock = threading.Lock()
+
 
 class AddNoise(torch.nn.Module):
     """This class additively combines a noise signal to the input signal.
@@ -70,6 +79,12 @@ class AddNoise(torch.nn.Module):
     clean_sample_rate : int
         The sample rate of the clean audio signals, so noise can be resampled
         to the clean sample rate if necessary.
+    noise_bank : bool
+        If True, all the noise signals are loaded (and resampled) once, and
+        kept in a NoiseBank on the device of the clean signals. Each clean
+        signal is then mixed with its own random noise signal and starting
+        index, and no data loader is used. The noise signals must fit in
+        memory, and the sorting and num_workers arguments are ignored.
 
     Example
     -------
@@ -97,6 +112,7 @@ class AddNoise(torch.nn.Module):
         replacements={},
         noise_sample_rate=16000,
         clean_sample_rate=16000,
+        noise_bank=False,
     ):
         super().__init__()
 
@@ -111,6 +127,7 @@ class AddNoise(torch.nn.Module):
         self.start_index = start_index
         self.normalize = normalize
         self.replacements = replacements
+        self.noise_bank = noise_bank
 
         if noise_sample_rate != clean_sample_rate:
             self.resampler = Resample(noise_sample_rate, clean_sample_rate)
@@ -178,6 +195,19 @@ class AddNoise(torch.nn.Module):
         lengths = lengths.long().squeeze(1)
         batch_size = len(lengths)
 
+        # Sample from the noise bank instead
+        if self.noise_bank:
+            if not hasattr(self, "bank"):
+                self.bank = NoiseBank(
+                    self.csv_file,
+                    csv_keys=self.csv_keys,
+                    replacements=self.replacements,
+                    resampler=getattr(self, "resampler", None),
+                )
+            return self.bank.sample(
+                lengths, max_length, self.pad_noise, self.start_index
+            )
+
         # Load a noise batch
         if not hasattr(self, "data_loader"):
             # Set parameters based on input
@@ -292,6 +322,359 @@ class AddNoise(torch.nn.Module):
         return noises, lens
 
 
+class NoiseBank:
+    """Stores a set of noise signals in one contiguous tensor, for sampling
+    a batch of noises without loading them from disk.
+
+    The signals are concatenated along the time axis, and the index of the
+    first sample of each signal is kept in ``offsets``. A batch of noises is
+    then gathered in one indexing operation, each signal in the batch with
+    its own noise and starting index.
+
+    Arguments
+    ---------
+    csv_file : str
+        The name of a csv file containing the location of the
+        noise audio files.
+    csv_keys : list, None, optional
+        Default: None . One data entry for the noise data should be specified.
+        If None, the csv file is expected to have only one data entry.
+    replacements : dict
+        A set of string replacements to carry out in the
+        csv file. Each time a key is found in the text, it will be replaced
+        with the corresponding value.
+    resampler : Resample
+        If given, it is applied once to each noise signal.
+
+    Example
+    -------
+    >>> bank = NoiseBank('tests/samples/annotation/noise.csv',
+    ...     replacements={'noise_folder': 'tests/samples/noise'})
+    >>> len(bank)
+    5
+    >>> noise, noise_len = bank.sample(torch.tensor([16000, 8000]), 16000)
+    >>> noise.shape
+    torch.Size([2, 16000])
+    """
+
+    def __init__(
+        self, csv_file, csv_keys=None, replacements={}, resampler=None
+    ):
+        dataset = ExtendedCSVDataset(
+            csvpath=csv_file, output_keys=csv_keys, replacements=replacements,
+        )
+        noises = []
+        for data_point in dataset:
+            # Don't necessarily know the key
+            noise = next(iter(data_point.values()))
+            if resampler is not None:
+                noise = resampler(noise.unsqueeze(0)).squeeze(0)
+            if noise.shape[0] > 0:
+                noises.append(noise)
+        if not noises:
+            raise ValueError(f"No noise signals found in {csv_file}")
+
+        self.lengths = torch.tensor([len(noise) for noise in noises])
+        self.offsets = torch.cumsum(self.lengths, dim=0) - self.lengths
+        self.data = torch.cat(noises)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def to(self, device):
+        """Moves the noise signals to the given device."""
+        self.data = self.data.to(device)
+        self.lengths = self.lengths.to(device)
+        self.offsets = self.offsets.to(device)
+        return self
+
+    def sample(self, lengths, max_length, pad_noise=False, start_index=None):
+        """Returns a random noise for each signal.
+
+        Arguments
+        ---------
+        lengths : torch.Tensor
+            The length (in samples) of each signal, with shape `[batch]`.
+        max_length : int
+            The length of the returned noise tensor.
+        pad_noise : bool
+            If True, noises that are shorter than the signal are repeated,
+            so as to cover the whole signal. Otherwise, they are zero-padded.
+        start_index : int
+            The index in the noise signals to start from. By default, a
+            random index is chosen for each signal, in
+            [0, len(noise) - length] (or [0, len(noise)] with pad_noise).
+
+        Returns
+        -------
+        noise : torch.Tensor
+            The noises, with shape `[batch, max_length]` or
+            `[batch, max_length, channels]`.
+        noise_len : torch.Tensor
+            The length of each noise (in samples), with shape `[batch, 1]`.
+        """
+        if self.data.device != lengths.device:
+            self.to(lengths.device)
+        batch_size = len(lengths)
+        noise_ids = torch.randint(
+            len(self), (batch_size,), device=lengths.device
+        )
+        noise_len = self.lengths[noise_ids]
+
+        # Pick a starting index for each noise
+        if start_index is not None:
+            start = torch.full_like(noise_len, start_index)
+        elif pad_noise:
+            start = torch.rand(batch_size, device=lengths.device) * noise_len
+        else:
+            max_chop = (noise_len - lengths).clamp(min=1)
+            start = torch.rand(batch_size, device=lengths.device) * max_chop
+        start = start.long()
+
+        # Indices of the noise samples, repeating the noise if necessary
+        positions = start.unsqueeze(1) + torch.arange(
+            max_length, device=lengths.device
+        )
+        if pad_noise:
+            positions = positions % noise_len.unsqueeze(1)
+            valid = None
+            noise_len = torch.full_like(noise_len, max_length)
+        else:
+            valid = positions < noise_len.unsqueeze(1)
+            positions = torch.min(positions, noise_len.unsqueeze(1) - 1)
+            noise_len = (noise_len - start).clamp(min=1, max=max_length)
+
+        noise = self.data[self.offsets[noise_ids].unsqueeze(1) + positions]
+        if valid is not None:
+            valid = valid.reshape(valid.shape + (1,) * (noise.dim() - 2))
+            noise = noise * valid
+        return noise, noise_len.unsqueeze(1)
+
+
+class ReverbBank:
+    """Stores a set of room impulse responses (RIRs), to reverberate each
+    signal of a batch with its own RIR in one batched FFT convolution.
+
+    The RIRs are loaded, resampled and scaled once. Their FFTs are cached
+    for each FFT size, which is rounded up to 2^k, 1.25 * 2^k or 1.5 * 2^k,
+    so that only a few sizes are ever used. With block_size, signals that
+    are too long are convolved by blocks (overlap-save), so that a single
+    FFT size is used.
+
+    Unlike ``reverberate``, the convolution is linear rather than circular:
+    the reverberation tail is not wrapped around to the start of the signal.
+
+    Arguments
+    ---------
+    csv_file : str
+        The name of a csv file containing the location of the
+        impulse response files.
+    replacements : dict
+        A set of string replacements to carry out in the
+        csv file. Each time a key is found in the text, it will be replaced
+        with the corresponding value.
+    resampler : Resample
+        If given, it is applied once to each RIR.
+    rir_scale_factor: float
+        It compresses or dilates the given impulse response.
+        If 0 < scale_factor < 1, the impulse response is compressed
+        (less reverb), while if scale_factor > 1 it is dilated
+        (more reverb).
+    block_size : int
+        If given, the largest FFT size, and the size of the blocks for the
+        overlap-save convolution of long signals. Should be larger than the
+        longest RIR, and for efficiency several times larger (e.g. 4 times).
+    fft_cache_size : int
+        Maximum number of FFT sizes for which the FFTs of the RIRs are kept.
+
+    Example
+    -------
+    >>> bank = ReverbBank('tests/samples/annotation/RIRs.csv',
+    ...     replacements={'rir_folder': 'tests/samples/RIRs'})
+    >>> len(bank)
+    4
+    >>> reverbed = bank.reverberate(torch.rand(4, 16000))
+    >>> reverbed.shape
+    torch.Size([4, 16000])
+    """
+
+    def __init__(
+        self,
+        csv_file,
+        replacements={},
+        resampler=None,
+        rir_scale_factor=1.0,
+        block_size=None,
+        fft_cache_size=4,
+    ):
+        dataset = ExtendedCSVDataset(
+            csvpath=csv_file, replacements=replacements
+        )
+        rirs = []
+        for data_point in dataset:
+            # Don't necessarily know the key
+            rir = next(iter(data_point.values()))
+            if rir.dim() == 1:
+                rir = rir.unsqueeze(-1)
+            if resampler is not None:
+                rir = resampler(rir.unsqueeze(0)).squeeze(0)
+
+            # Compress or dilate RIR
+            if rir_scale_factor != 1:
+                rir = F.interpolate(
+                    rir.t().unsqueeze(0),
+                    scale_factor=rir_scale_factor,
+                    mode="linear",
+                    align_corners=False,
+                )
+                rir = rir.squeeze(0).t()
+            rirs.append(rir)
+        if not rirs:
+            raise ValueError(f"No impulse responses found in {csv_file}")
+
+        # RIRs are zero-padded to the same length, [rirs, channels, time]
+        self.rir_len = max(len(rir) for rir in rirs)
+        self.rirs = torch.stack(
+            [F.pad(rir.t(), (0, self.rir_len - len(rir))) for rir in rirs]
+        )
+
+        # Index of the direct signal, so we can preserve alignment
+        self.direct_index = self.rirs.abs().amax(dim=1).argmax(dim=-1)
+
+        if block_size is not None and block_size < self.rir_len:
+            raise ValueError(
+                f"block_size ({block_size}) is shorter than the longest RIR "
+                f"({self.rir_len} samples)"
+            )
+        self.block_size = block_size
+        self.fft_cache_size = fft_cache_size
+        self._fft_cache = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.rirs)
+
+    def to(self, device):
+        """Moves the RIRs to the given device."""
+        self.rirs = self.rirs.to(device)
+        self.direct_index = self.direct_index.to(device)
+        self._fft_cache.clear()
+        return self
+
+    def rir_fft(self, n_fft, rotate=False):
+        """Returns the rfft of the RIRs, zero-padded to n_fft samples.
+
+        With rotate, each RIR is rolled so that its direct signal is at index
+        0, and the samples before it are at the end. The circular convolution
+        with a signal padded to n_fft samples is then aligned with the direct
+        signal.
+        """
+        key = (n_fft, rotate)
+        if key in self._fft_cache:
+            self._fft_cache.move_to_end(key)
+            return self._fft_cache[key]
+
+        kernels = self.rirs
+        if rotate:
+            positions = torch.arange(self.rir_len, device=kernels.device)
+            positions = (positions - self.direct_index.unsqueeze(1)) % n_fft
+            positions = positions.unsqueeze(1).expand_as(kernels)
+            kernels = torch.zeros(
+                *kernels.shape[:2], n_fft, device=kernels.device
+            ).scatter_(-1, positions, kernels)
+
+        rir_fft = torch.fft.rfft(kernels, n=n_fft)
+        self._fft_cache[key] = rir_fft
+        if len(self._fft_cache) > self.fft_cache_size:
+            self._fft_cache.popitem(last=False)
+        return rir_fft
+
+    def reverberate(self, waveforms, rir_ids=None, rescale_amp="avg"):
+        """Convolves each signal with a RIR, without changing the
+        amplitude of the signal.
+
+        Arguments
+        ---------
+        waveforms : tensor
+            Shape should be `[batch, time]` or `[batch, time, channels]`.
+        rir_ids : tensor
+            The index of the RIR for each signal, with shape `[batch]`.
+            By default, the RIRs are picked at random.
+        rescale_amp : str
+            Whether reverberated signal is rescaled (None) and with respect
+            either to original signal "peak" amplitude or "avg" average
+            amplitude. Choose between [None, "avg", "peak"].
+
+        Returns
+        -------
+        Tensor of shape `[batch, time]` or `[batch, time, channels]`.
+        """
+        if self.rirs.device != waveforms.device:
+            self.to(waveforms.device)
+
+        # Add channels dimension if necessary
+        channel_added = False
+        if len(waveforms.shape) == 2:
+            waveforms = waveforms.unsqueeze(-1)
+            channel_added = True
+
+        batch_size, length = waveforms.shape[:2]
+        if rir_ids is None:
+            rir_ids = torch.randint(
+                len(self), (batch_size,), device=waveforms.device
+            )
+
+        # Compute the amplitude of the clean signals
+        if rescale_amp is not None:
+            orig_amplitude = compute_amplitude(waveforms, length, rescale_amp)
+
+        # Smallest FFT size that fits the whole convolution
+        n_fft = _fft_size(length + self.rir_len - 1)
+
+        # Convolve, keeping the samples aligned with the direct signal
+        if self.block_size is None or n_fft <= self.block_size:
+            convolved = fft_convolve(
+                waveforms.float(),
+                self.rir_fft(n_fft, rotate=True)[rir_ids],
+                self.rir_len,
+                n_fft,
+                output_len=length,
+            )
+        else:
+            direct_index = self.direct_index[rir_ids]
+            convolved = fft_convolve(
+                waveforms.float(),
+                self.rir_fft(self.block_size)[rir_ids],
+                self.rir_len,
+                self.block_size,
+                output_len=length + int(direct_index.max()),
+            )
+            index = direct_index.unsqueeze(1) + torch.arange(
+                length, device=waveforms.device
+            )
+            index = index.unsqueeze(-1).expand(-1, -1, convolved.shape[-1])
+            convolved = convolved.gather(1, index)
+        convolved = convolved.type(waveforms.dtype)
+
+        # Rescale to the amplitude of the clean signal
+        if rescale_amp is not None:
+            convolved = rescale(convolved, length, orig_amplitude, rescale_amp)
+
+        if channel_added:
+            convolved = convolved.squeeze(-1)
+        return convolved
+
+
+def _fft_size(min_size):
+    """Returns the smallest size of the form 2^k, 1.25 * 2^k or 1.5 * 2^k
+    that is not smaller than min_size, which are fast sizes for the FFT.
+    Rounding up the sizes this way limits the number of different sizes,
+    for caching, while wasting at most 25% of the size."""
+    power = 2 ** max(0, math.ceil(math.log2(min_size)) - 1)
+    for factor in [1.25, 1.5, 2]:
+        if power * factor >= min_size:
+            return int(power * factor)
+
+
 class AddReverb(torch.nn.Module):
     """This class convolves an audio signal with an impulse response.
 
@@ -321,6 +704,15 @@ class AddReverb(torch.nn.Module):
     clean_sample_rate : int
         The sample rate of the clean signals, so that the corruption
         signals can be resampled to the clean sample rate before convolution.
+    rir_bank : bool
+        If True, all the RIRs are loaded (and resampled) once, and kept in a
+        ReverbBank on the device of the clean signals. Each clean signal is
+        then convolved with its own random RIR, in one batched FFT
+        convolution, and no data loader is used. The sorting argument is
+        ignored.
+    block_size : int
+        Only used with rir_bank. If given, long signals are convolved by
+        blocks of this size (overlap-save), see ReverbBank.
 
     Example
     -------
@@ -342,6 +734,8 @@ class AddReverb(torch.nn.Module):
         replacements={},
         reverb_sample_rate=16000,
         clean_sample_rate=16000,
+        rir_bank=False,
+        block_size=None,
     ):
         super().__init__()
         self.csv_file = csv_file
@@ -349,6 +743,8 @@ class AddReverb(torch.nn.Module):
         self.reverb_prob = reverb_prob
         self.replacements = replacements
         self.rir_scale_factor = rir_scale_factor
+        self.rir_bank = rir_bank
+        self.block_size = block_size
 
         # Create a data loader for the RIR waveforms
         dataset = ExtendedCSVDataset(
@@ -382,6 +778,18 @@ class AddReverb(torch.nn.Module):
         if torch.rand(1) > self.reverb_prob:
             return waveforms.clone()
 
+        # Convolve with the RIRs of the bank instead
+        if self.rir_bank:
+            if not hasattr(self, "bank"):
+                self.bank = ReverbBank(
+                    self.csv_file,
+                    replacements=self.replacements,
+                    resampler=getattr(self, "resampler", None),
+                    rir_scale_factor=self.rir_scale_factor,
+                    block_size=self.block_size,
+                )
+            return self.bank.reverberate(waveforms)
+
         # Add channels dimension if necessary
         channel_added = False
         if len(waveforms.shape) == 2:
@@ -580,9 +988,6 @@ class Resample(torch.nn.Module):
         Tensor of shape `[batch, time]` or `[batch, time, channels]`.
         """
 
-        if not hasattr(self, "first_indices"):
-            self._indices_and_weights(waveforms)
-
         # Don't do anything if the frequencies are the same
         if self.orig_freq == self.new_freq:
             return waveforms
@@ -616,7 +1021,10 @@ class Resample(torch.nn.Module):
         frequency of `new_freq`). It uses sinc/bandlimited interpolation to
         upsample/downsample the signal.
 
-        (almost directly from torchaudio.compliance.kaldi)
+        All the phases of the polyphase filter are applied in one strided
+        convolution, with one output channel per phase: the output sample
+        `n * output_samples + i` is the output of phase i at step n. So the
+        cost is proportional to the number of output samples.
 
         https://ccrma.stanford.edu/~jos/resample/
         Theory_Ideal_Bandlimited_Interpolation.html
@@ -626,75 +1034,76 @@ class Resample(torch.nn.Module):
         Arguments
         ---------
         waveforms : tensor
-            The batch of audio signals to resample.
+            The batch of audio signals to resample, `[batch, channels, time]`.
 
         Returns
         -------
         The waveforms at the new frequency.
         """
 
-        # Compute output size and initialize
+        # Compute output size
         batch_size, num_channels, wave_len = waveforms.size()
-        window_size = self.weights.size(1)
         tot_output_samp = self._output_samples(wave_len)
-        resampled_waveform = torch.zeros(
-            (batch_size, num_channels, tot_output_samp),
-            device=waveforms.device,
+        num_steps = math.ceil(tot_output_samp / self.output_samples)
+        if num_steps == 0:
+            return waveforms.new_zeros(batch_size, num_channels, 0)
+        kernel, offset = self._get_kernel(waveforms.device, waveforms.dtype)
+
+        # The convolution at step n starts at input sample
+        # offset + n * conv_stride, pad the signal so that all steps fit
+        needed_len = (num_steps - 1) * self.conv_stride + kernel.size(-1)
+        waveforms = waveforms.reshape(batch_size * num_channels, 1, wave_len)
+        waveforms = waveforms[..., max(0, offset) :]
+        left_padding = max(0, -offset)
+        right_padding = max(0, needed_len - (wave_len - offset))
+        waveforms = torch.nn.functional.pad(
+            waveforms, (left_padding, right_padding)
         )
-        self.weights = self.weights.to(waveforms.device)
-
-        # Check weights are on correct device
-        if waveforms.device != self.weights.device:
-            self.weights = self.weights.to(waveforms.device)
-
-        # eye size: (num_channels, num_channels, 1)
-        eye = torch.eye(num_channels, device=waveforms.device).unsqueeze(2)
-
-        # Iterate over the phases in the polyphase filter
-        for i in range(self.first_indices.size(0)):
-            wave_to_conv = waveforms
-            first_index = int(self.first_indices[i].item())
-            if first_index >= 0:
-                # trim the signal as the filter will not be applied
-                # before the first_index
-                wave_to_conv = wave_to_conv[..., first_index:]
-
-            # pad the right of the signal to allow partial convolutions
-            # meaning compute values for partial windows (e.g. end of the
-            # window is outside the signal length)
-            max_index = (tot_output_samp - 1) // self.output_samples
-            end_index = max_index * self.conv_stride + window_size
-            current_wave_len = wave_len - first_index
-            right_padding = max(0, end_index + 1 - current_wave_len)
-            left_padding = max(0, -first_index)
-            wave_to_conv = torch.nn.functional.pad(
-                wave_to_conv, (left_padding, right_padding)
-            )
-            conv_wave = torch.nn.functional.conv1d(
-                input=wave_to_conv,
-                weight=self.weights[i].repeat(num_channels, 1, 1),
-                stride=self.conv_stride,
-                groups=num_channels,
-            )
-
-            # we want conv_wave[:, i] to be at
-            # output[:, i + n*conv_transpose_stride]
-            dilated_conv_wave = torch.nn.functional.conv_transpose1d(
-                conv_wave, eye, stride=self.conv_transpose_stride
-            )
 
-            # pad dilated_conv_wave so it reaches the output length if needed.
-            left_padding = i
-            previous_padding = left_padding + dilated_conv_wave.size(-1)
-            right_padding = max(0, tot_output_samp - previous_padding)
-            dilated_conv_wave = torch.nn.functional.pad(
-                dilated_conv_wave, (left_padding, right_padding)
-            )
-            dilated_conv_wave = dilated_conv_wave[..., :tot_output_samp]
+        # [batch * channels, phases, steps] -> [batch, channels, time]
+        conv_wave = torch.nn.functional.conv1d(
+            waveforms, kernel, stride=self.conv_stride
+        )[..., :num_steps]
+        resampled_waveform = conv_wave.transpose(1, 2).reshape(
+            batch_size, num_channels, -1
+        )
+        return resampled_waveform[..., :tot_output_samp]
 
-            resampled_waveform += dilated_conv_wave
+    def _get_kernel(self, device, dtype):
+        """Returns the polyphase filter as a convolution kernel of shape
+        `[phases, 1, kernel_len]`, and the input index of its first tap.
 
-        return resampled_waveform
+        The kernels are cached for all the instances, so they are only
+        computed once per configuration, device and dtype.
+        """
+        key = (
+            self.orig_freq,
+            self.new_freq,
+            self.lowpass_filter_width,
+            device,
+            dtype,
+        )
+        with _resample_kernels_lock:
+            if key not in _resample_kernels:
+                first_indices, weights = self._indices_and_weights(device)
+
+                # Place the filter of each phase at its first input index
+                first_indices = first_indices.long()
+                offset = int(first_indices.min())
+                kernel_len = int(first_indices.max()) - offset
+                kernel_len += weights.size(1)
+                positions = (first_indices - offset).unsqueeze(1)
+                positions = positions + torch.arange(
+                    weights.size(1), device=device
+                )
+                kernel = torch.zeros(
+                    self.output_samples, kernel_len, device=device
+                ).scatter_(1, positions, weights)
+                _resample_kernels[key] = (
+                    kernel.to(dtype).unsqueeze(1),
+                    offset,
+                )
+            return _resample_kernels[key]
 
     def _output_samples(self, input_num_samp):
         """Based on LinearResample::GetNumOutputSamples.
@@ -749,7 +1158,7 @@ class Resample(torch.nn.Module):
 
         return num_output_samp
 
-    def _indices_and_weights(self, waveforms):
+    def _indices_and_weights(self, device):
         """Based on LinearResample::SetIndexesAndWeights
 
         Retrieves the weights for resampling as well as the indices in which
@@ -758,6 +1167,11 @@ class Resample(torch.nn.Module):
         of ``new_freq``). It uses sinc/bandlimited interpolation to
         upsample/downsample the signal.
 
+        Arguments
+        ---------
+        device : str
+            The device on which the weights are computed.
+
         Returns
         -------
         - the place where each filter should start being applied
@@ -773,7 +1187,7 @@ class Resample(torch.nn.Module):
 
         assert lowpass_cutoff < min(self.orig_freq, self.new_freq) / 2
         output_t = torch.arange(
-            start=0.0, end=self.output_samples, device=waveforms.device,
+            start=0.0, end=self.output_samples, device=device,
         )
         output_t /= self.new_freq
         min_t = output_t - window_width
@@ -784,7 +1198,7 @@ class Resample(torch.nn.Module):
         num_indices = max_input_index - min_input_index + 1
 
         max_weight_width = num_indices.max()
-        j = torch.arange(max_weight_width, device=waveforms.device)
+        j = torch.arange(max_weight_width, device=device)
         input_index = min_input_index.unsqueeze(1) + j.unsqueeze(0)
         delta_t = (input_index / self.orig_freq) - output_t.unsqueeze(1)
 
@@ -817,8 +1231,62 @@ class Resample(torch.nn.Module):
         # size (output_samples, max_weight_width)
         weights /= self.orig_freq
 
-        self.first_indices = min_input_index
-        self.weights = weights
+        return min_input_index, weights
+
+
+def resample_batch(waveforms, orig_freqs, new_freq, lowpass_filter_width=6):
+    """Resamples signals with different sample rates to the same rate.
+
+    The signals with the same rate are padded and resampled together, so
+    there is one call per distinct rate instead of one per signal.
+
+    Arguments
+    ---------
+    waveforms : list of tensors
+        The signals to resample, each of shape `[time]` or
+        `[time, channels]` (with the same number of channels).
+    orig_freqs : list of int
+        The sampling frequency of each signal.
+    new_freq : int
+        The sampling frequency of the outputs.
+    lowpass_filter_width : int
+        Controls the sharpness of the filter, see Resample.
+
+    Returns
+    -------
+    The list of resampled signals, in the same order as the inputs.
+
+    Example
+    -------
+    >>> signals = [torch.rand(16000), torch.rand(8000), torch.rand(4000)]
+    >>> resampled = resample_batch(signals, [16000, 8000, 8000], 16000)
+    >>> [len(signal) for signal in resampled]
+    [16000, 16000, 8000]
+    """
+    if len(waveforms) != len(orig_freqs):
+        raise ValueError("Expected one sampling frequency per signal")
+
+    groups = collections.defaultdict(list)
+    for index, orig_freq in enumerate(orig_freqs):
+        groups[int(orig_freq)].append(index)
+
+    resampled = [None] * len(waveforms)
+    for orig_freq, indices in groups.items():
+        if orig_freq == new_freq:
+            for index in indices:
+                resampled[index] = waveforms[index]
+            continue
+
+        resampler = Resample(orig_freq, new_freq, lowpass_filter_width)
+        batch = torch.nn.utils.rnn.pad_sequence(
+            [waveforms[index] for index in indices], batch_first=True
+        )
+        outputs = resampler(batch)
+        for index, output in zip(indices, outputs):
+            output_len = resampler._output_samples(len(waveforms[index]))
+            resampled[index] = output[:output_len]
+
+    return resampled
 
 
 class AddBabble(torch.nn.Module):
@@ -51,6 +51,7 @@ import torch
 import collections
 import collections.abc
 import os
+import copy
 import time
 import yaml
 import pathlib
@@ -58,6 +59,8 @@ import inspect
 import shutil
 import logging
 import warnings
+import threading
+import concurrent.futures
 import speechbrain.utils._workarounds as __wa
 
 logger = logging.getLogger(__name__)
@@ -65,6 +68,57 @@ logger = logging.getLogger(__name__)
 CKPT_PREFIX = "CKPT"
 METAFNAME = f"{CKPT_PREFIX}.yaml"  # Important that this is not .ckpt
 PARAMFILE_EXT = ".ckpt"  # ...because these files will be
+# torch.load can memory-map tensors since PyTorch 2.1
+TORCH_LOAD_MMAP = "mmap" in inspect.signature(torch.load).parameters
+
+
+def torch_load_lazy(path, map_location=None):
+    """Loads a file saved with torch.save, memory-mapping the tensors.
+
+    The tensor data is only read from disk when it is accessed, e.g. one
+    parameter at a time in ``load_state_dict``, so the whole file never needs
+    to be in memory at once. Falls back to a regular ``torch.load`` for files
+    in the legacy (non-zip) format and for PyTorch versions without mmap
+    support.
+
+    Arguments
+    ---------
+    path : str, pathlib.Path
+        Path to load from. File objects are loaded without mmap.
+    map_location : str, torch.device, optional
+        Passed to torch.load.
+
+    Returns
+    -------
+    The loaded object.
+
+    Example
+    -------
+    >>> path = os.path.join(getfixture('tmpdir'), "params.ckpt")
+    >>> torch.save({"weight": torch.ones(2)}, path)
+    >>> torch_load_lazy(path)
+    {'weight': tensor([1., 1.])}
+    """
+    if TORCH_LOAD_MMAP and isinstance(path, (str, os.PathLike)):
+        try:
+            return torch.load(
+                os.fspath(path), map_location=map_location, mmap=True
+            )
+        except RuntimeError as e:
+            if "zipfile" not in str(e):
+                raise
+    return torch.load(path, map_location=map_location)
+
+
+def _lazy_map_location(obj, device):
+    """Returns where to load the state_dict for obj.
+
+    Modules copy their parameters over one at a time in load_state_dict, so
+    their state_dict can stay memory-mapped on the CPU.
+    """
+    if TORCH_LOAD_MMAP and isinstance(obj, torch.nn.Module):
+        return "cpu"
+    return device
 
 
 def torch_recovery(obj, path, end_of_epoch, device=None):
@@ -90,10 +144,11 @@ def torch_recovery(obj, path, end_of_epoch, device=None):
         Given object is modified in place.
     """
     del end_of_epoch  # Unused
+    state_dict = torch_load_lazy(path, _lazy_map_location(obj, device))
     try:
-        obj.load_state_dict(torch.load(path, map_location=device), strict=True)
+        obj.load_state_dict(state_dict, strict=True)
     except TypeError:
-        obj.load_state_dict(torch.load(path, map_location=device))
+        obj.load_state_dict(state_dict)
 
 
 def torch_save(obj, path):
@@ -141,7 +196,7 @@ def torch_parameter_transfer(obj, path, device):
         The object is modified in place.
     """
     incompatible_keys = obj.load_state_dict(
-        torch.load(path, map_location=device), strict=False
+        torch_load_lazy(path, _lazy_map_location(obj, device)), strict=False
     )
     for missing_key in incompatible_keys.missing_keys:
         logger.warning(
@@ -416,6 +471,15 @@ class Checkpointer:
         for every registered recoverable. In that case, only the found
         savefiles are loaded. When False, loading such a save will raise
         RuntimeError. (default: False)
+    async_save : bool, optional
+        If True, checkpoints are written in a background thread, so that
+        saving does not stall training. The state_dicts of objects that use
+        the default torch save hook are copied to host memory before
+        returning, other save hooks are called immediately. The files are
+        written in a temporary directory, which is renamed to the checkpoint
+        directory when complete. Listing, loading or deleting checkpoints
+        first waits for the pending saves, see also ``wait()``.
+        (default: False)
 
     Example
     -------
@@ -449,6 +513,7 @@ class Checkpointer:
         custom_load_hooks=None,
         custom_save_hooks=None,
         allow_partial_load=False,
+        async_save=False,
     ):
         self.checkpoints_dir = pathlib.Path(checkpoints_dir)
         os.makedirs(self.checkpoints_dir, exist_ok=True)
@@ -462,6 +527,11 @@ class Checkpointer:
         if custom_save_hooks is not None:
             self.custom_save_hooks.update(custom_save_hooks)
         self.allow_partial_load = allow_partial_load
+        self.async_save = async_save
+        self._executor = None
+        self._writer_thread = None
+        self._pending_saves = []
+        self._pending_dirs = set()
 
     def add_recoverable(
         self, name, obj, custom_load_hook=None, custom_save_hook=None
@@ -542,12 +612,17 @@ class Checkpointer:
         Returns
         -------
         Checkpoint
-            namedtuple [see above], the saved checkpoint.
+            namedtuple [see above], the saved checkpoint. With async_save,
+            the files only exist once the save has completed.
         """
         if name is None:
             ckpt_dir = self._new_checkpoint_dirpath()
         else:
             ckpt_dir = self._custom_checkpoint_dirpath(name)
+        if self.async_save:
+            return self._save_checkpoint_async(
+                ckpt_dir, meta, end_of_epoch, verbosity
+            )
         os.makedirs(ckpt_dir)  # May raise FileExistsError, let it.
         saved_meta = self._save_checkpoint_metafile(
             ckpt_dir / METAFNAME, meta, end_of_epoch
@@ -638,7 +713,7 @@ class Checkpointer:
 
         if keep_recent:
             importance_keys.append(ckpt_recency)
-        self.delete_checkpoints(
+        delete_kwargs = dict(
             num_to_keep=num_to_keep,
             max_keys=max_keys,
             min_keys=min_keys,
@@ -646,6 +721,16 @@ class Checkpointer:
             ckpt_predicate=ckpt_predicate,
             verbosity=verbosity,
         )
+        if self.async_save:
+            # Only delete once the new checkpoint has been written.
+            save_future = self._pending_saves[-1]
+            self._pending_saves.append(
+                self._executor.submit(
+                    self._delete_after_save, save_future, delete_kwargs
+                )
+            )
+        else:
+            self.delete_checkpoints(**delete_kwargs)
 
     def find_checkpoint(
         self,
@@ -867,8 +952,29 @@ class Checkpointer:
         list
             List of Checkpoint namedtuple (see above).
         """
+        self.wait()
         return self._construct_checkpoint_objects(self._list_checkpoint_dirs())
 
+    def wait(self):
+        """Waits until all pending asynchronous saves are complete.
+
+        Call this before exiting, if ``async_save`` is used. Does nothing
+        otherwise.
+
+        Raises
+        ------
+        Exception
+            The first error raised while writing a pending checkpoint.
+        """
+        if threading.current_thread() is self._writer_thread:
+            # Called by the deletion of old checkpoints, in the writer.
+            return
+        pending, self._pending_saves = self._pending_saves, []
+        errors = [future.exception() for future in pending]
+        for error in errors:
+            if error is not None:
+                raise error
+
     # NOTE: * in arglist -> keyword only arguments
     def delete_checkpoints(
         self,
@@ -952,6 +1058,100 @@ class Checkpointer:
             if ckpt not in protected_checkpoints:
                 Checkpointer._delete_checkpoint(ckpt, verbosity=verbosity)
 
+    def _save_checkpoint_async(self, ckpt_dir, meta, end_of_epoch, verbosity):
+        # This internal method snapshots the recoverables and schedules the
+        # writing of the checkpoint in the background writer thread.
+        if ckpt_dir.exists() or ckpt_dir in self._pending_dirs:
+            raise FileExistsError(f"Checkpoint {ckpt_dir} already exists")
+        tmp_dir = ckpt_dir.with_name(f".tmp+{ckpt_dir.name}")
+        if tmp_dir.exists():
+            # Left over from an interrupted save.
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        saved_meta = {"unixtime": time.time(), "end-of-epoch": end_of_epoch}
+        saved_meta.update(meta)
+        saved_paramfiles = {}
+        state_dicts = {}
+        for name, obj in self.recoverables.items():
+            objfname = f"{name}" + PARAMFILE_EXT
+            saved_paramfiles[name] = ckpt_dir / objfname
+            savepath = tmp_dir / objfname
+            if name in self.custom_save_hooks:
+                self.custom_save_hooks[name](obj, savepath)
+                continue
+            default_hook = get_default_hook(obj, DEFAULT_SAVE_HOOKS)
+            if default_hook is torch_save:
+                # Copied now, written in the background.
+                state_dict = obj.state_dict()
+                if not state_dict:
+                    logger.warning(
+                        f"Saving an empty state_dict for {obj} in {savepath}."
+                    )
+                state_dicts[savepath] = _snapshot(state_dict)
+                continue
+            if default_hook is not None:
+                default_hook(obj, savepath)
+                continue
+            shutil.rmtree(tmp_dir)
+            MSG = f"Don't know how to save {type(obj)}. Register default hook \
+                    or add custom hook for this object."
+            raise RuntimeError(MSG)
+
+        # Device to host copies are non-blocking, wait for them in the writer.
+        copied = None
+        if torch.cuda.is_available() and torch.cuda.is_initialized():
+            copied = torch.cuda.Event()
+            copied.record()
+
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, initializer=self._set_writer_thread
+            )
+        self._pending_dirs.add(ckpt_dir)
+        self._pending_saves.append(
+            self._executor.submit(
+                self._write_checkpoint,
+                ckpt_dir,
+                tmp_dir,
+                state_dicts,
+                saved_meta,
+                copied,
+                verbosity,
+            )
+        )
+        return Checkpoint(ckpt_dir, saved_meta, saved_paramfiles)
+
+    def _set_writer_thread(self):
+        self._writer_thread = threading.current_thread()
+
+    def _write_checkpoint(
+        self, ckpt_dir, tmp_dir, state_dicts, meta, copied, verbosity
+    ):
+        # This internal method runs in the writer thread.
+        try:
+            if copied is not None:
+                copied.synchronize()
+            for savepath, state_dict in state_dicts.items():
+                torch.save(state_dict, savepath)
+            # The meta file makes it a valid checkpoint, so it goes last.
+            self._save_checkpoint_metafile(
+                tmp_dir / METAFNAME, meta, meta["end-of-epoch"]
+            )
+            os.replace(tmp_dir, ckpt_dir)
+        except BaseException:
+            logger.error(f"Failed to save a checkpoint in {ckpt_dir}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        finally:
+            self._pending_dirs.discard(ckpt_dir)
+        ckpt_type = "end-of-epoch" if meta["end-of-epoch"] else "intra-epoch"
+        logger.log(verbosity, f"Saved an {ckpt_type} checkpoint in {ckpt_dir}")
+
+    def _delete_after_save(self, save_future, delete_kwargs):
+        # This internal method runs in the writer thread, after the save.
+        if save_future.exception() is None:
+            self.delete_checkpoints(**delete_kwargs)
+
     @staticmethod
     def _delete_checkpoint(checkpoint, verbosity=logging.INFO):
         if not Checkpointer._is_checkpoint_dir(checkpoint.path):
@@ -1042,7 +1242,10 @@ class Checkpointer:
         suffix_num = 0
         while (
             self.checkpoints_dir / f"{CKPT_PREFIX}+{stamp}+{suffix_num:02d}"
-        ).exists():
+        ).exists() or (
+            self.checkpoints_dir / f"{CKPT_PREFIX}+{stamp}+{suffix_num:02d}"
+            in self._pending_dirs
+        ):
             suffix_num += 1
         return self.checkpoints_dir / f"{CKPT_PREFIX}+{stamp}+{suffix_num:02d}"
 
@@ -1064,11 +1267,40 @@ class Checkpointer:
         return meta
 
 
+def _snapshot(state):
+    """Copies the tensors in a (nested) state_dict to host memory.
+
+    CUDA tensors are copied to pinned memory without blocking, so the copies
+    must be synchronized before use.
+    """
+    if isinstance(state, torch.Tensor):
+        if state.is_cuda:
+            snapshot = torch.empty(
+                state.shape, dtype=state.dtype, pin_memory=True
+            )
+            return snapshot.copy_(state.detach(), non_blocking=True)
+        return state.detach().clone()
+    elif isinstance(state, collections.abc.Mapping):
+        snapshot = type(state)((k, _snapshot(v)) for k, v in state.items())
+        if hasattr(state, "_metadata"):
+            # Module state_dicts carry version info used in loading.
+            snapshot._metadata = copy.deepcopy(state._metadata)
+        return snapshot
+    elif isinstance(state, tuple) and hasattr(state, "_fields"):
+        return type(state)(*(_snapshot(value) for value in state))
+    elif isinstance(state, (list, tuple)):
+        return type(state)(_snapshot(value) for value in state)
+    return copy.deepcopy(state)
+
+
 def average_state_dicts(state_dicts):
     """Produces an average state_dict from an iterator over state_dicts.
 
-    Note that at one time, this keeps two of the state_dicts in memory, which
-    is the minimum memory requirement.
+    The state_dicts are accumulated one at a time in a running sum. Note
+    that at one time, this keeps two of the state_dicts in memory, which
+    is the minimum memory requirement. With lazily loaded state_dicts (see
+    ``torch_load_lazy``), only the parameter being added is read in.
+    Half precision parameters are summed in float32.
 
     Arguments
     ---------
@@ -1086,7 +1318,12 @@ def average_state_dicts(state_dicts):
     except StopIteration:
         raise ValueError("No state dicts to average.")
     num_dicts = 1
+    dtypes = {}
     with torch.no_grad():
+        for pname, param in running_sum.items():
+            if param.dtype in (torch.float16, torch.bfloat16):
+                dtypes[pname] = param.dtype
+                running_sum[pname] = param.data.float()
         # First sum all state_dicts together:
         for state_dict in iterator:
             for pname, param in state_dict.items():
@@ -1095,13 +1332,15 @@ def average_state_dicts(state_dicts):
         # Finally, divide by number of dicts:
         for pname, param in running_sum.items():
             running_sum[pname] = param.data / float(num_dicts)
+            if pname in dtypes:
+                running_sum[pname] = running_sum[pname].to(dtypes[pname])
     return running_sum
 
 
 def average_checkpoints(
     checkpoint_list,
     recoverable_name,
-    parameter_loader=torch.load,
+    parameter_loader=torch_load_lazy,
     averager=average_state_dicts,
     device=None,
 ):
@@ -1123,8 +1362,9 @@ def average_checkpoints(
         averaged.
     parameter_loader : function
         A function which takes a single argument, the path to a parameter file,
-        and loads the parameters from that file. By default, torch.load,
-        which produces state_dict dictionaries.
+        and loads the parameters from that file. By default,
+        torch_load_lazy, which produces (memory-mapped) state_dict
+        dictionaries, so only one checkpoint is read at a time.
     averager : function
         A function which takes an iterator over the parameters from each
         checkpoint, as loaded by parameter_loader, and produces their average.
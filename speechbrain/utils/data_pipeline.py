@@ -417,6 +417,47 @@ class DataPipeline:
         # Keep a reference to the item in this object, as well:
         self.dynamic_items.append(obj)
 
+    def get_dynamic_item(self, key):
+        """Returns the DynamicItem which provides the given key."""
+        if key not in self.key_to_node:
+            raise KeyError(f"No item provides the key {key}")
+        item = self.dg.digraph[self.dg.key2ind[self.key_to_node[key]]].data
+        if isinstance(item, StaticItem):
+            raise ValueError(f"{key} is a static item")
+        return item
+
+    def replace_dynamic_item(self, old, new):
+        """Replaces a DynamicItem in the pipeline, keeping its dependencies.
+
+        The new item must provide the same keys, in the same order. It may
+        take extra keys, as long as they are static keys (like the data
+        point id), which need no computation.
+
+        Arguments
+        ---------
+        old : DynamicItem
+            The item to replace, e.g. from get_dynamic_item.
+        new : DynamicItem
+            The replacement.
+        """
+        if old.provided_in_order() != new.provided_in_order():
+            raise ValueError("The new item must provide the same keys")
+        for key in new.takes:
+            if key in old.takes:
+                continue
+            node = self.key_to_node.get(key)
+            if node is None or not isinstance(
+                self.dg.digraph[self.dg.key2ind[node]].data, StaticItem
+            ):
+                raise ValueError(f"New argument {key} must be a static key")
+        for ind, node in enumerate(self.dg.digraph):
+            if node.data is old:
+                self.dg.digraph[ind] = node._replace(data=new)
+        self.dynamic_items = [
+            new if item is old else item for item in self.dynamic_items
+        ]
+        self._exec_order = None
+
     def set_output_keys(self, keys):
         """Use this to change the output keys.
 
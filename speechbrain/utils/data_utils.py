@@ -388,7 +388,7 @@ def pad_right_to(
     return tensor, valid_vals
 
 
-def batch_pad_right(tensors: list, mode="constant", value=0):
+def batch_pad_right(tensors: list, mode="constant", value=0, out=None):
     """Given a list of torch tensors it batches them together by padding to the right
     on each dimension in order to get same length for all.
 
@@ -400,6 +400,10 @@ def batch_pad_right(tensors: list, mode="constant", value=0):
         Padding mode see torch.nn.functional.pad documentation.
     value : float
         Padding value see torch.nn.functional.pad documentation.
+    out : callable
+        (Optional) Only for the constant mode. Called with the shape and the
+        dtype of the padded batch, it should return a tensor to write the
+        padded batch into, e.g. a reusable buffer.
 
     Returns
     -------
@@ -408,12 +412,23 @@ def batch_pad_right(tensors: list, mode="constant", value=0):
     valid_vals : list
         List containing proportion for each dimension of original, non-padded values.
 
+    Example
+    -------
+    >>> batch, lengths = batch_pad_right([torch.ones(2), torch.ones(4)])
+    >>> batch
+    tensor([[1., 1., 0., 0.],
+            [1., 1., 1., 1.]])
+    >>> lengths
+    tensor([0.5000, 1.0000])
     """
 
     if not len(tensors):
         raise IndexError("Tensors list must not be empty")
 
-    if len(tensors) == 1:
+    if out is not None and mode != "constant":
+        raise ValueError("Padding into out is only supported in constant mode")
+
+    if len(tensors) == 1 and out is None:
         # if there is only one tensor in the batch we simply unsqueeze it.
         return tensors[0].unsqueeze(0), torch.tensor([1.0])
 
@@ -437,6 +452,20 @@ def batch_pad_right(tensors: list, mode="constant", value=0):
                 )
         max_shape.append(max([x.shape[dim] for x in tensors]))
 
+    if mode == "constant" and tensors[0].ndim > 0:
+        # Write each tensor directly into the padded batch
+        shape = [len(tensors)] + max_shape
+        if out is None:
+            batched = tensors[0].new_empty(shape)
+        else:
+            batched = out(shape, tensors[0].dtype)
+        # Only the first dimension can differ, see above
+        for i, t in enumerate(tensors):
+            batched[i, : t.shape[0]] = t
+            batched[i, t.shape[0] :] = value
+        valid = [t.shape[0] / max_shape[0] for t in tensors]
+        return batched, torch.tensor(valid)
+
     batched = []
     valid = []
     for t in tensors:
@@ -461,10 +490,18 @@ def recursive_to(data, *args, **kwargs):
     """Moves data to device, or other type, and handles containers.
 
     Very similar to torch.utils.data._utils.pin_memory.pin_memory,
-    but applies .to() instead.
+    but applies .to() instead. Strings and other non-tensor leaves are
+    returned as they are, and tuples stay tuples.
+
+    Example
+    -------
+    >>> recursive_to({"id": ["u1", "u2"], "x": (torch.ones(1),)}, "cpu")
+    {'id': ['u1', 'u2'], 'x': (tensor([1.]),)}
     """
     if isinstance(data, torch.Tensor):
         return data.to(*args, **kwargs)
+    elif isinstance(data, (str, bytes)):
+        return data
     elif isinstance(data, collections.abc.Mapping):
         return {
             k: recursive_to(sample, *args, **kwargs)
@@ -474,6 +511,8 @@ def recursive_to(data, *args, **kwargs):
         return type(data)(
             *(recursive_to(sample, *args, **kwargs) for sample in data)
         )
+    elif isinstance(data, tuple):
+        return tuple(recursive_to(sample, *args, **kwargs) for sample in data)
     elif isinstance(data, collections.abc.Sequence):
         return [recursive_to(sample, *args, **kwargs) for sample in data]
     elif hasattr(data, "to"):
@@ -4,6 +4,7 @@ Authors
  * Aku Rouhe 2020
 """
 import collections
+import numpy as np
 
 EDIT_SYMBOLS = {
     "eq": "=",  # when tokens are equal
@@ -12,6 +13,13 @@ EDIT_SYMBOLS = {
     "sub": "S",
 }
 
+# Edit operation codes in the tables of batch_op_counts
+_EQ, _INS, _DEL, _SUB = range(4)
+_OP_SYMBOLS = np.array([EDIT_SYMBOLS[op] for op in ("eq", "ins", "del", "sub")])
+
+# Limit on the number of table cells filled at once by batch_op_counts
+MAX_BATCH_CELLS = 2 ** 22
+
 
 # NOTE: There is a danger in using mutables as default arguments, as they are
 # only initialized once, and not every time the function is run. However,
@@ -104,18 +112,25 @@ def _batch_stats(refs, hyps):
     >>> batch = [[[1,2,3],[4,5,6]], [[1,2,4],[5,6]]]
     >>> refs, hyps = batch
     >>> print(_batch_stats(refs, hyps))
-    Counter({'num_ref_tokens': 6, 'substitutions': 1, 'deletions': 1})
+    Counter({'num_ref_tokens': 6, 'deletions': 1, 'substitutions': 1})
     """
     if len(refs) != len(hyps):
         raise ValueError(
             "The reference and hypothesis batches are not of the same size"
         )
     stats = collections.Counter()
-    for ref_tokens, hyp_tokens in zip(refs, hyps):
-        table = op_table(ref_tokens, hyp_tokens)
-        edits = count_ops(table)
-        stats += edits
-        stats["num_ref_tokens"] += len(ref_tokens)
+    if len(refs) == 0:
+        return stats
+    insertions, deletions, substitutions = batch_op_counts(refs, hyps).sum(0)
+    # Adding Counters leaves out the zero counts, like count_ops.
+    stats += collections.Counter(
+        {
+            "insertions": int(insertions),
+            "deletions": int(deletions),
+            "substitutions": int(substitutions),
+        }
+    )
+    stats["num_ref_tokens"] += sum(len(ref_tokens) for ref_tokens in refs)
     return stats
 
 
@@ -209,6 +224,174 @@ def op_table(a, b):
     return table
 
 
+def batch_op_counts(refs, hyps, return_tables=False):
+    """Counts the edit operations for a batch of sequence pairs at once.
+
+    Gives exactly the same results as ``count_ops(op_table(ref, hyp))`` for
+    each pair, including the Kaldi compute-wer order in ties, but the
+    dynamic programming is vectorized over the batch with NumPy. The tokens
+    are first mapped to integers, so they need to be hashable (otherwise
+    the pairs are compared one by one with ``op_table``).
+
+    A row of the table is filled at once: the insertions are a running
+    minimum along the row, and the edit counts of the chosen paths are
+    carried along with the costs, so no table is needed for the counts.
+
+    Arguments
+    ---------
+    refs : list
+        Batch of reference sequences.
+    hyps : list
+        Batch of hypothesis sequences.
+    return_tables : bool
+        Whether to also return the edit operation tables, e.g. for
+        ``alignment()``.
+
+    Returns
+    -------
+    numpy.ndarray
+        The numbers of insertions, deletions and substitutions for each
+        pair, shape [batch, 3].
+    list
+        Only if return_tables is True, the edit operation tables, as
+        produced by ``op_table`` but as arrays. These can be passed to
+        ``alignment()`` and ``count_ops()``.
+
+    Example
+    -------
+    >>> refs = [[1, 2, 3], ["a", "b"], []]
+    >>> hyps = [[1, 2, 4], ["b"], [5]]
+    >>> batch_op_counts(refs, hyps)
+    array([[0, 0, 1],
+           [0, 1, 0],
+           [1, 0, 0]])
+    """
+    if len(refs) != len(hyps):
+        raise ValueError(
+            "The reference and hypothesis batches are not of the same size"
+        )
+    try:
+        vocab = {}
+        ref_ids = [_tokens_to_ids(tokens, vocab) for tokens in refs]
+        hyp_ids = [_tokens_to_ids(tokens, vocab) for tokens in hyps]
+    except TypeError:
+        # Unhashable tokens, compare them one by one.
+        tables = [op_table(ref, hyp) for ref, hyp in zip(refs, hyps)]
+        counts = np.zeros((len(tables), 3), dtype=np.int64)
+        for k, table in enumerate(tables):
+            ops = count_ops(table)
+            counts[k] = (
+                ops["insertions"],
+                ops["deletions"],
+                ops["substitutions"],
+            )
+        return (counts, tables) if return_tables else counts
+
+    counts = np.zeros((len(refs), 3), dtype=np.int64)
+    tables = [None] * len(refs)
+    # Similar lengths are processed together, to avoid filling padding.
+    order = sorted(
+        range(len(refs)), key=lambda k: (len(ref_ids[k]), len(hyp_ids[k]))
+    )
+    chunk = []
+    max_ref_len = max_hyp_len = 0
+    for k in order:
+        ref_len = max(max_ref_len, len(ref_ids[k]))
+        hyp_len = max(max_hyp_len, len(hyp_ids[k]))
+        num_cells = (len(chunk) + 1) * (ref_len + 1) * (hyp_len + 1)
+        if chunk and num_cells > MAX_BATCH_CELLS:
+            _fill_chunk(chunk, ref_ids, hyp_ids, counts, tables, return_tables)
+            chunk = []
+            ref_len, hyp_len = len(ref_ids[k]), len(hyp_ids[k])
+        chunk.append(k)
+        max_ref_len, max_hyp_len = ref_len, hyp_len
+    if chunk:
+        _fill_chunk(chunk, ref_ids, hyp_ids, counts, tables, return_tables)
+    return (counts, tables) if return_tables else counts
+
+
+def _tokens_to_ids(tokens, vocab):
+    """Maps the tokens of a sequence to integers, adding new ones to vocab."""
+    if hasattr(tokens, "tolist"):
+        # Tensor elements are not hashed by value.
+        tokens = tokens.tolist()
+    return [vocab.setdefault(token, len(vocab)) for token in tokens]
+
+
+def _fill_chunk(chunk, ref_ids, hyp_ids, counts, tables, return_tables):
+    """Runs the dynamic programming for the pairs with indices in chunk."""
+    batch_size = len(chunk)
+    ref_lens = np.array([len(ref_ids[k]) for k in chunk])
+    hyp_lens = np.array([len(hyp_ids[k]) for k in chunk])
+    max_ref_len, max_hyp_len = ref_lens.max(), hyp_lens.max()
+    # Different padding values, so that padding never matches.
+    a = np.full((batch_size, max_ref_len), -1, dtype=np.int32)
+    b = np.full((batch_size, max_hyp_len), -2, dtype=np.int32)
+    for row, k in enumerate(chunk):
+        a[row, : ref_lens[row]] = ref_ids[k]
+        b[row, : hyp_lens[row]] = hyp_ids[k]
+
+    rows = np.arange(batch_size)[:, None]
+    cols = np.arange(max_hyp_len + 1, dtype=np.int32)
+    # The first row has only insertions:
+    cost = np.tile(cols, (batch_size, 1))
+    ins = cost.copy()
+    dels = np.zeros_like(cost)
+    ops = None
+    if return_tables:
+        ops = np.full(
+            (batch_size, max_ref_len + 1, max_hyp_len + 1), _INS, dtype=np.int8
+        )
+        ops[:, 0, 0] = _EQ
+    is_del = np.ones((batch_size, max_hyp_len + 1), dtype=bool)
+    is_ins = np.zeros((batch_size, max_hyp_len + 1), dtype=bool)
+    for i in range(max_ref_len + 1):
+        if i > 0:
+            mismatch = a[:, i - 1, None] != b
+            sub_cost = cost[:, :-1] + mismatch
+            del_cost = cost[:, 1:] + 1
+            # Kaldi order in ties: insertion > deletion > substitution
+            is_del[:, 1:] = del_cost <= sub_cost
+            no_ins_cost = np.empty_like(cost)
+            no_ins_cost[:, 0] = i
+            no_ins_cost[:, 1:] = np.where(is_del[:, 1:], del_cost, sub_cost)
+            new_cost = np.minimum.accumulate(no_ins_cost - cols, axis=1) + cols
+            is_ins[:, 1:] = new_cost[:, :-1] + 1 <= no_ins_cost[:, 1:]
+            # Counts on the path through the deletion or (mis)match:
+            base_ins = np.empty_like(ins)
+            base_ins[:, 0] = 0
+            base_ins[:, 1:] = np.where(is_del[:, 1:], ins[:, 1:], ins[:, :-1])
+            base_dels = np.empty_like(dels)
+            base_dels[:, 0] = i
+            base_dels[:, 1:] = np.where(
+                is_del[:, 1:], dels[:, 1:] + 1, dels[:, :-1]
+            )
+            # A run of insertions continues its last other operation:
+            start = np.maximum.accumulate(np.where(is_ins, 0, cols), axis=1)
+            ins = base_ins[rows, start] + cols - start
+            dels = base_dels[rows, start]
+            cost = new_cost
+            if return_tables:
+                row_ops = ops[:, i]
+                row_ops[:, 1:] = np.where(mismatch, _SUB, _EQ)
+                row_ops[is_del] = _DEL
+                row_ops[is_ins] = _INS
+
+        # Read the counts of the pairs whose reference ends here:
+        (done,) = np.nonzero(ref_lens == i)
+        if len(done) > 0:
+            j = hyp_lens[done]
+            done_ins, done_dels = ins[done, j], dels[done, j]
+            done_subs = cost[done, j] - done_ins - done_dels
+            for row, n_ins, n_dels, n_subs in zip(
+                done, done_ins, done_dels, done_subs
+            ):
+                counts[chunk[row]] = n_ins, n_dels, n_subs
+                if return_tables:
+                    table = ops[row, : i + 1, : hyp_lens[row] + 1]
+                    tables[chunk[row]] = _OP_SYMBOLS[table]
+
+
 def alignment(table):
     """Get the edit distance alignment from an edit op table.
 
@@ -439,6 +622,8 @@ def wer_details_by_utterance(
         If scoring mode is 'strict' and a hypothesis is not found.
     """
     details_by_utterance = []
+    # The edits are computed for all scored utterances at once.
+    scored = []
     for key, ref_tokens in ref_dict.items():
         # Initialize utterance_details
         utterance_details = {
@@ -474,9 +659,22 @@ def wer_details_by_utterance(
             )
         else:
             raise ValueError("Invalid scoring mode: " + scoring_mode)
-        # Compute edits for this utterance
-        table = op_table(ref_tokens, hyp_tokens)
-        ops = count_ops(table)
+        scored.append((utterance_details, ref_tokens, hyp_tokens))
+        details_by_utterance.append(utterance_details)
+
+    # Compute edits for the scored utterances
+    refs = [ref_tokens for _, ref_tokens, _ in scored]
+    hyps = [hyp_tokens for _, _, hyp_tokens in scored]
+    tables = [None] * len(scored)
+    if compute_alignments:
+        counts, tables = batch_op_counts(refs, hyps, return_tables=True)
+    else:
+        counts = batch_op_counts(refs, hyps)
+    for (utterance_details, ref_tokens, hyp_tokens), ops, table in zip(
+        scored, counts.tolist(), tables
+    ):
+        insertions, deletions, substitutions = ops
+        num_edits = insertions + deletions + substitutions
         # Update the utterance-level details if we got this far:
         utterance_details.update(
             {
@@ -484,18 +682,17 @@ def wer_details_by_utterance(
                 "hyp_empty": True
                 if len(hyp_tokens) == 0
                 else False,  # This also works for e.g. torch tensors
-                "num_edits": sum(ops.values()),
+                "num_edits": num_edits,
                 "num_ref_tokens": len(ref_tokens),
-                "WER": 100.0 * sum(ops.values()) / len(ref_tokens),
-                "insertions": ops["insertions"],
-                "deletions": ops["deletions"],
-                "substitutions": ops["substitutions"],
+                "WER": 100.0 * num_edits / len(ref_tokens),
+                "insertions": insertions,
+                "deletions": deletions,
+                "substitutions": substitutions,
                 "alignment": alignment(table) if compute_alignments else None,
                 "ref_tokens": ref_tokens if compute_alignments else None,
                 "hyp_tokens": hyp_tokens if compute_alignments else None,
             }
         )
-        details_by_utterance.append(utterance_details)
     return details_by_utterance
 
 
@@ -5,13 +5,21 @@ Authors:
  * Peter Plantinga 2020
  * Mirco Ravanelli 2020
 """
+import math
 import torch
-from joblib import Parallel, delayed
+import logging
+import concurrent.futures
+from joblib.externals.loky import get_reusable_executor
 from speechbrain.utils.data_utils import undo_padding
 from speechbrain.utils.edit_distance import wer_summary, wer_details_for_batch
 from speechbrain.dataio.dataio import merge_char, split_word
 from speechbrain.dataio.wer import print_wer_summary, print_alignments
 
+logger = logging.getLogger(__name__)
+
+# Seconds after which idle evaluation workers are shut down
+IDLE_WORKER_TIMEOUT = 300
+
 
 class MetricStats:
     """A default class for storing and summarizing arbitrary metrics.
@@ -29,11 +37,15 @@ class MetricStats:
         When True it feeds the evaluation metric with the batched input.
         When False and n_jobs=1, it performs metric evaluation one-by-one
         in a sequential way. When False and n_jobs>1, the evaluation
-        runs in parallel over the different inputs using joblib.
+        runs in parallel over the different inputs, see ``parallel_map``.
     n_jobs : int
         The number of jobs to use for computing the metric. If this is
         more than one, every sample is processed individually, otherwise
         the whole batch is passed at once.
+    ignore_failures : bool
+        With n_jobs > 1 and batch_eval=False, whether the samples whose
+        evaluation fails (or times out) get a NaN score, after logging the
+        error (the default). If False, an error is raised instead.
 
     Example
     -------
@@ -54,10 +66,11 @@ class MetricStats:
     'utterance2'
     """
 
-    def __init__(self, metric, n_jobs=1, batch_eval=True):
+    def __init__(self, metric, n_jobs=1, batch_eval=True, ignore_failures=True):
         self.metric = metric
         self.n_jobs = n_jobs
         self.batch_eval = batch_eval
+        self.ignore_failures = ignore_failures
         self.clear()
 
     def clear(self):
@@ -93,7 +106,11 @@ class MetricStats:
             else:
                 # Multiprocess evaluation
                 scores = multiprocess_evaluation(
-                    metric=self.metric, n_jobs=self.n_jobs, **kwargs
+                    metric=self.metric,
+                    n_jobs=self.n_jobs,
+                    ids=ids,
+                    ignore_failures=self.ignore_failures,
+                    **kwargs,
                 )
 
         self.scores.extend(scores)
@@ -152,24 +169,172 @@ class MetricStats:
             print(message)
 
 
-def multiprocess_evaluation(metric, predict, target, lengths=None, n_jobs=8):
-    """Runs metric evaluation if parallel over multiple jobs."""
+def multiprocess_evaluation(
+    metric,
+    predict,
+    target,
+    lengths=None,
+    n_jobs=8,
+    ids=None,
+    ignore_failures=True,
+    **kwargs,
+):
+    """Runs metric evaluation in parallel over multiple jobs.
+
+    By default, the inputs whose evaluation fails get a NaN score, and the
+    failures are logged. See ``parallel_map`` for the other keyword
+    arguments.
+    """
     if lengths is not None:
         lengths = (lengths * predict.size(1)).round().int().cpu()
         predict = [p[:length].cpu() for p, length in zip(predict, lengths)]
         target = [t[:length].cpu() for t, length in zip(target, lengths)]
 
-    while True:
-        try:
-            scores = Parallel(n_jobs=n_jobs, timeout=30)(
-                delayed(metric)(p, t) for p, t in zip(predict, target)
-            )
+    return parallel_map(
+        metric,
+        list(zip(predict, target)),
+        n_jobs=n_jobs,
+        ignore_failures=ignore_failures,
+        failure_value=float("nan"),
+        keys=ids,
+        **kwargs,
+    )
+
+
+def parallel_map(
+    func,
+    items,
+    n_jobs=8,
+    chunk_size=None,
+    timeout=30,
+    max_retries=2,
+    ignore_failures=False,
+    failure_value=None,
+    keys=None,
+):
+    """Computes ``func(*item)`` for each item in a pool of worker processes.
+
+    The pool is persistent: the worker processes are started once and reused
+    across calls (and shut down after some idle time). The items are sent in
+    chunks, to limit the overhead per item. An exception raised for an item
+    only fails that item. Failed items are retried, and the results are
+    returned in the same order as the items.
+
+    Arguments
+    ---------
+    func : callable
+        The function to apply, e.g. a metric. Called with the unpacked item.
+    items : list
+        The tuples of arguments for each call.
+    n_jobs : int
+        Number of worker processes.
+    chunk_size : int
+        Number of items sent to a worker at a time. By default, the items are
+        split in four chunks per worker.
+    timeout : float
+        If no chunk of results arrives for this many seconds, the workers
+        are restarted and the unfinished items are retried, one per chunk.
+        Note that starting the workers counts too. None means no limit.
+        Default: 30.
+    max_retries : int
+        How many times the failed items are retried.
+    ignore_failures : bool
+        If True, the results of items that still fail are failure_value,
+        and the failures are logged. Otherwise, an error is raised.
+    failure_value : any
+        The result of the items that fail, if ignore_failures is True.
+    keys : list
+        Names of the items (e.g. utterance ids), used when reporting failures.
+
+    Returns
+    -------
+    list
+        The outputs of func for each item.
+
+    Raises
+    ------
+    RuntimeError
+        If some items failed after all retries, and ignore_failures is False.
+
+    Example
+    -------
+    >>> parallel_map(pow, [(2, 3), (3, 2), (4, 0)], n_jobs=2)
+    [8, 9, 1]
+    """
+    if keys is None:
+        keys = list(range(len(items)))
+    if chunk_size is None:
+        chunk_size = max(1, math.ceil(len(items) / (4 * n_jobs)))
+    results = [failure_value] * len(items)
+    errors = {}
+    pending = list(range(len(items)))
+    for attempt in range(max_retries + 1):
+        if not pending:
             break
-        except Exception as e:
-            print(e)
-            print("Evaluation timeout...... (will try again)")
+        if attempt > 0:
+            logger.warning(f"Retrying {len(pending)} failed evaluation(s)")
+        executor = get_reusable_executor(
+            max_workers=n_jobs, timeout=IDLE_WORKER_TIMEOUT
+        )
+        chunks = {}
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start : start + chunk_size]
+            future = executor.submit(
+                _apply_to_chunk, func, [items[k] for k in chunk]
+            )
+            chunks[future] = chunk
+        failed = []
+        not_done = set(chunks)
+        while not_done:
+            done, not_done = concurrent.futures.wait(
+                not_done,
+                timeout=timeout,
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            if not done:
+                # Some workers hang, so restart the pool.
+                executor.shutdown(wait=False, kill_workers=True)
+                for future in not_done:
+                    for k in chunks[future]:
+                        errors[k] = f"Timeout after {timeout}s"
+                        failed.append(k)
+                chunk_size = 1
+                break
+            for future in done:
+                try:
+                    outputs = future.result()
+                except Exception as e:
+                    # E.g. a worker crashed
+                    error = f"{type(e).__name__}: {e}"
+                    outputs = [(False, error)] * len(chunks[future])
+                for k, (success, output) in zip(chunks[future], outputs):
+                    if success:
+                        results[k] = output
+                    else:
+                        errors[k] = output
+                        failed.append(k)
+        pending = sorted(failed)
+
+    if pending:
+        message = (
+            f"Evaluation failed for {len(pending)} item(s):\n"
+            + "\n".join(f"{keys[k]}: {errors[k]}" for k in pending)
+        )
+        if not ignore_failures:
+            raise RuntimeError(message)
+        logger.warning(message)
+    return results
 
-    return scores
+
+def _apply_to_chunk(func, chunk):
+    """Applies func to each item of a chunk, in a worker process."""
+    outputs = []
+    for item in chunk:
+        try:
+            outputs.append((True, func(*item)))
+        except Exception as e:
+            outputs.append((False, f"{type(e).__name__}: {e}"))
+    return outputs
 
 
 def sequence_evaluation(metric, predict, target, lengths=None):
@@ -204,6 +369,10 @@ class ErrorRateStats(MetricStats):
         this represents character to split on after merge.
         Used with ``split_tokens`` the sequence is joined with
         this token in between, and then the whole sequence is split.
+    n_jobs : int
+        If more than one, each batch is split in this many shards, which are
+        scored in parallel (see ``parallel_map``). Useful for large batches
+        of long sequences.
 
     Example
     -------
@@ -227,11 +396,14 @@ class ErrorRateStats(MetricStats):
     1
     """
 
-    def __init__(self, merge_tokens=False, split_tokens=False, space_token="_"):
+    def __init__(
+        self, merge_tokens=False, split_tokens=False, space_token="_", n_jobs=1
+    ):
         self.clear()
         self.merge_tokens = merge_tokens
         self.split_tokens = split_tokens
         self.space_token = space_token
+        self.n_jobs = n_jobs
 
     def append(
         self,
@@ -284,7 +456,26 @@ class ErrorRateStats(MetricStats):
             predict = split_word(predict, space=self.space_token)
             target = split_word(target, space=self.space_token)
 
-        scores = wer_details_for_batch(ids, target, predict, True)
+        if self.n_jobs > 1 and len(ids) > 1:
+            shard_size = math.ceil(len(ids) / self.n_jobs)
+            shards = [
+                (
+                    ids[start : start + shard_size],
+                    target[start : start + shard_size],
+                    predict[start : start + shard_size],
+                    True,
+                )
+                for start in range(0, len(ids), shard_size)
+            ]
+            scores = [
+                details
+                for shard_scores in parallel_map(
+                    wer_details_for_batch, shards, self.n_jobs, chunk_size=1
+                )
+                for details in shard_scores
+            ]
+        else:
+            scores = wer_details_for_batch(ids, target, predict, True)
 
         self.scores.extend(scores)
 
@@ -480,25 +671,17 @@ def EER(positive_scores, negative_scores):
     interm_thresholds = (thresholds[0:-1] + thresholds[1:]) / 2
     thresholds, _ = torch.sort(torch.cat([thresholds, interm_thresholds]))
 
-    # Variable to store the min FRR, min FAR and their corresponding index
-    min_index = 0
-    final_FRR = 0
-    final_FAR = 0
-
-    for i, cur_thresh in enumerate(thresholds):
-        pos_scores_threshold = positive_scores <= cur_thresh
-        FRR = (pos_scores_threshold.sum(0)).float() / positive_scores.shape[0]
-        del pos_scores_threshold
-
-        neg_scores_threshold = negative_scores > cur_thresh
-        FAR = (neg_scores_threshold.sum(0)).float() / negative_scores.shape[0]
-        del neg_scores_threshold
+    FRR, FAR = _error_rates(positive_scores, negative_scores, thresholds)
 
-        # Finding the threshold for EER
-        if (FAR - FRR).abs().item() < abs(final_FAR - final_FRR) or i == 0:
+    # Finding the threshold for EER
+    diffs = (FAR - FRR).abs().tolist()
+    FRR, FAR = FRR.tolist(), FAR.tolist()
+    min_index = 0
+    for i, diff in enumerate(diffs):
+        if diff < abs(FAR[min_index] - FRR[min_index]):
             min_index = i
-            final_FRR = FRR.item()
-            final_FAR = FAR.item()
+    final_FRR = FRR[min_index]
+    final_FAR = FAR[min_index]
 
     # It is possible that eer != fpr != fnr. We return (FAR  + FRR) / 2 as EER.
     EER = (final_FAR + final_FRR) / 2
@@ -549,23 +732,8 @@ def minDCF(
     interm_thresholds = (thresholds[0:-1] + thresholds[1:]) / 2
     thresholds, _ = torch.sort(torch.cat([thresholds, interm_thresholds]))
 
-    # Computing False Rejection Rate (miss detection)
-    positive_scores = torch.cat(
-        len(thresholds) * [positive_scores.unsqueeze(0)]
-    )
-    pos_scores_threshold = positive_scores.transpose(0, 1) <= thresholds
-    p_miss = (pos_scores_threshold.sum(0)).float() / positive_scores.shape[1]
-    del positive_scores
-    del pos_scores_threshold
-
-    # Computing False Acceptance Rate (false alarm)
-    negative_scores = torch.cat(
-        len(thresholds) * [negative_scores.unsqueeze(0)]
-    )
-    neg_scores_threshold = negative_scores.transpose(0, 1) > thresholds
-    p_fa = (neg_scores_threshold.sum(0)).float() / negative_scores.shape[1]
-    del negative_scores
-    del neg_scores_threshold
+    # Computing miss detection and false alarm rates
+    p_miss, p_fa = _error_rates(positive_scores, negative_scores, thresholds)
 
     c_det = c_miss * p_miss * p_target + c_fa * p_fa * (1 - p_target)
     c_min, min_index = torch.min(c_det, dim=0)
@@ -573,6 +741,20 @@ def minDCF(
     return float(c_min), float(thresholds[min_index])
 
 
+def _error_rates(positive_scores, negative_scores, thresholds):
+    """Computes the false rejection and false acceptance rates at each
+    threshold, by counting the scores on either side in sorted order."""
+    positive_scores, _ = torch.sort(positive_scores)
+    negative_scores, _ = torch.sort(negative_scores)
+    num_rejected = torch.searchsorted(positive_scores, thresholds, right=True)
+    num_accepted = len(negative_scores) - torch.searchsorted(
+        negative_scores, thresholds, right=True
+    )
+    FRR = num_rejected.float() / positive_scores.shape[0]
+    FAR = num_accepted.float() / negative_scores.shape[0]
+    return FRR, FAR
+
+
 class ClassificationStats(MetricStats):
     """Computes statistics pertaining to multi-label
     classification tasks, as well as tasks that can be loosely interpreted as such for the purpose of
@@ -236,6 +236,10 @@ class Pretrainer:
     def load_collected(self, device=None):
         """Loads the files that have been collected.
 
+        The default hooks memory-map the parameter files and copy the
+        parameters over one at a time (see ``torch_load_lazy``), so the files
+        are never fully loaded in memory.
+
         Arguments
         ---------
         device : str
@@ -1,3 +1,4 @@
+import math
 import os
 import torch
 from speechbrain.dataio.dataio import write_audio
@@ -50,6 +51,49 @@ def test_add_noise(tmpdir, device):
     assert add_noise(test_waveform, wav_lens).allclose(expected, atol=1e-4)
 
 
+def test_noise_bank(tmpdir, device):
+    from speechbrain.processing.speech_augmentation import AddNoise, NoiseBank
+
+    test_waveform = torch.sin(torch.arange(16000.0, device=device)).unsqueeze(0)
+    wav_lens = torch.ones(1, device=device)
+    noises = [torch.rand(16000) - 0.5, torch.rand(4000) - 0.5]
+    csv = os.path.join(tmpdir, "noise.csv")
+    with open(csv, "w") as w:
+        w.write("ID, duration, wav, wav_format, wav_opts\n")
+        for i, noise in enumerate(noises):
+            noisefile = os.path.join(tmpdir, f"noise{i}.wav")
+            write_audio(noisefile, noise, 16000)
+            w.write(f"{i}, 1.0, {noisefile}, wav,\n")
+
+    bank = NoiseBank(csv)
+    assert len(bank) == 2
+    assert bank.offsets.tolist() == [0, 16000]
+    assert bank.data.shape == (20000,)
+
+    # Short noises are repeated or zero-padded
+    lengths = torch.full((50,), 16000, device=device)
+    short_noise = noises[1].to(device)
+    for pad_noise in [True, False]:
+        noise, noise_len = bank.sample(lengths, 16000, pad_noise, 0)
+        assert noise.shape == (50, 16000) and noise.device == lengths.device
+        short = (noise[:, :4000] - short_noise).abs().max(1).values < 1e-4
+        assert 0 < short.sum() < 50
+        expected = short_noise.repeat(4) if pad_noise else 0 * short_noise
+        assert noise[short, 4000:8000].allclose(expected[:4000], atol=1e-4)
+        assert noise[~short].allclose(noises[0].to(device), atol=1e-4)
+        assert noise_len[short].eq(16000 if pad_noise else 4000).all()
+
+    # Each signal gets its own starting index
+    noise, _ = bank.sample(lengths[:20], 2000, pad_noise=True)
+    assert len(set(noise[:, 0].tolist())) > 10
+
+    # Basic 0dB case, as with the data loader
+    add_noise = AddNoise(csv_file=csv, noise_bank=True).to(device)
+    noisy = add_noise(test_waveform.repeat(8, 1), wav_lens.repeat(8))
+    assert noisy.shape == (8, 16000)
+    assert not noisy.allclose(test_waveform / 2, atol=1e-2)
+
+
 def test_add_reverb(tmpdir, device):
     from speechbrain.processing.speech_augmentation import AddReverb
 
@@ -97,6 +141,62 @@ def test_add_reverb(tmpdir, device):
     assert reverbed.allclose(ir3_result[:, 0:1000], atol=2e-1)
 
 
+def test_reverb_bank(tmpdir, device):
+    import numpy as np
+    from speechbrain.processing.speech_augmentation import (
+        AddReverb,
+        ReverbBank,
+    )
+
+    torch.manual_seed(0)
+    rirs = [torch.rand(300) * torch.linspace(1, 0, 300), torch.rand(1200)]
+    rirs[0][20] = 2.0
+    csv = os.path.join(tmpdir, "ir.csv")
+    with open(csv, "w") as w:
+        w.write("ID, duration, wav, wav_format, wav_opts\n")
+        for i, rir in enumerate(rirs):
+            rir_file = os.path.join(tmpdir, f"ir{i}.wav")
+            write_audio(rir_file, rir / 2, 16000)
+            w.write(f"{i}, 0.1, {rir_file}, wav,\n")
+
+    bank = ReverbBank(csv)
+    assert bank.rirs.shape == (2, 1, 1200)
+    assert bank.direct_index[0] == 20
+
+    # Linear convolution, aligned with the direct signal
+    waveforms = torch.rand(3, 5000, device=device) - 0.5
+    rir_ids = torch.tensor([0, 1, 0], device=device)
+    reverbed = bank.reverberate(waveforms, rir_ids, rescale_amp=None)
+    assert reverbed.shape == waveforms.shape
+    for i, rir_id in enumerate(rir_ids.tolist()):
+        rir = bank.rirs[rir_id, 0].cpu().numpy()
+        direct = int(bank.direct_index[rir_id])
+        expected = np.convolve(waveforms[i].cpu().numpy(), rir)
+        expected = torch.from_numpy(expected[direct : direct + 5000])
+        assert reverbed[i].cpu().allclose(expected.float(), atol=1e-3)
+
+    # Overlap-save gives the same result, with a single cached FFT size
+    block_bank = ReverbBank(csv, block_size=2048)
+    for length in [1000, 5000, 20000]:
+        waveforms = torch.rand(3, length, 2, device=device) - 0.5
+        expected = bank.reverberate(waveforms, rir_ids)
+        reverbed = block_bank.reverberate(waveforms, rir_ids)
+        assert reverbed.shape == (3, length, 2)
+        assert reverbed.allclose(expected, atol=1e-4)
+    assert list(block_bank._fft_cache) == [(2048, False)]
+    assert sorted(bank._fft_cache) == [
+        (2560, True),
+        (8192, True),
+        (24576, True),
+    ]
+
+    # Each signal gets its own RIR
+    add_reverb = AddReverb(csv, rir_bank=True, block_size=4096)
+    reverbed = add_reverb(waveforms[:, :, 0].repeat(4, 1), torch.ones(12))
+    assert reverbed.shape == (12, 20000)
+    assert 0 < reverbed[:, 0].unique().numel() < 12
+
+
 def test_speed_perturb(device):
     from speechbrain.processing.speech_augmentation import SpeedPerturb
 
@@ -113,6 +213,49 @@ def test_speed_perturb(device):
     assert half_speed(test_waveform).allclose(test_waveform[:, ::2], atol=3e-1)
 
 
+def test_resample(device):
+    from speechbrain.processing import speech_augmentation
+    from speechbrain.processing.speech_augmentation import (
+        Resample,
+        resample_batch,
+    )
+
+    def sine(freq, rate, num_samples):
+        t = torch.arange(num_samples, device=device) / rate
+        return torch.sin(2 * math.pi * freq * t)
+
+    # Matches the analytic signal at the new rate, away from the edges
+    for orig_freq, new_freq in [(16000, 8000), (16000, 22050), (44100, 16000)]:
+        signal = sine(440, orig_freq, orig_freq).unsqueeze(0)
+        resampled = Resample(orig_freq, new_freq)(signal)
+        assert resampled.shape == (1, new_freq)
+        expected = sine(440, new_freq, new_freq).unsqueeze(0)
+        assert resampled[:, 100:-100].allclose(expected[:, 100:-100], atol=1e-2)
+
+    # Channels are resampled independently
+    signal = torch.stack([sine(440, 16000, 800), sine(880, 16000, 800)], -1)
+    resampled = Resample(16000, 8000)(signal.unsqueeze(0))
+    assert resampled.shape == (1, 400, 2)
+    assert resampled[0, :, 1].allclose(
+        Resample(16000, 8000)(signal[:, 1].unsqueeze(0))[0], atol=1e-6
+    )
+
+    # Filters are computed once for all the instances
+    Resample(16000, 12000)(signal[:, 0].unsqueeze(0))
+    num_kernels = len(speech_augmentation._resample_kernels)
+    Resample(16000, 12000)(signal[:, 1].unsqueeze(0))
+    assert len(speech_augmentation._resample_kernels) == num_kernels
+
+    # Batches of signals with different rates and lengths
+    rates = [16000, 8000, 16000, 44100, 12000]
+    signals = [sine(440, rate, 300 + 17 * i) for i, rate in enumerate(rates)]
+    resampled = resample_batch(signals, rates, 12000)
+    for signal, rate, output in zip(signals, rates, resampled):
+        expected = Resample(rate, 12000)(signal.unsqueeze(0))[0]
+        assert output.shape == expected.shape
+        assert output.allclose(expected, atol=1e-6)
+
+
 def test_babble(device):
     from speechbrain.processing.speech_augmentation import AddBabble
 
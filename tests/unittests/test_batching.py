@@ -79,3 +79,56 @@ def test_pin_memory():
     )
     batch.pin_memory()
     assert batch.foo.data.is_pinned()
+
+
+def test_paddedbatch_buffer_pool(device):
+    from speechbrain.dataio.batch import PaddedBatch, PinnedBufferPool
+    import functools
+    import pickle
+
+    pool = PinnedBufferPool(
+        "test", min_numel=64, pin_memory=torch.cuda.is_available()
+    )
+    assert PinnedBufferPool("test") is pool
+    assert PinnedBufferPool("test", min_numel=64) is pool
+    with pytest.raises(ValueError):
+        PinnedBufferPool("test", min_numel=128)
+    with pytest.raises(ValueError):
+        PinnedBufferPool("test", max_buffers=2)
+    assert pickle.loads(pickle.dumps(pool)) is pool
+
+    examples = [
+        {"wav": torch.rand(n, 2), "tokens": torch.arange(n), "id": str(n)}
+        for n in [3, 7, 5]
+    ]
+    expected = PaddedBatch(examples)
+    batch = PaddedBatch(examples, buffer_pool=pool)
+    for key in ["wav", "tokens"]:
+        assert torch.equal(batch[key].data, expected[key].data)
+        assert torch.equal(batch[key].lengths, expected[key].lengths)
+    assert batch.wav.data.is_pinned() == pool.pin_memory
+
+    # Moving the batch gives the buffers back, for the next batches
+    wav_ptr = batch.wav.data.data_ptr()
+    batch.to(device, dtype=torch.float64)
+    assert batch.wav.data.device.type == torch.device(device).type
+    assert torch.equal(batch.wav.data.cpu(), expected.wav.data.double())
+    assert len(pool) == 2
+    batch = PaddedBatch(examples[:2], buffer_pool=pool)
+    assert batch.wav.data.data_ptr() == wav_ptr
+    assert torch.equal(batch.wav.data, PaddedBatch(examples[:2]).wav.data)
+
+    # Batches collated in workers are copied to the pool by pin_memory
+    batch.to(dtype=torch.float64)
+    loader = torch.utils.data.DataLoader(
+        examples,
+        batch_size=3,
+        num_workers=1,
+        collate_fn=functools.partial(PaddedBatch, buffer_pool=pool),
+    )
+    batch = next(iter(loader))
+    assert len(pool) == 2
+    batch.pin_memory()
+    assert len(pool) == 0
+    assert torch.equal(batch.wav.data, expected.wav.data)
+    assert torch.equal(batch.tokens.data, expected.tokens.data)
@@ -385,3 +385,79 @@ def test_torch_defaults(tmpdir, device):
     )
     checkpointer.load_checkpoint(ckpt)
     assert torch.allclose(module(inp), prev_output)
+
+
+def test_async_checkpoints(tmpdir, device):
+    import os
+    import torch
+    from speechbrain.utils.checkpoints import Checkpointer
+
+    model = torch.nn.Linear(2, 2).to(device)
+    optimizer = torch.optim.Adam(model.parameters())
+    model(torch.ones(1, 2, device=device)).sum().backward()
+    optimizer.step()
+    recoverables = {"model": model, "optimizer": optimizer}
+    checkpointer = Checkpointer(tmpdir, recoverables, async_save=True)
+
+    ckpt = checkpointer.save_checkpoint(meta={"loss": 1.0})
+    # Changes after the save call are not included
+    weight = model.weight.detach().clone()
+    model.weight.data += 1.0
+    checkpointer.wait()
+    assert ckpt.path.exists()
+    assert os.listdir(tmpdir) == [ckpt.path.name]
+    assert checkpointer.list_checkpoints() == [ckpt]
+    assert checkpointer.recover_if_possible() == ckpt
+    assert torch.equal(model.weight, weight)
+    optimizer.step()
+
+    # Two checkpoints in the same second get different names,
+    # old ones are deleted only after the new one is written
+    for loss in [0.5, 2.0, 0.8]:
+        checkpointer.save_and_keep_only(meta={"loss": loss}, min_keys=["loss"])
+    checkpointer.wait()
+    kept = sorted(ckpt.meta["loss"] for ckpt in checkpointer.list_checkpoints())
+    assert kept == [0.5, 0.8]
+
+    # A failed write does not delete anything and raises on wait
+    class Unpicklable(torch.nn.Module):
+        def state_dict(self):
+            return {"fn": lambda: None}
+
+    checkpointer.add_recoverable("broken", Unpicklable())
+    checkpointer.save_and_keep_only(meta={"loss": 0.1}, min_keys=["loss"])
+    with pytest.raises(Exception):
+        checkpointer.wait()
+    assert len(checkpointer.list_checkpoints()) == 2
+    assert len(os.listdir(tmpdir)) == 2
+
+
+def test_lazy_loading(tmpdir):
+    import torch
+    from speechbrain.utils.checkpoints import (
+        Checkpointer,
+        average_checkpoints,
+        torch_load_lazy,
+        torch_recovery,
+    )
+
+    # Legacy format files are loaded too
+    path = str(tmpdir / "legacy.ckpt")
+    torch.save({"a": torch.ones(3)}, path, _use_new_zipfile_serialization=False)
+    assert torch.equal(torch_load_lazy(path)["a"], torch.ones(3))
+
+    model = torch.nn.Linear(4, 4).half()
+    checkpointer = Checkpointer(tmpdir / "ckpts", {"model": model})
+    weights = []
+    for i in range(3):
+        model.weight.data = torch.randn(4, 4).half()
+        weights.append(model.weight.detach().clone())
+        ckpt = checkpointer.save_checkpoint()
+    averaged = average_checkpoints(checkpointer.list_checkpoints(), "model")
+    assert averaged["weight"].dtype == torch.float16
+    expected = torch.stack(weights).float().mean(0).half()
+    assert torch.allclose(averaged["weight"], expected)
+
+    other = torch.nn.Linear(4, 4).half()
+    torch_recovery(other, ckpt.paramfiles["model"], end_of_epoch=True)
+    assert torch.equal(other.weight, weights[-1])
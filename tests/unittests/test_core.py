@@ -38,3 +38,111 @@ def test_brain(device):
     end_output = brain.compute_forward(inputs, Stage.VALID)
     end_loss = brain.compute_objectives(end_output, targets, Stage.VALID)
     assert end_loss < start_loss
+
+
+def test_brain_prefetch(device):
+    import torch
+    from speechbrain.core import Brain
+    from torch.optim import SGD
+
+    class SimpleBrain(Brain):
+        def compute_forward(self, batch, stage):
+            assert batch[0].device.type == torch.device(self.device).type
+            return self.modules.model(batch[0])
+
+        def compute_objectives(self, predictions, batch, stage):
+            return torch.nn.functional.l1_loss(predictions, batch[1])
+
+    torch.manual_seed(0)
+    train_set = [[torch.rand(4, 10), torch.rand(4, 10)] for _ in range(5)]
+    weights = []
+    for prefetch_batches in [0, 2]:
+        torch.manual_seed(1)
+        model = torch.nn.Linear(10, 10)
+        brain = SimpleBrain(
+            {"model": model},
+            lambda x: SGD(x, 0.1),
+            run_opts={"device": device, "prefetch_batches": prefetch_batches},
+        )
+        brain.fit(epoch_counter=range(2), train_set=train_set)
+        weights.append(model.weight.detach().cpu())
+        assert brain.evaluate(train_set) > 0
+    assert torch.allclose(weights[0], weights[1])
+
+
+def test_brain_sync_interval(device):
+    import torch
+    import pytest
+    from speechbrain.core import Brain
+    from torch.optim import SGD
+
+    class SimpleBrain(Brain):
+        def compute_forward(self, batch, stage):
+            return self.modules.model(batch[0])
+
+        def compute_objectives(self, predictions, batch, stage):
+            loss = torch.nn.functional.l1_loss(predictions, batch[1])
+            # Batches with a negative target give a non-finite loss
+            return loss / (batch[1].min() > 0)
+
+    torch.manual_seed(0)
+    train_set = [[torch.rand(4, 10), torch.rand(4, 10) + 0.1] for _ in range(5)]
+    results = []
+    for sync_interval in [1, 3]:
+        torch.manual_seed(1)
+        model = torch.nn.Linear(10, 10)
+        brain = SimpleBrain(
+            {"model": model},
+            lambda x: SGD(x, 0.1),
+            run_opts={"device": device, "sync_interval": sync_interval},
+        )
+        brain.fit(epoch_counter=range(2), train_set=train_set)
+        results.append((model.weight.detach().cpu(), brain.avg_train_loss))
+    assert torch.allclose(results[0][0], results[1][0])
+    assert results[1][1] == pytest.approx(results[0][1])
+
+    # Non-finite losses are skipped until the patience is exhausted
+    train_set[2][1] -= 1.0
+    torch.manual_seed(1)
+    model = torch.nn.Linear(10, 10)
+    brain = SimpleBrain(
+        {"model": model},
+        lambda x: SGD(x, 0.1),
+        run_opts={"device": device, "sync_interval": 3},
+    )
+    brain.fit(epoch_counter=range(1), train_set=train_set)
+    assert brain.nonfinite_count == 1
+    assert torch.isfinite(model.weight).all()
+    brain.nonfinite_patience = 0
+    with pytest.raises(ValueError):
+        brain.fit(epoch_counter=range(2), train_set=train_set)
+
+    # Stateful optimizers: the step of a non-finite batch is undone, also
+    # when it is the first one (which creates the optimizer state)
+    from torch.optim import Adam
+
+    train_set[0][1] -= 1.0
+    # (Adam keeps its step count on the cpu unless capturable=True)
+    for capturable in [False, True] if device != "cpu" else [False]:
+        results = []
+        for sync_interval in [1, 3]:
+            torch.manual_seed(1)
+            model = torch.nn.Linear(10, 10)
+            brain = SimpleBrain(
+                {"model": model},
+                lambda x: Adam(x, 0.1, weight_decay=0.1, capturable=capturable),
+                run_opts={"device": device, "sync_interval": sync_interval},
+            )
+            brain.fit(epoch_counter=range(2), train_set=train_set)
+            assert brain.nonfinite_count == 2
+            state = brain.optimizer.state[model.weight]
+            results.append(
+                (
+                    model.weight.detach().cpu(),
+                    state["exp_avg"].cpu(),
+                    float(state["step"]),
+                )
+            )
+        assert torch.allclose(results[0][0], results[1][0])
+        assert torch.allclose(results[0][1], results[1][1])
+        assert results[0][2] == results[1][2] == 6
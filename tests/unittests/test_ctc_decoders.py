@@ -0,0 +1,120 @@
+import itertools
+import math
+import torch
+
+
+def test_ctc_prefix_beam_search(device):
+
+    from speechbrain.decoders.ctc import (
+        CTCPrefixBeamSearcher,
+        filter_ctc_output,
+    )
+
+    torch.manual_seed(0)
+    batch_size, time, vocab = 3, 5, 4
+    log_probs = torch.randn(batch_size, time, vocab, device=device)
+    log_probs = log_probs.log_softmax(dim=-1)
+    lens = torch.tensor([1.0, 0.8, 0.6], device=device)
+
+    searcher = CTCPrefixBeamSearcher(
+        blank_index=0, beam_size=10000, token_topk=None, beam_prune_logp=-1e9
+    )
+    beams = searcher.decode_beams(log_probs, lens)
+
+    # Exhaustive sum over all the alignments of each label sequence
+    for i in range(batch_size):
+        length = int(round(lens[i].item() * time))
+        exact = {}
+        for path in itertools.product(range(vocab), repeat=length):
+            labels = tuple(filter_ctc_output(list(path), blank_id=0))
+            logp = sum(log_probs[i, t, c].item() for t, c in enumerate(path))
+            exact[labels] = exact.get(labels, 0.0) + math.exp(logp)
+
+        assert len(beams[i]) == len(exact)
+        for prefix, score in beams[i]:
+            assert math.isclose(
+                score, math.log(exact[tuple(prefix)]), rel_tol=1e-4
+            )
+
+    # A wide enough beam still finds the best hypothesis
+    best = CTCPrefixBeamSearcher(blank_index=0, beam_size=100)(log_probs, lens)
+    assert best == [b[0][0] for b in beams]
+
+
+def test_ctc_prefix_beam_search_lm(device):
+
+    from speechbrain.decoders.ctc import CTCPrefixBeamSearcher
+    from speechbrain.lm.ngram import BackoffNgramLM, CompiledNgramLM
+
+    # Two frames, acoustically ambiguous between "▁a" and "▁b" and "c"
+    probs = torch.tensor(
+        [[[0.0, 0.4, 0.3, 0.3], [1.0, 0.0, 0.0, 0.0], [0.0, 0.4, 0.3, 0.3]]],
+        device=device,
+    )
+    lens = torch.tensor([1.0], device=device)
+    vocab_list = ["<blank>", "▁a", "▁b", "c"]
+
+    searcher = CTCPrefixBeamSearcher(blank_index=0, vocab_list=vocab_list)
+    assert searcher(probs.log(), lens) == [[1, 1]]
+
+    # Word-level LM: "bc" is the only known word
+    ngrams = {1: {tuple(): {"bc": -0.1, "</s>": -0.1}}}
+    lm = BackoffNgramLM(ngrams, {})
+    searcher = CTCPrefixBeamSearcher(
+        blank_index=0, vocab_list=vocab_list, lm=lm, lm_weight=1.0,
+    )
+    assert searcher(probs.log(), lens) == [[2, 3]]
+
+    # Token-level LM: prefers "c" everywhere
+    ngrams = {1: {tuple(): {"▁a": -3.0, "▁b": -3.0, "c": -0.1, "</s>": -0.1}}}
+    lm = BackoffNgramLM(ngrams, {})
+    searcher = CTCPrefixBeamSearcher(
+        blank_index=0,
+        vocab_list=vocab_list,
+        lm=lm,
+        lm_weight=1.0,
+        lm_mode="token",
+    )
+    assert searcher(probs.log(), lens) == [[3, 3]]
+
+    # The compiled LM gives the same beams, with batched queries only
+    ngrams = {
+        1: {tuple(): {"a": -1.0, "b": -0.5, "c": -2.0, "</s>": -1.0}},
+        2: {("<s>",): {"b": -0.1}, ("b",): {"a": -0.2, "</s>": -0.3}},
+    }
+    backoffs = {1: {("a",): -0.5, ("b",): -0.2}}
+    compiled = CompiledNgramLM.from_ngrams(ngrams, backoffs)
+    compiled.logprob = None
+    for lm_mode in ["word", "token"]:
+        beams = [
+            CTCPrefixBeamSearcher(
+                blank_index=0,
+                vocab_list=["<blank>", "▁a", "▁b", "c"],
+                lm=lm,
+                lm_weight=1.0,
+                lm_mode=lm_mode,
+            ).decode_beams(probs.log(), lens)[0]
+            for lm in [BackoffNgramLM(ngrams, backoffs), compiled]
+        ]
+        assert [p for p, _ in beams[0]] == [p for p, _ in beams[1]]
+        for (_, score), (_, compiled_score) in zip(*beams):
+            assert math.isclose(score, compiled_score, rel_tol=1e-5)
+
+    # A unigram LM without "</s>" on a long utterance: the contexts stay
+    # empty and the end of sentence gets unk_logprob
+    length = 3000
+    probs = torch.zeros(1, length, 4, device=device)
+    probs[0, 0::2, 3] = 1.0
+    probs[0, 1::2, 0] = 1.0
+    ngrams = {1: {tuple(): {"c": -0.1}}}
+    searcher = CTCPrefixBeamSearcher(
+        blank_index=0,
+        vocab_list=vocab_list,
+        lm=BackoffNgramLM(ngrams, {}),
+        lm_weight=1.0,
+        lm_mode="token",
+        unk_logprob=-5.0,
+    )
+    prefix, score = searcher.decode_beams(probs.log(), lens)[0][0]
+    assert prefix == [3] * (length // 2)
+    assert math.isclose(score, -0.1 * math.log(10) * length / 2 - 5.0)
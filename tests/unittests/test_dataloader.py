@@ -85,3 +85,46 @@ def test_looped_loader(tmpdir):
     next(new_data_iterator)
     with pytest.raises(StopIteration):
         next(new_data_iterator)
+
+
+def test_device_prefetcher(device):
+    from speechbrain.dataio.batch import PaddedBatch
+    from speechbrain.dataio.dataloader import DevicePrefetcher
+
+    examples = [{"id": str(i), "x": torch.ones(i + 1) * i} for i in range(6)]
+    loader = [PaddedBatch(examples[i : i + 2]) for i in range(0, 6, 2)]
+    loader += [(torch.ones(2), {"y": torch.zeros(3)})]
+    prefetcher = DevicePrefetcher(loader, device, num_prefetch=2)
+    assert len(prefetcher) == 4
+    for _ in range(2):
+        batches = list(prefetcher)
+        assert len(batches) == 4
+        for batch, ref in zip(batches[:3], loader):
+            assert batch.id == ref.id
+            assert batch.x.data.device.type == torch.device(device).type
+            assert torch.equal(batch.x.data.cpu(), ref.x.data)
+        assert batches[3][1]["y"].device.type == torch.device(device).type
+
+    # Plain containers with string ids, tuples stay tuples
+    loader = [
+        {"id": ["u1", "u2"], "wav": torch.ones(2, 3)},
+        (torch.ones(1), ("u3", torch.zeros(2))),
+    ]
+    batches = list(DevicePrefetcher(loader, device))
+    assert batches[0]["id"] == ["u1", "u2"]
+    assert batches[0]["wav"].device.type == torch.device(device).type
+    assert isinstance(batches[1], tuple) and isinstance(batches[1][1], tuple)
+    assert batches[1][1][0] == "u3"
+    assert batches[1][1][1].device.type == torch.device(device).type
+
+    # Stopping early does not hang, errors are passed on
+    for batch in prefetcher:
+        break
+
+    def failing():
+        yield torch.ones(1)
+        raise RuntimeError("broken loader")
+
+    prefetcher = DevicePrefetcher(failing(), device)
+    with pytest.raises(RuntimeError, match="broken loader"):
+        list(prefetcher)
@@ -86,3 +86,86 @@ def test_filtered_sorted_dynamic_item_dataset():
         key_max_value={"foo": 1}, sort_key="foo", reverse=True
     )
     assert subset[0]["id"] == "utt2"
+
+
+def test_cached_dynamic_items(tmpdir):
+    from speechbrain.dataio.dataset import DynamicItemDataset
+    from speechbrain.dataio.cache import DiskCache
+    import torch
+
+    data = {
+        "utt1": {"foo": 1, "text": "hello world"},
+        "utt2": {"foo": 1, "text": "how are you world"},
+    }
+    calls = []
+
+    def feats(foo):
+        calls.append(foo)
+        return torch.full((1000,), float(foo)), foo + 1
+
+    dataset = DynamicItemDataset(data, output_keys=["id", "feats", "bar"])
+    dataset.add_dynamic_item(feats, "foo", ["feats", "bar"])
+    dataset.add_dynamic_item(lambda x: x.split(), "text", "words")
+    expected = [dataset[i] for i in range(len(dataset))]
+    calls.clear()
+
+    cache = DiskCache(tmpdir, num_shards=2)
+    dataset.cache_dynamic_items(["feats"], cache)
+    for epoch in range(3):
+        for i, data_point in enumerate(dataset):
+            assert torch.equal(data_point["feats"], expected[i]["feats"])
+            assert data_point["bar"] == expected[i]["bar"]
+    # Same inputs, but different data ids are cached separately
+    assert calls == [1, 1]
+    # The cache is picked up by a new dataset (e.g. in the next run)
+    calls.clear()
+    subset = dataset.filtered_sorted(sort_key="words", reverse=True)
+    assert subset[1]["id"] == "utt1"
+    assert calls == []
+    # Bumping the version invalidates the cache
+    data = {"utt1": {"foo": 1, "text": "hello world"}}
+    dataset = DynamicItemDataset(data, output_keys=["feats"])
+    dataset.add_dynamic_item(feats, "foo", ["feats", "bar"])
+    dataset.cache_dynamic_items("feats", cache, version="v2")
+    dataset[0]
+    assert calls == [1]
+
+    # The entries are appended to a few segment files (and their index)
+    for shard in range(2):
+        assert len(tmpdir.join(f"shard{shard:03d}").listdir()) <= 3
+    # Entries written by another process are found
+    other = DiskCache(tmpdir, num_shards=2)
+    assert "new" not in other
+    cache["new"] = torch.ones(3)
+    assert "new" in other
+    assert torch.equal(other["new"], torch.ones(3))
+    # Corrupted entries are misses
+    path = tmpdir / "shard{:03d}".format(cache._shard("new")) / "00000000.bin"
+    data = bytearray(path.read_binary())
+    data[-1] ^= 0xFF
+    path.write_binary(bytes(data))
+    other = DiskCache(tmpdir, num_shards=2)
+    assert other.get("new") is None
+
+    # Least recently used entries are evicted
+    for one_file_per_entry in [False, True]:
+        cache = DiskCache(
+            tmpdir / str(one_file_per_entry),
+            num_shards=1,
+            one_file_per_entry=one_file_per_entry,
+        )
+        cache["key0"] = torch.zeros(1000)
+        entry_size = cache.size()
+        max_size_mb = 2.5 * entry_size / 2 ** 20
+        cache = DiskCache(
+            tmpdir / str(one_file_per_entry),
+            max_size_mb=max_size_mb,
+            num_shards=1,
+            one_file_per_entry=one_file_per_entry,
+        )
+        for i in range(1, 4):
+            cache[f"key{i}"] = torch.zeros(1000)
+            cache["key0"]
+        assert "key0" in cache and "key3" in cache
+        assert "key1" not in cache and "key2" not in cache
+        assert cache.size() <= 2 * entry_size
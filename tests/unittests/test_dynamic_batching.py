@@ -0,0 +1,67 @@
+import torch
+
+
+def test_dynamic_batcher():
+    import asyncio
+    import threading
+    from speechbrain.pretrained.batching import DynamicBatcher
+
+    batches = []
+
+    def batch_fn(wavs, wav_lens):
+        batches.append(wavs.shape[0])
+        abs_lens = (wav_lens * wavs.shape[1]).round().long()
+        return wavs.sum(dim=1), abs_lens.tolist()
+
+    # Concurrent callers get their own outputs
+    with DynamicBatcher(batch_fn, max_batch_size=4, max_wait=0.1) as batcher:
+        outputs = {}
+
+        def caller(i):
+            outputs[i] = batcher(torch.full((i + 1,), float(i)))
+
+        threads = [
+            threading.Thread(target=caller, args=(i,)) for i in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    for i in range(10):
+        total, length = outputs[i]
+        assert length == i + 1
+        assert total.item() == i * (i + 1)
+    assert max(batches) == 4 and sum(batches) == 10
+    stats = batcher.stats()
+    assert stats["num_requests"] == 10
+    assert stats["num_batches"] == len(batches)
+    assert 0 <= stats["p50_queue_time"] <= stats["p99_queue_time"]
+
+    # The oldest request is batched with those of the closest lengths
+    batcher = DynamicBatcher(batch_fn, max_batch_size=2, max_wait=10)
+    with batcher._condition:
+        futures = [
+            batcher.submit(torch.ones(length)) for length in [5, 100, 6, 99]
+        ]
+    assert futures[0].result()[1] == 5 and futures[2].result()[1] == 6
+    assert futures[1].result()[1] == 100 and futures[3].result()[1] == 99
+    assert batcher.stats()["mean_padding"] < 0.1
+    batcher.close()
+
+    # Methods without lengths, errors and asyncio
+    def failing_fn(wavs):
+        if wavs.shape[1] > 3:
+            raise ValueError("too long")
+        return wavs * 2
+
+    async def main(batcher):
+        return await asyncio.gather(
+            batcher.submit_async(torch.ones(2)),
+            batcher.submit_async(torch.ones(3)),
+        )
+
+    with DynamicBatcher(failing_fn, max_wait=0.05) as batcher:
+        first, second = asyncio.run(main(batcher))
+        assert torch.equal(first, torch.tensor([2.0, 2.0, 0.0]))
+        error = batcher.submit(torch.ones(5)).exception()
+        assert isinstance(error, ValueError)
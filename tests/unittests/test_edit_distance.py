@@ -60,3 +60,42 @@ def test_count_ops():
     assert count_ops(table)["insertions"] == 0
     assert count_ops(table)["deletions"] == 0
     assert count_ops(table)["substitutions"] == 1
+
+
+def test_batch_op_counts(monkeypatch):
+    import random
+    import torch
+    from speechbrain.utils import edit_distance
+    from speechbrain.utils.edit_distance import (
+        alignment,
+        batch_op_counts,
+        count_ops,
+        op_table,
+    )
+
+    random.seed(1)
+    # Small vocabularies give many ties
+    refs, hyps = [], []
+    for _ in range(200):
+        refs.append([random.randrange(3) for _ in range(random.randint(0, 9))])
+        hyps.append([random.randrange(3) for _ in range(random.randint(0, 9))])
+    # Also in small chunks
+    for max_cells in [2 ** 22, 30]:
+        monkeypatch.setattr(edit_distance, "MAX_BATCH_CELLS", max_cells)
+        counts, tables = batch_op_counts(refs, hyps, return_tables=True)
+        for ref, hyp, ops, table in zip(refs, hyps, counts, tables):
+            expected_table = op_table(ref, hyp)
+            assert table.tolist() == expected_table
+            assert alignment(table) == alignment(expected_table)
+            expected = count_ops(expected_table)
+            assert ops.tolist() == [
+                expected["insertions"],
+                expected["deletions"],
+                expected["substitutions"],
+            ]
+
+    # Tensors are compared by value, unhashable tokens one by one
+    counts = batch_op_counts(
+        [torch.tensor([1, 2, 3]), [[1], [2]]], [torch.tensor([1, 3]), [[2]]]
+    )
+    assert counts.tolist() == [[0, 1, 0], [0, 1, 0]]
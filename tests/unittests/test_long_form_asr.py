@@ -0,0 +1,84 @@
+import torch
+
+
+class _OracleEncoder(torch.nn.Module):
+    """Reads the token index of each 10 ms frame from the signal value."""
+
+    def __init__(self, num_tokens):
+        super().__init__()
+        self.num_tokens = num_tokens
+
+    def forward(self, wavs, wav_lens):
+        frames = wavs.unfold(1, 160, 160).mean(-1)
+        tokens = (frames * 10).round().long().clamp(0, self.num_tokens - 1)
+        logits = torch.nn.functional.one_hot(tokens, self.num_tokens)
+        return torch.log_softmax(logits.float() * 10, dim=-1)
+
+
+class _FixedVAD:
+    """Returns fixed speech segments (in seconds) for any file."""
+
+    def __init__(self, segments):
+        self.segments = segments
+
+    def get_speech_segments(self, path):
+        return torch.tensor(self.segments)
+
+
+def test_transcribe_long_files(tmpdir, monkeypatch):
+    import functools
+    from speechbrain.dataio.dataio import write_audio
+    from speechbrain.dataio.encoder import CTCTextEncoder
+    from speechbrain.decoders.ctc import ctc_greedy_decode
+    from speechbrain.pretrained.interfaces import EncoderASR
+
+    tokenizer = CTCTextEncoder()
+    tokenizer.add_blank()
+    tokenizer.update_from_iterable("abcdefgh")
+    asr = EncoderASR(
+        modules={"encoder": _OracleEncoder(len(tokenizer))},
+        hparams={
+            "tokenizer": tokenizer,
+            "decoding_function": functools.partial(
+                ctc_greedy_decode, blank_id=tokenizer.get_blank_index()
+            ),
+        },
+    )
+
+    # Each character lasts 3 frames, followed by 2 blank frames
+    generator = torch.Generator().manual_seed(0)
+    paths, texts = [], []
+    for i, num_chars in enumerate([200, 37, 3]):
+        indices = torch.randint(1, 9, (num_chars,), generator=generator)
+        blanks = torch.zeros_like(indices)
+        frames = torch.stack([indices] * 3 + [blanks] * 2, dim=1).flatten()
+        signal = (frames.float() / 10).repeat_interleave(160)
+        paths.append(str(tmpdir / f"long{i}.wav"))
+        write_audio(paths[-1], signal, 16000)
+        texts.append("".join(tokenizer.decode_ndim(indices.tolist())))
+
+    # Windows are transcribed separately, but the stitched output is the
+    # same as for the whole file
+    transcriptions = asr.transcribe_long_files(
+        paths, window_size=1.0, overlap=0.3, batch_size=3, num_workers=2
+    )
+    assert list(transcriptions) == paths
+    # (transcribe_file fetches the files into the working directory)
+    monkeypatch.chdir(tmpdir)
+    for path, text in zip(paths, texts):
+        assert transcriptions[path] == text
+        assert asr.transcribe_file(path) == text
+    assert (
+        asr.transcribe_long_file(paths[0], window_size=2.5, overlap=0.5)
+        == texts[0]
+    )
+
+    # With a VAD, only the speech segments are transcribed (each character
+    # lasts 50 ms), the longer ones in several windows
+    vad = _FixedVAD([[0.0, 2.5], [4.0, 7.0]])
+    assert (
+        asr.transcribe_long_file(
+            paths[0], window_size=1.0, overlap=0.3, vad=vad
+        )
+        == texts[0][:50] + " " + texts[0][80:140]
+    )
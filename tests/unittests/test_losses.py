@@ -152,6 +152,62 @@ def test_transducer_loss(device):
     assert out_cost.item() == 2.247833251953125
 
 
+def test_transducer_loss_torch(device):
+    from speechbrain.nnet.losses import transducer_loss
+    from speechbrain.nnet.loss.transducer_loss import TransducerLoss
+
+    # Same value as the CUDA kernels (see test_transducer_loss)
+    logits = torch.Tensor(
+        [
+            [
+                [
+                    [0.1, 0.6, 0.1, 0.1, 0.1],
+                    [0.1, 0.1, 0.6, 0.1, 0.1],
+                    [0.1, 0.1, 0.2, 0.8, 0.1],
+                ],
+                [
+                    [0.1, 0.6, 0.1, 0.1, 0.1],
+                    [0.1, 0.1, 0.2, 0.1, 0.1],
+                    [0.7, 0.1, 0.2, 0.1, 0.1],
+                ],
+            ]
+        ]
+    ).to(device)
+    for fused in [False, True]:
+        out_cost = transducer_loss(
+            logits.log_softmax(dim=-1),
+            torch.Tensor([[1, 2]]).to(device).int(),
+            torch.Tensor([1.0]).to(device),
+            torch.Tensor([1.0]).to(device),
+            blank_index=0,
+            use_torchaudio=False,
+            fused=fused,
+        )
+        assert out_cost.item() == pytest.approx(2.247833251953125)
+
+    # Variable lengths: same as torchaudio (not normalized over time), and
+    # same gradients with and without fusion
+    torchaudio_functional = pytest.importorskip("torchaudio.functional")
+    torch.manual_seed(0)
+    logits = torch.randn(4, 12, 6, 8, device=device)
+    labels = torch.randint(1, 8, (4, 5), device=device).int()
+    T = torch.tensor([12, 9, 5, 12], device=device).int()
+    U = torch.tensor([5, 3, 5, 0], device=device).int()
+    expected = torchaudio_functional.rnnt_loss(
+        logits, labels, T, U, blank=0, reduction="none"
+    )
+    grads = []
+    for fused in [False, True]:
+        logits.requires_grad_()
+        loss = TransducerLoss(blank=0, reduction="none", fused=fused)
+        out_cost = loss(logits, labels, T, U)
+        assert torch.allclose(out_cost * T, expected, atol=1e-4)
+        out_cost.sum().backward()
+        grads.append(logits.grad)
+        logits = logits.detach()
+    assert torch.allclose(grads[0], grads[1], atol=1e-6)
+
+
 def test_guided_attention_loss_mask(device):
     from speechbrain.nnet.loss.guidedattn_loss import GuidedAttentionLoss
 
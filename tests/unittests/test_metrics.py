@@ -198,3 +198,66 @@ Target: C
   -> B: 1 / 1 (100.00%)
 """
     assert report == ref_report
+
+
+def test_parallel_evaluation():
+    import math
+    import pytest
+    import time
+    from speechbrain.utils.metric_stats import (
+        ErrorRateStats,
+        MetricStats,
+        parallel_map,
+    )
+
+    def metric(predict, target):
+        if predict.sum() < 0:
+            raise ValueError("negative prediction")
+        if predict.sum() > 100:
+            time.sleep(10)
+        return float((predict - target).abs().mean())
+
+    predict = torch.rand(10, 5)
+    target = torch.rand(10, 5)
+    stats = MetricStats(metric=metric, n_jobs=2, batch_eval=False)
+    stats.append(ids=list("abcdefghij"), predict=predict, target=target)
+    expected = [metric(p, t) for p, t in zip(predict, target)]
+    assert stats.scores == expected
+
+    wer_stats = ErrorRateStats(n_jobs=2)
+    wer_stats.append(
+        ids=["utt1", "utt2", "utt3"],
+        predict=[[1, 2], [3], [4, 5]],
+        target=[[1, 3], [3], [4]],
+    )
+    assert [score["key"] for score in wer_stats.scores] == [
+        "utt1",
+        "utt2",
+        "utt3",
+    ]
+    assert wer_stats.summarize("num_edits") == 2
+
+    # Failures are reported per item, the results stay in order
+    predict[3] = -1.0
+    stats.clear()
+    stats.append(ids=list("abcdefghij"), predict=predict, target=target)
+    assert math.isnan(stats.scores[3])
+    assert stats.scores[:3] == expected[:3] and stats.scores[4:] == expected[4:]
+    stats = MetricStats(
+        metric=metric, n_jobs=2, batch_eval=False, ignore_failures=False
+    )
+    with pytest.raises(RuntimeError, match="d: ValueError: negative"):
+        stats.append(ids=list("abcdefghij"), predict=predict, target=target)
+    predict[5] = 200.0
+    items = list(zip(predict, target))
+    results = parallel_map(
+        metric,
+        items,
+        n_jobs=2,
+        chunk_size=1,
+        timeout=1,
+        max_retries=0,
+        ignore_failures=True,
+    )
+    assert results[3] is None and results[5] is None
+    assert results[:3] == expected[:3] and results[6:] == expected[6:]
@@ -24,3 +24,91 @@ def test_backofff_ngram_lm():
     assert lm.logprob("c", ()) == float("-inf")
     # OOV in context:
     assert lm.logprob("a", ("c",)) == HALF
+
+
+def test_compiled_ngram_lm(tmpdir):
+    from speechbrain.lm.ngram import BackoffNgramLM, CompiledNgramLM
+    import itertools
+    import random
+    import numpy as np
+
+    random.seed(1)
+    words = ["<s>", "</s>", "a", "b", "c", "d"]
+    ngrams = {1: {tuple(): {w: -random.random() for w in words[1:]}}}
+    backoffs = {}
+    for order in [2, 3]:
+        ngrams[order] = {}
+        backoffs[order - 1] = {}
+        for context in itertools.product(words, repeat=order - 1):
+            if random.random() < 0.5:
+                dist = {
+                    w: -random.random() for w in words if random.random() < 0.5
+                }
+                if dist:
+                    ngrams[order][context] = dist
+            if random.random() < 0.5:
+                backoffs[order - 1][context] = -random.random()
+    lm = BackoffNgramLM(ngrams, backoffs)
+    compiled = CompiledNgramLM.from_ngrams(ngrams, backoffs)
+
+    queries = [
+        (token, context)
+        for length in range(4)
+        for context in itertools.product(words + ["oov"], repeat=length)
+        for token in words + ["oov"]
+    ]
+    expected = np.array([lm.logprob(t, c) for t, c in queries])
+    tokens, contexts = zip(*queries)
+    result = compiled.batch_logprob(tokens, contexts)
+    assert np.allclose(result, expected, atol=1e-5)
+    assert np.array_equal(np.isinf(result), np.isinf(expected))
+    assert np.isclose(
+        compiled.logprob("a", ("b", "c")), lm.logprob("a", ("b", "c"))
+    )
+
+    # Serialization and memory-mapped loading
+    path = tmpdir / "lm.bin"
+    compiled.save(path)
+    for mmap in [True, False]:
+        loaded = CompiledNgramLM.load(path, mmap=mmap)
+        assert loaded.vocab == compiled.vocab
+        assert np.array_equal(loaded.batch_logprob(tokens, contexts), result)
+    # Integer ids as input
+    ids = loaded.word_ids(tokens)
+    context_ids = np.stack(
+        [
+            np.pad(loaded.word_ids(c), (3 - len(c), 0), constant_values=-1)
+            for c in contexts
+        ]
+    )
+    assert np.array_equal(loaded.batch_logprob(ids, context_ids), result)
+
+    # Compiled straight from an ARPA file (the backoff weights need an
+    # N-gram with a probability there)
+    from speechbrain.lm.arpa import read_arpa
+
+    lines = ["\\data\\"]
+    sections = []
+    for order, dists in ngrams.items():
+        section = []
+        for context, dist in dists.items():
+            for token, logprob in dist.items():
+                ngram = context + (token,)
+                line = f"{logprob} {' '.join(ngram)}"
+                if ngram in backoffs.get(order, {}):
+                    line += f" {backoffs[order][ngram]}"
+                section.append(line)
+        lines.append(f"ngram {order}={len(section)}")
+        sections.extend(["", f"\\{order}-grams:"] + section)
+    lines.extend(sections + ["", "\\end\\"])
+    path = tmpdir / "lm.arpa"
+    path.write_text("\n".join(lines), encoding="utf-8")
+    with open(path) as fin:
+        _, arpa_ngrams, arpa_backoffs = read_arpa(fin)
+    arpa_lm = BackoffNgramLM(arpa_ngrams, arpa_backoffs)
+    with open(path) as fin:
+        compiled = CompiledNgramLM.from_arpa(fin)
+    expected = np.array([arpa_lm.logprob(t, c) for t, c in queries])
+    result = compiled.batch_logprob(tokens, contexts)
+    assert np.allclose(result, expected, atol=1e-5)
+    assert np.array_equal(np.isinf(result), np.isinf(expected))
@@ -46,3 +46,144 @@ def test_ConcatDatasetBatchSampler(device):
     non_cat_data = [x[:minlen] for x in non_cat_data]
     non_cat_data = np.array(non_cat_data)
     np.testing.assert_array_equal(non_cat_data.T, concat_data)
+
+
+def test_DynamicBatchSampler(tmpdir):
+    from speechbrain.dataio.dataset import DynamicItemDataset
+    from speechbrain.dataio.sampler import DynamicBatchSampler
+    import numpy as np
+    import json
+
+    rng = np.random.RandomState(0)
+    data = {
+        f"utt{i}": {"duration": float(d)}
+        for i, d in enumerate(rng.rand(200) * 20)
+    }
+    manifest = tmpdir / "data.json"
+    with open(manifest, "w") as fo:
+        json.dump(data, fo)
+    dataset = DynamicItemDataset.from_json(manifest)
+
+    def reference_batches(sampler, order):
+        # Example by example bucket filling
+        batches = []
+        buckets = [[] for _ in sampler._bucket_lens]
+        for idx in order:
+            length = data[f"utt{idx}"]["duration"]
+            bucket_id = np.searchsorted(sampler._bucket_boundaries, length)
+            buckets[bucket_id].append(idx)
+            if len(buckets[bucket_id]) >= min(
+                sampler._bucket_lens[bucket_id], sampler._max_batch_ex
+            ):
+                batches.append(buckets[bucket_id])
+                buckets[bucket_id] = []
+        return batches + [bucket for bucket in buckets if bucket]
+
+    sampler = DynamicBatchSampler(
+        dataset,
+        60,
+        num_buckets=5,
+        shuffle=False,
+        batch_ordering="ascending",
+        max_batch_ex=8,
+        lengths_cache=True,
+    )
+    expected = reference_batches(sampler, range(len(dataset)))
+    expected = sorted(
+        expected, key=lambda b: max(data[f"utt{i}"]["duration"] for i in b)
+    )
+    assert list(sampler) == expected
+    assert sorted(i for batch in sampler for i in batch) == list(range(200))
+    assert (tmpdir / "data.json.lengths.npz").exists()
+
+    # Lengths are loaded from the cache
+    sampler = DynamicBatchSampler(
+        dataset,
+        60,
+        num_buckets=5,
+        length_func=lambda x: x["duration"],
+        lengths_cache=True,
+    )
+    with np.load(str(tmpdir / "data.json.lengths.npz")) as cached:
+        assert np.array_equal(sampler._ex_lengths, cached["lengths"])
+
+    # Same batches every time for an epoch
+    batches = []
+    for epoch in [1, 2, 1]:
+        sampler.set_epoch(epoch)
+        batches.append(list(sampler))
+    assert batches[0] == batches[2] and batches[0] != batches[1]
+
+
+def test_PaddingAwareBatchSampler():
+    from speechbrain.dataio.sampler import (
+        PaddingAwareBatchSampler,
+        DistributedSamplerWrapper,
+    )
+    import numpy as np
+
+    rng = np.random.RandomState(0)
+    lengths = rng.randint(1, 50, 500)
+    targets = rng.randint(1, 20, 500)
+    sampler = PaddingAwareBatchSampler(
+        None,
+        max_padded_length=200,
+        lengths_list=lengths,
+        max_padded_target_length=100,
+        target_lengths_list=targets,
+        window_size=100,
+        max_batch_ex=16,
+    )
+    batches = list(sampler)
+    assert sorted(i for batch in batches for i in batch) == list(range(500))
+    for batch in batches:
+        assert len(batch) <= 16
+        assert len(batch) * lengths[batch].max() <= 200
+        assert len(batch) * targets[batch].max() <= 100
+    stats = sampler.padding_stats()
+    padded = sum(len(b) * lengths[b].max() for b in batches)
+    assert stats["padded_length"] == padded
+    assert stats["padding_ratio"] == 1 - lengths.sum() / padded
+
+    # Reproducible for an epoch
+    epochs = []
+    for epoch in [1, 2, 1]:
+        sampler.set_epoch(epoch)
+        epochs.append(list(sampler))
+    assert epochs[0] == epochs[2] and epochs[0] != epochs[1]
+
+    # Each process gets different batches
+    sampler.set_epoch(1)
+    ddp_batches = []
+    for rank in range(2):
+        wrapper = DistributedSamplerWrapper(
+            sampler, num_replicas=2, rank=rank, shuffle=False
+        )
+        wrapper.set_epoch(1)
+        ddp_batches.extend(wrapper)
+    assert sorted(map(tuple, ddp_batches[: len(epochs[0])])) == sorted(
+        map(tuple, epochs[0])
+    )
+
+    # The number of batches changes with the epoch, the wrappers follow it
+    sampler.set_epoch(14)
+    wrappers = [
+        DistributedSamplerWrapper(
+            sampler, num_replicas=2, rank=rank, shuffle=False
+        )
+        for rank in range(2)
+    ]
+    num_batches = set()
+    for epoch in range(15, 21):
+        for wrapper in wrappers:
+            wrapper.set_epoch(epoch)
+        expected = list(map(tuple, sampler))
+        num_batches.add(len(expected))
+        ddp_batches = []
+        for wrapper in wrappers:
+            batches = list(wrapper)
+            assert len(batches) == len(wrapper)
+            ddp_batches.extend(map(tuple, batches))
+        assert set(ddp_batches) == set(expected)
+        assert len(ddp_batches) - len(expected) <= 1
+    assert len(num_batches) > 1
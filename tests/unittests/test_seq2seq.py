@@ -0,0 +1,110 @@
+import torch
+
+
+def test_transformer_beam_search_kv_cache(device):
+
+    from speechbrain.lobes.models.transformer.TransformerASR import (
+        TransformerASR,
+    )
+    from speechbrain.nnet.linear import Linear
+    from speechbrain.decoders.seq2seq import S2STransformerBeamSearch
+
+    torch.manual_seed(0)
+    for normalize_before in [True, False]:
+        net = TransformerASR(
+            12, 16, 32, 4, 1, 2, 64, normalize_before=normalize_before
+        ).to(device)
+        net.eval()
+        fc = Linear(input_size=32, n_neurons=12).to(device)
+        ctc_fc = Linear(input_size=32, n_neurons=12).to(device)
+        enc_states = net.encode(torch.rand(3, 20, 16, device=device))
+        wav_lens = torch.ones(3, device=device)
+
+        outputs = []
+        for use_kv_cache in [False, True]:
+            searcher = S2STransformerBeamSearch(
+                [net, fc, ctc_fc],
+                bos_index=1,
+                eos_index=2,
+                min_decode_ratio=0.0,
+                max_decode_ratio=1.0,
+                beam_size=4,
+                using_eos_threshold=False,
+                use_kv_cache=use_kv_cache,
+            )
+            with torch.no_grad():
+                outputs.append(searcher(enc_states, wav_lens))
+
+        assert outputs[0][0] == outputs[1][0]
+        assert torch.allclose(outputs[0][1], outputs[1][1], atol=1e-4)
+
+
+def test_transformer_lm_forward_step(device):
+
+    from speechbrain.lobes.models.transformer.TransformerLM import TransformerLM
+
+    torch.manual_seed(0)
+    for normalize_before in [True, False]:
+        lm = TransformerLM(
+            12, 32, 4, 2, 0, 64, normalize_before=normalize_before
+        ).to(device)
+        lm.eval()
+        # includes the pad index (0), which is masked in the keys
+        tokens = torch.randint(0, 12, (4, 6), device=device)
+        tokens[:, 0] = 1
+
+        cache = None
+        with torch.no_grad():
+            full_logits = lm(tokens)
+            for t in range(tokens.shape[1]):
+                logits, cache = lm.forward_step(tokens[:, t], cache)
+                assert torch.allclose(logits, full_logits[:, t], atol=1e-4)
+
+
+def test_transformer_beam_search_lm_cache(device):
+
+    from speechbrain.lobes.models.transformer.TransformerASR import (
+        TransformerASR,
+    )
+    from speechbrain.lobes.models.transformer.TransformerLM import TransformerLM
+    from speechbrain.nnet.linear import Linear
+    from speechbrain.decoders.seq2seq import S2STransformerBeamSearch
+
+    class FullHistoryLM(torch.nn.Module):
+        """Hides forward_step to use the full history path."""
+
+        def __init__(self, lm):
+            super().__init__()
+            self.lm = lm
+
+        def forward(self, x):
+            return self.lm(x)
+
+    torch.manual_seed(0)
+    net = TransformerASR(12, 16, 32, 4, 1, 2, 64).to(device)
+    net.eval()
+    fc = Linear(input_size=32, n_neurons=12).to(device)
+    ctc_fc = Linear(input_size=32, n_neurons=12).to(device)
+    lm = TransformerLM(12, 32, 4, 2, 0, 64).to(device)
+    lm.eval()
+    enc_states = net.encode(torch.rand(3, 20, 16, device=device))
+    wav_lens = torch.ones(3, device=device)
+
+    outputs = []
+    for lm_modules in [FullHistoryLM(lm), lm]:
+        searcher = S2STransformerBeamSearch(
+            [net, fc, ctc_fc],
+            bos_index=1,
+            eos_index=2,
+            min_decode_ratio=0.0,
+            max_decode_ratio=1.0,
+            beam_size=4,
+            using_eos_threshold=False,
+            lm_weight=0.5,
+            lm_modules=lm_modules,
+        )
+        with torch.no_grad():
+            outputs.append(searcher(enc_states, wav_lens))
+
+    assert outputs[0][0] == outputs[1][0]
+    assert torch.allclose(outputs[0][1], outputs[1][1], atol=1e-4)
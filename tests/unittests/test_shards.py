@@ -0,0 +1,82 @@
+import torch
+
+
+def test_sharded_dataset(tmpdir, monkeypatch):
+    from speechbrain.dataio.dataio import read_audio, write_audio
+    from speechbrain.dataio.dataloader import make_dataloader
+    from speechbrain.dataio import shards
+    from speechbrain.dataio.shards import (
+        ShardedDynamicItemDataset,
+        write_shards,
+    )
+
+    data = {}
+    signals = {}
+    for i in range(23):
+        path = str(tmpdir / f"utt{i}.wav")
+        signals[f"utt{i}"] = torch.rand(200 + i) * 0.5
+        write_audio(path, signals[f"utt{i}"], 16000)
+        data[f"utt{i}"] = {"wav": path, "length": 200 + i}
+    # A segment of a file is stored on its own
+    data["seg"] = {"wav": {"file": path, "start": 10, "stop": 50}, "length": 40}
+    signals["seg"] = signals["utt22"][10:50]
+
+    index = write_shards(
+        data, tmpdir / "shards", ["wav"], shuffle=True, max_items=3
+    )
+    assert index["num_items"] == 24
+    assert len(index["shards"]) == 8
+
+    dataset = ShardedDynamicItemDataset(
+        tmpdir / "shards",
+        dynamic_items=[{"func": read_audio, "takes": "wav", "provides": "sig"}],
+        output_keys=["id", "sig", "length"],
+    )
+    seen = [data_point["id"] for data_point in dataset]
+    assert sorted(seen) == sorted(data)
+    for data_point in dataset:
+        assert data_point["sig"].shape[0] == data_point["length"]
+        assert torch.allclose(
+            data_point["sig"], signals[data_point["id"]], atol=1e-4
+        )
+
+    # Shuffling changes the order every epoch, but not the data
+    dataset.shuffle_shards = True
+    dataset.shuffle_buffer = 5
+    orders = []
+    for epoch in range(2):
+        dataset.set_epoch(epoch)
+        orders.append([data_point["id"] for data_point in dataset])
+        assert sorted(orders[-1]) == sorted(seen)
+    assert orders[0] != orders[1] and orders[0] != seen
+
+    # DataLoader workers read disjoint shards
+    loader = make_dataloader(dataset, batch_size=2, num_workers=2)
+    batch_ids = [data_id for batch in loader for data_id in batch.id]
+    assert sorted(batch_ids) == sorted(seen)
+
+    # DDP processes read disjoint shards, the same number of them
+    rank_ids = []
+    for rank in range(3):
+        monkeypatch.setattr(
+            shards, "_get_rank_and_world_size", lambda: (rank, 3)
+        )
+        rank_shards = dataset.get_shards()
+        assert len(rank_shards) == 2
+        rank_ids.extend(data_point["id"] for data_point in dataset)
+    assert len(set(rank_ids)) == len(rank_ids) == 18
+
+    # Without shuffling, different shards are dropped every epoch
+    dataset.shuffle_shards = False
+    read_shards = set()
+    for epoch in range(4):
+        dataset.set_epoch(epoch)
+        epoch_shards = []
+        for rank in range(3):
+            monkeypatch.setattr(
+                shards, "_get_rank_and_world_size", lambda: (rank, 3)
+            )
+            epoch_shards.extend(dataset.get_shards())
+        assert len(set(epoch_shards)) == len(epoch_shards) == 6
+        read_shards.update(epoch_shards)
+    assert len(read_shards) == 8
@@ -0,0 +1,152 @@
+import torch
+
+
+def _searcher(rnn="GRU", **kwargs):
+    import speechbrain as sb
+    from speechbrain.decoders.transducer import TransducerBeamSearcher
+    from speechbrain.nnet.transducer.transducer_joint import Transducer_joint
+
+    emb = sb.nnet.embedding.Embedding(
+        num_embeddings=35, embedding_dim=3, consider_as_one_hot=True, blank_id=0
+    )
+    dec = getattr(sb.nnet.RNN, rnn)(
+        hidden_size=10, input_shape=(1, 40, 34), bidirectional=False
+    )
+    lin = sb.nnet.linear.Linear(input_shape=(1, 40, 10), n_neurons=35)
+    joint_network = sb.nnet.linear.Linear(
+        input_shape=(1, 1, 40, 35), n_neurons=35
+    )
+    # Make blanks frequent enough to have a mix of blanks and symbols
+    with torch.no_grad():
+        lin.w.bias[0] += 4
+    return TransducerBeamSearcher(
+        decode_network_lst=[emb, dec],
+        tjoint=Transducer_joint(joint_network, joint="sum"),
+        classifier_network=[lin],
+        blank_id=0,
+        **kwargs,
+    )
+
+
+def _reference_greedy(searcher, tn_output, max_symbols):
+    """Greedy decoding of one utterance at a time."""
+    predictions = []
+    for utterance in tn_output:
+        prediction = []
+        input_PN = torch.zeros((1, 1), dtype=torch.long)
+        out_PN, hidden = searcher._forward_PN(
+            input_PN, searcher.decode_network_lst
+        )
+        for frame in utterance:
+            for _ in range(max_symbols):
+                log_probs = searcher._joint_forward_step(
+                    frame.view(1, 1, 1, -1), out_PN.unsqueeze(1)
+                )
+                token = log_probs.view(-1).argmax().item()
+                if token == searcher.blank_id:
+                    break
+                prediction.append(token)
+                input_PN[0, 0] = token
+                out_PN, hidden = searcher._forward_PN(
+                    input_PN, searcher.decode_network_lst, hidden
+                )
+        predictions.append(prediction)
+    return predictions
+
+
+def test_transducer_greedy_decode():
+    torch.manual_seed(0)
+    tn_output = torch.randn(6, 30, 10) * 3
+    for rnn in ["GRU", "LSTM"]:
+        for max_symbols in [1, 3]:
+            searcher = _searcher(
+                rnn, beam_size=1, max_symbols_per_step=max_symbols
+            )
+            hyps, scores, _, _ = searcher(tn_output)
+            assert hyps == _reference_greedy(searcher, tn_output, max_symbols)
+            assert any(len(hyp) > 0 for hyp in hyps)
+            assert 0 <= scores <= 1
+
+
+def _reference_modified_beam_search(searcher, tn_output, lm=None):
+    """Modified beam search of one utterance at a time, with the hyps in a
+    dict indexed by prediction."""
+    nbest = []
+    for utterance in tn_output:
+        start = torch.zeros((1, 1), dtype=torch.long)
+        state = searcher._forward_PN(start, searcher.decode_network_lst)
+        if lm is not None:
+            state += searcher._lm_forward_step(start, None)
+        hyps = {(): (torch.tensor(0.0), state)}
+        for frame in utterance:
+            candidates = []
+            for prediction, (score, state) in hyps.items():
+                log_probs = searcher._joint_forward_step(
+                    frame.view(1, 1, 1, -1), state[0].unsqueeze(1)
+                ).view(-1)
+                if lm is not None:
+                    lm_scores = searcher.lm_weight * state[2].view(-1)
+                    lm_scores[searcher.blank_id] = 0.0
+                    log_probs = log_probs + lm_scores
+                for token, logp in enumerate(log_probs):
+                    candidates.append((score + logp, prediction, token, state))
+            candidates.sort(key=lambda c: c[0].item(), reverse=True)
+            hyps = {}
+            for score, prediction, token, state in candidates[
+                : searcher.beam_size
+            ]:
+                if token != searcher.blank_id:
+                    prediction = prediction + (token,)
+                    inp = torch.tensor([[token]])
+                    new_state = searcher._forward_PN(
+                        inp, searcher.decode_network_lst, state[1]
+                    )
+                    if lm is not None:
+                        new_state += searcher._lm_forward_step(inp, state[3])
+                    state = new_state
+                if prediction in hyps:
+                    score = torch.logaddexp(score, hyps[prediction][0])
+                    state = hyps[prediction][1]
+                hyps[prediction] = (score, state)
+        nbest.append(
+            sorted(
+                hyps,
+                key=lambda p: hyps[p][0].item() / (len(p) + 1),
+                reverse=True,
+            )[: searcher.nbest]
+        )
+    return [[list(prediction) for prediction in utt] for utt in nbest]
+
+
+def test_transducer_modified_beam_search():
+    from speechbrain.lobes.models.RNNLM import RNNLM
+
+    torch.manual_seed(0)
+    tn_output = torch.randn(5, 20, 10) * 3
+    lm = RNNLM(
+        output_neurons=35, embedding_dim=8, rnn_neurons=16, return_hidden=True
+    )
+    lm.eval()
+    for rnn, lm_module, lm_weight in [
+        ("GRU", None, 0.0),
+        ("LSTM", None, 0.0),
+        ("GRU", lm, 0.5),
+    ]:
+        searcher = _searcher(
+            rnn,
+            beam_size=4,
+            nbest=3,
+            lm_module=lm_module,
+            lm_weight=lm_weight,
+            modified_beam_search=True,
+        )
+        hyps, scores, nbest_hyps, nbest_scores = searcher(tn_output)
+        reference = _reference_modified_beam_search(
+            searcher, tn_output, lm_module
+        )
+        assert nbest_hyps == reference
+        assert hyps == [nbest[0] for nbest in reference]
+        assert all(
+            utt_scores == sorted(utt_scores, reverse=True)
+            for utt_scores in nbest_scores
+        )
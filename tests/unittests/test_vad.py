@@ -0,0 +1,143 @@
+import torch
+
+
+def _tiny_vad(bidirectional):
+    from functools import partial
+    from speechbrain.lobes.features import Fbank
+    from speechbrain.lobes.models.CRDNN import CNN_Block
+    from speechbrain.nnet.containers import Sequential
+    from speechbrain.nnet.linear import Linear
+    from speechbrain.nnet.RNN import GRU
+    from speechbrain.pretrained import VAD
+    from speechbrain.processing.features import InputNormalization
+
+    torch.manual_seed(0)
+    cnn = Sequential(
+        partial(CNN_Block, channels=4, kernel_size=(3, 3)),
+        input_shape=[None, None, 8],
+    )
+    rnn = GRU(8, input_size=16, bidirectional=bidirectional)
+    dnn = Linear(1, input_size=16 if bidirectional else 8)
+    modules = {
+        "compute_features": Fbank(n_mels=8),
+        "mean_var_norm": InputNormalization(norm_type="sentence"),
+        "cnn": cnn,
+        "rnn": rnn,
+        "dnn": dnn,
+        "model": torch.nn.ModuleList([cnn, rnn, dnn]),
+    }
+    hparams = {"sample_rate": 16000, "time_resolution": 0.01, "device": "cpu"}
+    return VAD(modules, hparams)
+
+
+def _run_stream(stream, signal, frame_sizes):
+    segments, start, i = [], 0, 0
+    while start < signal.shape[0]:
+        size = frame_sizes[i % len(frame_sizes)]
+        segments.append(stream.process(signal[start : start + size]))
+        start, i = start + size, i + 1
+    segments.append(stream.finalize())
+    return torch.cat(segments)
+
+
+def test_streaming_vad(monkeypatch):
+    from speechbrain.pretrained.interfaces import StreamingVAD
+
+    torch.manual_seed(1)
+    signal = torch.randn(16000 * 12) * 0.1
+
+    # Any frame size gives the same probabilities and segments
+    for bidirectional in [False, True]:
+        vad = _tiny_vad(bidirectional)
+        stream = StreamingVAD(vad, activation_th=0.56, deactivation_th=0.55)
+        assert stream.carry_state != bidirectional
+        stream_chunk_prob = stream._chunk_prob
+        outputs = []
+
+        def recording_chunk_prob(window, num_frames):
+            prob = stream_chunk_prob(window, num_frames)
+            outputs[-1].append(prob)
+            return prob
+
+        monkeypatch.setattr(stream, "_chunk_prob", recording_chunk_prob)
+        results = []
+        for frame_sizes in [[len(signal)], [1, 999, 160, 4321]]:
+            outputs.append([])
+            results.append(_run_stream(stream, signal, frame_sizes))
+        assert results[0].shape[1] == 2
+        assert torch.equal(results[0], results[1])
+        assert torch.allclose(torch.cat(outputs[0]), torch.cat(outputs[1]))
+        assert torch.cat(outputs[0]).shape[0] == len(signal) // 160
+
+    # With the same probabilities, the segments are those of the offline
+    # thresholding, merging and removal of short segments
+    prob = (torch.arange(1200) / 37.0).sin().abs() ** 4
+    prob[1100:1190] = 0.9
+    prob[1190:] = 0.0
+
+    def chunk_prob(window, num_frames):
+        first = stream._frame
+        return prob[first : first + num_frames]
+
+    for close_th, len_th in [(0.0, 0.0), (0.25, 0.1), (0.5, 0.3)]:
+        stream = StreamingVAD(vad, close_th=close_th, len_th=len_th)
+        monkeypatch.setattr(stream, "_chunk_prob", chunk_prob)
+        segments = _run_stream(stream, signal, [3000, 17000])
+
+        prob_th = vad.apply_threshold(prob.reshape(1, -1, 1)).float()
+        expected = vad.get_boundaries(prob_th)
+        expected = vad.merge_close_segments(expected, close_th=close_th)
+        expected = vad.remove_short_segments(expected, len_th=len_th)
+        assert torch.equal(segments, expected)
+
+    # Segments are returned as soon as they are final
+    stream = StreamingVAD(vad, chunk_size=0.5, right_context=0.2)
+    monkeypatch.setattr(stream, "_chunk_prob", chunk_prob)
+    first_segment = None
+    for i in range(12):
+        segments = stream.process(signal[i * 16000 : (i + 1) * 16000])
+        if first_segment is None and len(segments) > 0:
+            first_segment = segments[0]
+            assert i * 16000 - first_segment[1] * 16000 < 16000 * 1.5
+        assert stream._buffer.shape[0] <= 16000 * (4.0 + 0.5 + 0.2 + 1)
+    assert first_segment is not None
+
+
+def test_vad_batch(tmpdir, monkeypatch):
+    import os
+    from speechbrain.dataio.dataio import write_audio
+
+    vad = _tiny_vad(bidirectional=True)
+    torch.manual_seed(2)
+    audio_files = []
+    for i, seconds in enumerate([3.1, 25, 41.3, 10]):
+        n = int(16000 * seconds)
+        envelope = (torch.arange(n) / 16000.0 * (0.3 + 0.1 * i)).sin().abs()
+        audio_files.append(str(tmpdir / f"file{i}.wav"))
+        write_audio(audio_files[-1], torch.randn(n) * 0.3 * envelope, 16000)
+
+    # The same results as processing the files one by one (which fetches
+    # the files into the working directory)
+    monkeypatch.chdir(tmpdir)
+    options = {"activation_th": 0.56, "deactivation_th": 0.5}
+    for overlap, n_jobs in [(False, 1), (True, 2)]:
+        options.update(overlap_small_chunk=overlap, apply_energy_VAD=overlap)
+        expected = {
+            audio_file: vad.get_speech_segments(audio_file, **options)
+            for audio_file in audio_files
+        }
+        save_dir = str(tmpdir / f"boundaries{n_jobs}")
+        boundaries = vad.get_speech_segments_batch(
+            audio_files,
+            batch_size=5,
+            n_jobs=n_jobs,
+            save_dir=save_dir,
+            **options,
+        )
+        assert list(boundaries) == audio_files
+        assert sum(len(b) for b in expected.values()) > 0
+        for audio_file in audio_files:
+            assert torch.equal(boundaries[audio_file], expected[audio_file])
+        assert sorted(os.listdir(save_dir)) == [
+            f"file{i}.txt" for i in range(4)
+        ]